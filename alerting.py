@@ -0,0 +1,235 @@
+from models import db
+from sqlalchemy import update
+from collections import namedtuple
+from datetime import datetime
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+RULE_KINDS = ('above', 'below', 'rate')
+
+class AlertRule(db.Model):
+    """Threshold rule on one reading type, for a site or one of its sections.
+
+    'above' / 'below' fire when the value crosses `threshold`, after
+    `duration_s` seconds of continuous breach when set (sustained rule).
+    'rate' fires when the value moves by `threshold` units per minute or
+    more between two consecutive readings.
+    """
+    __tablename__ = 'alert_rule'
+
+    id = db.Column(db.Integer, primary_key=True)
+    site_id = db.Column(db.Integer, db.ForeignKey('site.id'), nullable=False, index=True)
+    section_id = db.Column(db.Integer, db.ForeignKey('site_section.id'), nullable=True)  # None = toutes les sections
+    reading_type = db.Column(db.String(20), nullable=False)
+    kind = db.Column(db.String(10), nullable=False)
+    threshold = db.Column(db.Float, nullable=False)
+    duration_s = db.Column(db.Integer, nullable=False, default=0)
+    enabled = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+class Alert(db.Model):
+    """An alert raised by a rule on a section, open until `resolved_at` is set"""
+    __tablename__ = 'alert'
+
+    id = db.Column(db.Integer, primary_key=True)
+    rule_id = db.Column(db.Integer, db.ForeignKey('alert_rule.id'), nullable=False)
+    site_id = db.Column(db.Integer, db.ForeignKey('site.id'), nullable=False)
+    section_id = db.Column(db.Integer, db.ForeignKey('site_section.id'), nullable=False)
+    reading_type = db.Column(db.String(20), nullable=False)
+    value = db.Column(db.Float, nullable=False)
+    message = db.Column(db.String(200), nullable=False)
+    triggered_at = db.Column(db.DateTime, nullable=False)
+    resolved_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (db.Index('ix_alert_site_triggered', 'site_id', 'triggered_at'),)
+
+# Copie des colonnes utiles d'une règle : pas d'objet ORM gardé entre les requêtes
+Rule = namedtuple('Rule', 'id section_id kind threshold duration_s')
+
+# Index des champs de l'état d'une (règle, section)
+BREACH_SINCE, LAST_TS, LAST_VALUE, ALERT = range(4)
+
+def describe(rule, reading_type, value, rate=None):
+    if rule.kind == 'rate':
+        return f'{reading_type} varie de {rate:.2f}/min (seuil {rule.threshold}/min)'
+    sign = '>' if rule.kind == 'above' else '<'
+    sustained = f' depuis {rule.duration_s}s' if rule.duration_s else ''
+    return f'{reading_type} {value} {sign} {rule.threshold}{sustained}'
+
+class AlertEngine:
+    """Evaluate the alert rules on each committed reading.
+
+    Rules are loaded once (then every `ttl` seconds, or after invalidate())
+    and indexed by (site, reading type). Each (rule, section) keeps four
+    values: breach start, last timestamp, last value and open alert. A
+    reading is evaluated against that state only, history is never
+    re-read. The database is written only when an alert opens or resolves.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._rules = None  # (site_id, reading_type) -> [Rule]
+        self._loaded_at = 0
+        self._states = {}  # (rule_id, section_id) -> [breach_since, last_ts, last_value, alert]
+        self._lock = threading.Lock()
+        self.evaluated = 0
+        self.opened = 0
+        self.resolved = 0
+
+    def configure(self, ttl=None):
+        with self._lock:
+            self.ttl = ttl
+            self._rules = None
+            self._states.clear()
+
+    def invalidate(self):
+        """Reload the rules on the next reading (after a rule is created, changed or deleted)"""
+        with self._lock:
+            self._rules = None
+
+    def _load(self):
+        rules = {}
+        for rule in AlertRule.query.filter_by(enabled=True):
+            rules.setdefault((rule.site_id, rule.reading_type), []).append(
+                Rule(rule.id, rule.section_id, rule.kind, rule.threshold, rule.duration_s))
+        # Alertes ouvertes avant un redémarrage : ne pas les relancer
+        open_alerts = db.session.query(Alert.rule_id, Alert.section_id, Alert.id).filter(Alert.resolved_at.is_(None)).all()
+        db.session.commit()
+        with self._lock:
+            self._rules = rules
+            self._loaded_at = time.monotonic()
+            rule_ids = {rule.id for group in rules.values() for rule in group}
+            # États des règles supprimées ou désactivées abandonnés
+            for key in [key for key in self._states if key[0] not in rule_ids]:
+                del self._states[key]
+            for rule_id, section_id, alert_id in open_alerts:
+                state = self._states.setdefault((rule_id, section_id), [None, None, None, None])
+                if state[ALERT] is None:
+                    state[ALERT] = alert_id
+        return rules
+
+    def _current_rules(self):
+        rules = self._rules
+        if rules is None or (self.ttl is not None and time.monotonic() - self._loaded_at > self.ttl):
+            rules = self._load()
+        return rules
+
+    def evaluate(self, readings):
+        """Evaluate reading dicts (see ingestion.make_reading), in timestamp order, once committed"""
+        rules = self._current_rules()
+        if not rules:
+            return
+        opened, resolved = [], []
+        with self._lock:
+            for reading in readings:
+                group = rules.get((reading['site_id'], reading['reading_type']))
+                if not group:
+                    continue
+                self.evaluated += 1
+                for rule in group:
+                    if rule.section_id is None or rule.section_id == reading['section_id']:
+                        self._step(rule, reading, opened, resolved)
+        if opened or resolved:
+            self._persist(opened, resolved)
+
+    def _step(self, rule, reading, opened, resolved):
+        key = (rule.id, reading['section_id'])
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = [None, None, None, None]
+        timestamp, value = reading['timestamp'], reading['value']
+        previous_ts, previous_value = state[LAST_TS], state[LAST_VALUE]
+        if previous_ts is not None and timestamp < previous_ts:
+            return  # Lecture plus ancienne que l'état : ignorée
+        state[LAST_TS], state[LAST_VALUE] = timestamp, value
+
+        rate = None
+        if rule.kind == 'rate':
+            elapsed = (timestamp - previous_ts).total_seconds() if previous_ts is not None else 0
+            if elapsed <= 0:
+                return
+            rate = abs(value - previous_value) * 60 / elapsed
+            breached = rate >= rule.threshold
+            firing = breached
+        else:
+            breached = value > rule.threshold if rule.kind == 'above' else value < rule.threshold
+            if not breached:
+                state[BREACH_SINCE] = None
+            elif state[BREACH_SINCE] is None:
+                state[BREACH_SINCE] = timestamp
+            firing = breached and (timestamp - state[BREACH_SINCE]).total_seconds() >= rule.duration_s
+
+        if firing and state[ALERT] is None:
+            alert = Alert(rule_id=rule.id, site_id=reading['site_id'], section_id=reading['section_id'],
+                          reading_type=reading['reading_type'], value=value, triggered_at=timestamp,
+                          message=describe(rule, reading['reading_type'], value, rate))
+            state[ALERT] = alert
+            opened.append((key, alert))
+        elif not breached and state[ALERT] is not None:
+            alert = state[ALERT]
+            state[ALERT] = None
+            if isinstance(alert, Alert):
+                alert.resolved_at = timestamp  # Ouverte et résolue dans le même lot
+            else:
+                resolved.append((alert, timestamp))
+
+    def _persist(self, opened, resolved):
+        try:
+            db.session.add_all(alert for _, alert in opened)
+            db.session.flush()
+            for alert_id, resolved_at in resolved:
+                db.session.execute(update(Alert).where(Alert.id == alert_id).values(resolved_at=resolved_at))
+            ids = [(key, alert, alert.id) for key, alert in opened]
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            # États remis à zéro : l'alerte sera relevée à la prochaine lecture hors seuil
+            with self._lock:
+                for key, alert in opened:
+                    state = self._states.get(key)
+                    if state is not None and state[ALERT] is alert:
+                        state[ALERT] = None
+            logger.exception(f"Alert persistence error: {e}")
+            return
+        with self._lock:
+            for key, alert, alert_id in ids:
+                state = self._states.get(key)
+                if state is not None and state[ALERT] is alert:
+                    state[ALERT] = alert_id
+            self.opened += len(opened)
+            self.resolved += len(resolved)
+
+    def stats(self):
+        with self._lock:
+            return {'rules': sum(len(group) for group in (self._rules or {}).values()),
+                    'states': len(self._states), 'evaluated': self.evaluated,
+                    'opened': self.opened, 'resolved': self.resolved}
+
+alert_engine = AlertEngine()
+
+def serialize_rule(rule, section_name=None):
+    return {
+        'id': rule.id,
+        'site_id': rule.site_id,
+        'section_name': section_name,
+        'reading_type': rule.reading_type,
+        'kind': rule.kind,
+        'threshold': rule.threshold,
+        'duration_s': rule.duration_s,
+        'enabled': rule.enabled
+    }
+
+def serialize_alert(alert, section_name=None):
+    return {
+        'id': alert.id,
+        'rule_id': alert.rule_id,
+        'section_name': section_name,
+        'reading_type': alert.reading_type,
+        'value': alert.value,
+        'message': alert.message,
+        'triggered_at': alert.triggered_at.isoformat(),
+        'resolved_at': alert.resolved_at.isoformat() if alert.resolved_at else None
+    }
\ No newline at end of file
@@ -0,0 +1,101 @@
+from models import db
+from partitions import readings_union
+from sqlalchemy import select, func
+from datetime import datetime, timedelta
+import itertools
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1)
+
+DEFAULT_WINDOW = 60
+DEFAULT_THRESHOLD = 3.0
+
+def load_series(section_id, reading_type, start, end):
+    """(epoch seconds, values) float64 arrays of one series in [start, end), in time order.
+
+    One statement, rows fetched as plain tuples: no ORM object per reading.
+    """
+    readings = readings_union(
+        ['value', 'timestamp'],
+        lambda t: (t.c.section_id == section_id, t.c.reading_type == reading_type,
+                   t.c.timestamp >= start, t.c.timestamp < end),
+        start=start, end=end)
+    # Secondes depuis 1970 calculées par SQLite : pas de conversion en datetime ligne à ligne
+    epoch = (func.julianday(readings.c.timestamp) - 2440587.5) * 86400.0
+    result = db.session.execute(
+        select(epoch, readings.c.value).select_from(readings).order_by(readings.c.timestamp))
+    # fromiter sur les valeurs à plat : np.array() sur une liste de tuples est ~100x plus lent
+    data = np.fromiter(itertools.chain.from_iterable(result), dtype=np.float64).reshape(-1, 2)
+    # julianday() est précis à la milliseconde
+    return np.round(data[:, 0], 3), data[:, 1]
+
+def rolling_mean_std(values, window):
+    """Mean and standard deviation of each full window of `window` points (len(values) - window + 1 each)"""
+    # Centrées sur la moyenne globale : les sommes cumulées des carrés restent précises
+    centered = values - values.mean()
+    sums = np.concatenate(([0.0], np.cumsum(centered)))
+    squares = np.concatenate(([0.0], np.cumsum(centered * centered)))
+    window_sums = sums[window:] - sums[:-window]
+    window_squares = squares[window:] - squares[:-window]
+    means = window_sums / window
+    variances = np.maximum(window_squares / window - means * means, 0.0)
+    return means + values.mean(), np.sqrt(variances)
+
+def anomaly_scores(values, window):
+    """z-score of each point against the `window` points before it (0 for the first `window` points)"""
+    scores = np.zeros(len(values))
+    if len(values) <= window:
+        return scores
+    means, stds = rolling_mean_std(values[:-1], window)
+    deviations = values[window:] - means
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores[window:] = np.where(stds > 0, deviations / stds, 0.0)
+    return scores
+
+def trend_per_day(epochs, values):
+    """Least-squares slope of the values, in units per day"""
+    if len(values) < 2:
+        return None
+    days = (epochs - epochs[0]) / 86400
+    spread = days - days.mean()
+    denominator = np.dot(spread, spread)
+    if denominator == 0:
+        return None
+    return float(np.dot(spread, values - values.mean()) / denominator)
+
+def section_stats(epochs, values, window=DEFAULT_WINDOW, threshold=DEFAULT_THRESHOLD, limit=100):
+    """Summary, rolling statistics, trend and anomalies of one series"""
+    count = len(values)
+    if count == 0:
+        return {'count': 0, 'window': window, 'mean': None, 'std': None, 'min': None, 'max': None,
+                'last': None, 'trend_per_day': None, 'rolling': None, 'anomaly_count': 0, 'anomalies': []}
+
+    rolling = None
+    if count >= window:
+        means, stds = rolling_mean_std(values, window)
+        rolling = {'mean': round(float(means[-1]), 4), 'std': round(float(stds[-1]), 4),
+                   'min_mean': round(float(means.min()), 4), 'max_mean': round(float(means.max()), 4)}
+
+    scores = anomaly_scores(values, window)
+    flagged = np.flatnonzero(np.abs(scores) >= threshold)
+    # Les plus fortes d'abord
+    top = flagged[np.argsort(-np.abs(scores[flagged]), kind='stable')[:limit]]
+    trend = trend_per_day(epochs, values)
+
+    return {
+        'count': count,
+        'window': window,
+        'mean': round(float(values.mean()), 4),
+        'std': round(float(values.std()), 4),
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'last': float(values[-1]),
+        'trend_per_day': None if trend is None else round(trend, 6),
+        'rolling': rolling,
+        'anomaly_count': int(len(flagged)),
+        'anomalies': [{
+            'timestamp': (EPOCH + timedelta(milliseconds=round(epochs[i] * 1000))).isoformat(),
+            'value': float(values[i]),
+            'score': round(float(scores[i]), 2)
+        } for i in top]
+    }
\ No newline at end of file
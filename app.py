@@ -1,68 +1,152 @@
 from flask import Flask
 from flask_cors import CORS
+from sqlalchemy import inspect
 from config import Config
-from models import db
+from database import configure_database
+from latest_cache import latest_cache
+from ingest_buffer import ingest_buffer
+from ingest_writer import ingest_writer, ingest_writer_command, writer_authkey
+from live_stream import live_hub
+from auth_tokens import site_ownership
+from passwords import password_hasher
+from alerting import alert_engine
+from http_cache import response_cache
+from device_commands import command_waiters
+from instrumentation import instrument_app, configure_logging, metrics
+from rollups import rebuild_rollups_command
+from retention import apply_retention_command, retention_worker
+from init_db import init_database, init_db_command
+from models import db, SiteSection
 from routes.site_routes import site_bp
 from routes.auth_routes import auth_bp
+import atexit
+import logging
 import os
-import socket
+import time
 
-def get_local_ip():
-    """Get the local IP address"""
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        ip = s.getsockname()[0]
-        s.close()
-        return ip
-    except:
-        return "0.0.0.0"
+logger = logging.getLogger(__name__)
 
-def init_database(app, force=False):
-    """Initialize database and demo data"""
+# Part des threads de chaque worker que peuvent garder les flux /api/live et les long-polls
+# des contrôleurs (cf. held_threads_limit)
+LIVE_THREADS_SHARE = 0.25
+DEVICE_THREADS_SHARE = 0.5
+
+def init_database_on_startup(app):
+    """Former behaviour (DB_INIT_ON_STARTUP=true): schema, migrations and demo data in every worker"""
     with app.app_context():
         try:
-            if force or os.environ.get('RESET_DB') == 'true':
-                db.drop_all()
-                print("Database reset completed")
-            
-            db.create_all()
-            from init_db import init_demo_data
-            init_demo_data()
+            init_database(reset=os.environ.get('RESET_DB') == 'true', demo=app.config['DEMO_DATA'])
         except Exception as e:
-            print(f"Database initialization error: {e}")
+            logger.exception(f"Database initialization error: {e}")
+
+def held_threads_limit(app, key, share):
+    """`key` from the config, else `share` of SERVER_THREADS (stored back in the config).
+
+    Long-polls and /live streams each keep a request thread of the worker
+    until they end: their number must stay below the size of its pool.
+    """
+    if app.config[key] is None:
+        app.config[key] = max(1, int(app.config['SERVER_THREADS'] * share))
+    return app.config[key]
+
+def warm_latest_cache(app):
+    """Load the current state of each section into the latest readings cache"""
+    with app.app_context():
+        # Base neuve : rien à charger avant `flask init-db`, pas une erreur
+        if not inspect(db.engine).has_table(SiteSection.__tablename__):
+            logger.warning("Latest readings cache not warmed: no schema yet (flask --app app init-db)")
+            return
+        try:
+            count = latest_cache.warm()
+            logger.info(f"Latest readings cache warmed with {count} sections")
+        except Exception as e:
+            logger.exception(f"Latest readings cache warm-up error: {e}")
+
+def start_ingest_buffer(app):
+    """Start the write-behind worker, flushed again at interpreter exit"""
+    ingest_buffer.start(
+        app,
+        max_rows=app.config['INGEST_BUFFER_MAX_ROWS'],
+        flush_rows=app.config['INGEST_FLUSH_ROWS'],
+        flush_interval_ms=app.config['INGEST_FLUSH_INTERVAL_MS']
+    )
+    atexit.register(ingest_buffer.stop)
+
+def create_app(config=None):
+    """Build the app without writing to the database.
 
-def create_app():
+    The schema, migrations and demo data come from `flask init-db` (run by
+    serve.py before the workers start); set DB_INIT_ON_STARTUP=true for the
+    former per-worker initialization.
+    """
+    started = time.perf_counter()
     app = Flask(__name__)
     app.config.from_object(Config)
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///smartaqua.db'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if config:
+        app.config.update(config)
     
     CORS(app)
-    db.init_app(app)
+    configure_logging(app.config['LOG_LEVEL'])
+    configure_database(app)
+    instrument_app(app)
     
     app.register_blueprint(site_bp, url_prefix='/api')
     app.register_blueprint(auth_bp, url_prefix='/api')
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(apply_retention_command)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(ingest_writer_command)
+    latest_cache.configure(
+        max_sections=app.config['LATEST_CACHE_MAX_SECTIONS'],
+        ttl=app.config['LATEST_CACHE_TTL']
+    )
+    live_hub.configure(
+        max_subscribers=held_threads_limit(app, 'LIVE_MAX_SUBSCRIBERS', LIVE_THREADS_SHARE),
+        max_pending=app.config['LIVE_SUBSCRIBER_BUFFER']
+    )
+    site_ownership.configure(ttl=app.config['OWNERSHIP_CACHE_TTL'])
+    alert_engine.configure(ttl=app.config['ALERT_RULES_TTL'])
+    response_cache.configure(
+        max_entries=app.config['RESPONSE_CACHE_MAX_ENTRIES'],
+        ttl=app.config['RESPONSE_CACHE_TTL']
+    )
+    ingest_writer.configure(
+        address=app.config['INGEST_WRITER_SOCKET'] if app.config['INGEST_WRITER_ENABLED'] else None,
+        authkey=writer_authkey(app.config),
+        timeout=app.config['INGEST_WRITER_TIMEOUT_S']
+    )
+    command_waiters.configure(
+        max_waiters=held_threads_limit(app, 'DEVICE_MAX_WAITERS', DEVICE_THREADS_SHARE),
+        recheck_s=app.config['DEVICE_COMMAND_RECHECK_S']
+    )
+    password_hasher.configure(
+        n=app.config['PASSWORD_SCRYPT_N'],
+        r=app.config['PASSWORD_SCRYPT_R'],
+        p=app.config['PASSWORD_SCRYPT_P'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        max_pending=app.config['PASSWORD_HASH_MAX_PENDING']
+    )
+    for name, component in (('latest_cache', latest_cache), ('ingest_buffer', ingest_buffer),
+                             ('ingest_writer', ingest_writer),
+                             ('live', live_hub), ('ownership_cache', site_ownership),
+                             ('password_hasher', password_hasher), ('alerts', alert_engine),
+                             ('response_cache', response_cache), ('device_commands', command_waiters)):
+        metrics.register_collector(name, component.stats)
     
-    # Initialize database only on first run
-    if not hasattr(app, '_db_initialized'):
-        init_database(app)
-        app.config['LOCAL_IP'] = get_local_ip()
-        app._db_initialized = True
+    if app.config['DB_INIT_ON_STARTUP']:
+        init_database_on_startup(app)
+    if app.config['LATEST_CACHE_WARM']:
+        warm_latest_cache(app)
+    if app.config['INGEST_BUFFER_ENABLED']:
+        start_ingest_buffer(app)
+    if app.config['RETENTION_INTERVAL_HOURS']:
+        retention_worker.start(app, app.config['RETENTION_INTERVAL_HOURS'])
     
+    metrics.startup_seconds = time.perf_counter() - started
+    logger.info(f"App created in {metrics.startup_seconds * 1000:.0f} ms")
     return app
 
 if __name__ == '__main__':
-    app = create_app()
-    if app:
-        print(f"\nServer running at:")
-        print(f"- Local:   http://127.0.0.1:5000")
-        print(f"- Network: http://{app.config['LOCAL_IP']}:5000\n")
-        app.run(
-            debug=True, 
-            host='0.0.0.0', 
-            port=int(os.environ.get('PORT', 5000)),
-            use_reloader=False
-        )
-    else:
-        print("L'application n'a pas pu être démarrée")
\ No newline at end of file
+    # Point d'entrée : serve.py (serveur de développement par défaut, gunicorn ou uvicorn en production)
+    from serve import main
+    main()
\ No newline at end of file
@@ -1,5 +1,7 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from models import db, User
+from auth_tokens import issue_token
+from passwords import password_hasher, HasherBusy
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -9,6 +11,12 @@ def register():
     email = data.get('email')
     password = data.get('password')
     
+    # Types vérifiés avant toute requête : le hachage n'accepte que du texte
+    if not isinstance(email, str) or not email:
+        return jsonify({'error': 'Email requis'}), 400
+    if not isinstance(password, str) or not password:
+        return jsonify({'error': 'Mot de passe requis'}), 400
+    
     try:
         # Vérifier si l'utilisateur existe déjà
         existing_user = User.query.filter_by(email=email).first()
@@ -18,13 +26,15 @@ def register():
         # Créer l'utilisateur dans notre base de données
         new_user = User(
             email=email,
-            password_hash=password,  # Dans un vrai système, utilisez un hash
+            password_hash=password_hasher.hash(password),
             name=data.get('name', 'Utilisateur')
         )
         db.session.add(new_user)
         db.session.commit()
         
         return jsonify({'message': 'Utilisateur créé avec succès', 'id': new_user.id}), 201
+    except HasherBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
@@ -34,13 +44,32 @@ def login():
     data = request.json
     if not data or 'email' not in data or 'password' not in data:
         return jsonify({'error': 'Email et mot de passe requis'}), 400
+    if not isinstance(data['email'], str) or not isinstance(data['password'], str):
+        return jsonify({'error': 'Email ou mot de passe invalide'}), 400
 
     user = User.query.filter_by(email=data['email']).first()
-    if user and user.password_hash == data['password']:  # Use proper password hashing in production
+    try:
+        if user is None:
+            # Même coût qu'un email connu : pas de détection des comptes au temps de réponse
+            password_hasher.hash(data['password'])
+            valid = False
+        else:
+            valid = password_hasher.verify(user.password_hash, data['password'])
+        # Paramètres changés ou ancien mot de passe en clair : nouveau hash
+        if valid and password_hasher.needs_rehash(user.password_hash):
+            user.password_hash = password_hasher.hash(data['password'])
+            db.session.commit()
+    except HasherBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    
+    if valid:
         return jsonify({
             'id': user.id,
             'email': user.email,
-            'name': user.name
+            'name': user.name,
+            'token': issue_token(user.id),
+            'token_type': 'Bearer',
+            'expires_in': current_app.config['TOKEN_MAX_AGE']
         }), 200
     
     return jsonify({'error': 'Email ou mot de passe incorrect'}), 401
\ No newline at end of file
@@ -0,0 +1,113 @@
+from collections import OrderedDict
+from flask import current_app, request, jsonify, g
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from models import Site
+from functools import wraps
+import threading
+import time
+
+TOKEN_SALT = 'access-token'
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=TOKEN_SALT)
+
+def issue_token(user_id):
+    """Signed access token carrying the user id (no server-side state)"""
+    return _serializer().dumps({'uid': user_id})
+
+def verify_token(token):
+    """Return the user id of a valid token, None if it is invalid or expired"""
+    try:
+        data = _serializer().loads(token, max_age=current_app.config['TOKEN_MAX_AGE'])
+    except (BadSignature, SignatureExpired):
+        return None
+    return data.get('uid') if isinstance(data, dict) else None
+
+def authenticate_request():
+    """Set g.user_id from the Authorization: Bearer header.
+
+    Without a header g.user_id is None (clients still passing an email),
+    unless AUTH_REQUIRED is set. Returns an error response or None.
+    """
+    g.user_id = None
+    header = request.headers.get('Authorization', '')
+    if not header:
+        if current_app.config['AUTH_REQUIRED'] and request.method != 'OPTIONS':
+            return jsonify({'error': 'Authentification requise'}), 401
+        return None
+    scheme, _, token = header.partition(' ')
+    user_id = verify_token(token.strip()) if scheme.lower() == 'bearer' else None
+    if user_id is None:
+        return jsonify({'error': 'Jeton invalide ou expiré'}), 401
+    g.user_id = user_id
+    return None
+
+class SiteOwnershipCache:
+    """user id -> ids of the sites they own, for authorization checks.
+
+    LRU over users. Site creation must call add_site(); with several worker
+    processes, set `ttl` so sites created elsewhere get re-read.
+    """
+
+    def __init__(self, max_users=10000, ttl=None):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._users = OrderedDict()  # user_id -> (loaded_at, frozenset of site ids)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_users=None, ttl=None):
+        with self._lock:
+            if max_users is not None:
+                self.max_users = max_users
+            self.ttl = ttl
+            self._users.clear()
+
+    def site_ids(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[0] <= self.ttl):
+                self._users.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        site_ids = frozenset(row[0] for row in Site.query.with_entities(Site.id).filter_by(user_id=user_id))
+        with self._lock:
+            self._users[user_id] = (time.monotonic(), site_ids)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return site_ids
+
+    def owns(self, user_id, site_id):
+        return site_id in self.site_ids(user_id)
+
+    def add_site(self, user_id, site_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                self._users[user_id] = (entry[0], entry[1] | {site_id})
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {'users': len(self._users), 'hits': self.hits, 'misses': self.misses}
+
+site_ownership = SiteOwnershipCache()
+
+def site_owner_required(view):
+    """For routes with a site_id: 404 when the token's user does not own the site"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        user_id = g.get('user_id')
+        if user_id is not None and not site_ownership.owns(user_id, kwargs['site_id']):
+            return jsonify({'error': 'Site non trouvé'}), 404
+        return view(*args, **kwargs)
+    return wrapper
\ No newline at end of file
@@ -0,0 +1,412 @@
+"""Suite de benchmarks reproductible, hors-ligne sur une seule machine.
+
+Jeu synthétique chargé par seed_data.generate_data, chaque route de l'API mesurée en
+processus avec le client de test Flask, scénarios concurrents lecture/ingestion, résultats
+JSON comparés à des seuils de régression (latence p99, requêtes SQL par appel, débits).
+
+Usage : python bench_suite.py [--scale small|medium|large] [--repeat N] [--seconds S]
+                              [--output results.json] [--thresholds bench_thresholds.json]
+                              [--write-thresholds]
+
+Code de sortie 1 quand un seuil est dépassé ou qu'une route n'a pas de scénario.
+"""
+from app import create_app
+from models import db
+from seed_data import reset_database, generate_data, PASSWORD, BASE_VALUES, VARIATION
+from latest_cache import latest_cache
+from auth_tokens import site_ownership
+from alerting import alert_engine
+from http_cache import response_cache
+from sensor_queries import READING_TYPES
+from sqlalchemy import event, text
+from collections import namedtuple
+from datetime import datetime, timedelta
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Tailles du jeu synthétique (voir seed_data.generate_data)
+SCALES = {
+    'small': dict(users=2, sites_per_user=3, sections_per_site=4, days=7, interval_s=300),      # ~145k lectures
+    'medium': dict(users=5, sites_per_user=4, sections_per_site=5, days=30, interval_s=300),    # ~2,6M lectures
+    'large': dict(users=20, sites_per_user=5, sections_per_site=10, days=90, interval_s=900),   # ~26M lectures
+}
+THRESHOLDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_thresholds.json')
+# Marge des seuils écrits par --write-thresholds : latences x3, débits / 3
+HEADROOM = 3
+
+# `request(ctx, i)` renvoie (url, options du client de test) pour l'appel i, hors chronométrage.
+# `stream` : seul le premier morceau du corps est lu (flux SSE sans fin).
+Scenario = namedtuple('Scenario', 'name method rule request repeat stream')
+
+def scenario(name, method, rule, request, repeat=None, stream=False):
+    return Scenario(name, method, rule, request, repeat, stream)
+
+def _readings(ctx, i, count):
+    """`count` readings of the first user's sites, timestamped after the dataset"""
+    clock = ctx['end'] + timedelta(seconds=i * count + 1)
+    readings = []
+    for k in range(count):
+        reading_type = READING_TYPES[k % 3]
+        value = BASE_VALUES[reading_type] + (random.random() - 0.5) * VARIATION[reading_type]
+        readings.append({'site_id': ctx['site_id'], 'section_name': ctx['sections'][k % len(ctx['sections'])],
+                         'reading_type': reading_type, 'value': round(value, 2),
+                         'timestamp': (clock + timedelta(seconds=k)).isoformat()})
+    return readings
+
+def _uncached_site(ctx, i):
+    response_cache.invalidate()
+    return f"/api/sites/{ctx['site_id']}", {}
+
+def _new_rule(ctx, i):
+    # Règle créée hors mesure, supprimée par l'appel mesuré
+    response = ctx['client'].post(f"/api/sites/{ctx['site_id']}/alert-rules", headers=ctx['auth'],
+                                  json={'reading_type': 'ph', 'kind': 'below', 'threshold': 0})
+    return f"/api/sites/{ctx['site_id']}/alert-rules/{response.get_json()['id']}", {}
+
+SCENARIOS = [
+    scenario('sites', 'GET', '/api/sites', lambda ctx, i: ('/api/sites', {})),
+    scenario('sites page', 'GET', '/api/sites', lambda ctx, i: ('/api/sites?limit=20&fields=id,name,status', {})),
+    scenario('sections page', 'GET', '/api/sections', lambda ctx, i: ('/api/sections?limit=100', {})),
+    scenario('active sections of a site', 'GET', '/api/sections', lambda ctx, i: (
+        f"/api/sections?site_id={ctx['site_id']}&is_active=true&fields=id,section_name,values", {})),
+    scenario('create site', 'POST', '/api/sites', lambda ctx, i: (
+        '/api/sites', {'json': {'name': f'Bench {i}', 'status': 'En fonctionnement'}}), repeat=50),
+    scenario('site detail', 'GET', '/api/sites/<int:site_id>', lambda ctx, i: (f"/api/sites/{ctx['site_id']}", {})),
+    scenario('site detail uncached', 'GET', '/api/sites/<int:site_id>', _uncached_site),
+    scenario('section daily averages', 'GET', '/api/sites/<int:site_id>/sections/<section_name>/readings',
+             lambda ctx, i: (f"{ctx['section_url']}/readings?type=temperature", {})),
+    scenario('section series', 'GET', '/api/sites/<int:site_id>/sections/<section_name>/readings',
+             lambda ctx, i: (f"{ctx['section_url']}/readings?type=ph&from={ctx['week_ago']}&resolution=auto", {})),
+    scenario('section stats', 'GET', '/api/sites/<int:site_id>/sections/<section_name>/stats',
+             lambda ctx, i: (f"{ctx['section_url']}/stats?type=temperature", {}), repeat=50),
+    scenario('alert rules', 'GET', '/api/sites/<int:site_id>/alert-rules',
+             lambda ctx, i: (f"/api/sites/{ctx['site_id']}/alert-rules", {})),
+    scenario('create alert rule', 'POST', '/api/sites/<int:site_id>/alert-rules', lambda ctx, i: (
+        f"/api/sites/{ctx['site_id']}/alert-rules",
+        {'json': {'reading_type': 'oxygen', 'kind': 'below', 'threshold': 0}}), repeat=50),
+    scenario('delete alert rule', 'DELETE', '/api/sites/<int:site_id>/alert-rules/<int:rule_id>', _new_rule, repeat=50),
+    scenario('alerts', 'GET', '/api/sites/<int:site_id>/alerts',
+             lambda ctx, i: (f"/api/sites/{ctx['site_id']}/alerts", {})),
+    scenario('alert stats', 'GET', '/api/alerts/stats', lambda ctx, i: ('/api/alerts/stats', {})),
+    scenario('threshold scan', 'GET', '/api/sections/threshold',
+             lambda ctx, i: ('/api/sections/threshold?type=oxygen&below=6', {})),
+    scenario('export one day', 'GET', '/api/sites/<int:site_id>/export', lambda ctx, i: (
+        f"/api/sites/{ctx['site_id']}/export?format=csv&from={ctx['day_ago']}", {}), repeat=20),
+    scenario('toggle', 'POST', '/api/sites/<int:site_id>/sections/<section_name>/toggle',
+             lambda ctx, i: (f"{ctx['section_url']}/toggle", {'json': {'action': 'toggle'}})),
+    scenario('device commands', 'GET', '/api/sites/<int:site_id>/commands',
+             lambda ctx, i: (f"/api/sites/{ctx['site_id']}/commands?wait=0", {})),
+    scenario('device ack', 'POST', '/api/sites/<int:site_id>/commands/ack',
+             lambda ctx, i: (f"/api/sites/{ctx['site_id']}/commands/ack", {'json': {'ids': [i + 1]}})),
+    scenario('command stats', 'GET', '/api/commands/stats', lambda ctx, i: ('/api/commands/stats', {})),
+    scenario('section reading', 'POST', '/api/sites/<int:site_id>/sections/<section_name>/readings',
+             lambda ctx, i: (f"{ctx['section_url']}/readings", {'json': {'reading_type': 'ph', 'value': 7.1}})),
+    scenario('reading', 'POST', '/api/readings', lambda ctx, i: ('/api/readings', {'json': {
+        'site_id': ctx['site_id'], 'section_name': ctx['section'], 'reading_type': 'oxygen', 'value': 6.4}})),
+    scenario('batch of 500', 'POST', '/api/readings/batch',
+             lambda ctx, i: ('/api/readings/batch', {'json': _readings(ctx, i, 500)}), repeat=50),
+    scenario('history of 1000', 'POST', '/api/history', lambda ctx, i: ('/api/history', {'json': {
+        'site_id': ctx['site_id'], 'section_name': ctx['section'], 'reading_type': 'temperature',
+        'values': [{'timestamp': (ctx['start'] - timedelta(minutes=i * 1000 + k + 1)).isoformat(), 'value': 24.0}
+                   for k in range(1000)]}}), repeat=20),
+    scenario('latest readings', 'GET', '/api/readings/latest', lambda ctx, i: (
+        f"/api/readings/latest?site_id={ctx['site_id']}&section_name={ctx['section']}", {})),
+    scenario('ingest buffer stats', 'GET', '/api/readings/buffer', lambda ctx, i: ('/api/readings/buffer', {})),
+    scenario('ingest writer stats', 'GET', '/api/readings/writer', lambda ctx, i: ('/api/readings/writer', {})),
+    scenario('latest cache stats', 'GET', '/api/readings/latest/cache',
+             lambda ctx, i: ('/api/readings/latest/cache', {})),
+    scenario('live first event', 'GET', '/api/live', lambda ctx, i: (
+        f"/api/live?site_id={ctx['site_id']}&section_name={ctx['section']}", {}), stream=True),
+    scenario('response cache stats', 'GET', '/api/sites/cache', lambda ctx, i: ('/api/sites/cache', {})),
+    scenario('live stats', 'GET', '/api/live/stats', lambda ctx, i: ('/api/live/stats', {})),
+    scenario('sensor data', 'GET', '/api/sensor-data', lambda ctx, i: ('/api/sensor-data', {})),
+    scenario('register', 'POST', '/api/register', lambda ctx, i: ('/api/register', {'json': {
+        'email': f'bench{i}-{ctx["run"]}@example.com', 'password': 'bench-password'}}), repeat=10),
+    scenario('login', 'POST', '/api/login', lambda ctx, i: ('/api/login', {'json': {
+        'email': 'test@example.com', 'password': PASSWORD}}), repeat=10),
+    scenario('metrics', 'GET', '/metrics', lambda ctx, i: ('/metrics', {})),
+]
+
+def uncovered_routes(app):
+    """'METHOD rule' of the app's routes that no scenario measures"""
+    routes = {f'{method} {rule.rule}' for rule in app.url_map.iter_rules() if rule.endpoint != 'static'
+              for method in rule.methods - {'HEAD', 'OPTIONS'}}
+    return sorted(routes - {f'{s.method} {s.rule}' for s in SCENARIOS})
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, max(0, math.ceil(len(samples) * fraction) - 1))]
+
+def build_app(db_path, scale):
+    """App on a fresh SQLite file loaded with the synthetic dataset of `scale`"""
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}'})
+    with app.app_context():
+        reset_database()
+        dataset = generate_data(**SCALES[scale])
+        # Caches globaux remplis par create_app avant le rechargement
+        for cache in (latest_cache, site_ownership, response_cache):
+            cache.invalidate()
+        alert_engine.invalidate()
+        latest_cache.warm()
+    return app, dataset
+
+def make_context(app):
+    client = app.test_client()
+    token = client.post('/api/login', json={'email': 'test@example.com', 'password': PASSWORD}).get_json()['token']
+    with app.app_context():
+        site_id, section = db.session.execute(text(
+            'SELECT site.id, site_section.section_name FROM site JOIN site_section ON site_section.site_id = site.id '
+            'ORDER BY site.id, site_section.id LIMIT 1')).one()
+        sections = db.session.execute(text('SELECT section_name FROM site_section WHERE site_id = :id ORDER BY id'),
+                                      {'id': site_id}).scalars().all()
+        start, end = db.session.execute(text('SELECT min(timestamp), max(timestamp) FROM sensor_reading')).one()
+    end = datetime.fromisoformat(end) if end else datetime.now()
+    return {
+        'client': client,
+        'auth': {'Authorization': f'Bearer {token}'},
+        'site_id': site_id,
+        'section': section,
+        'sections': sections,
+        'section_url': f'/api/sites/{site_id}/sections/{section}',
+        'start': datetime.fromisoformat(start) if start else end,
+        'end': end,
+        'day_ago': (end - timedelta(days=1)).isoformat(),
+        'week_ago': (end - timedelta(days=7)).isoformat(),
+        'run': int(time.time()),
+    }
+
+class StatementCounter:
+    """SQL statements executed on the engine while `active`"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+def run_scenario(app, ctx, item, repeat):
+    """Latency percentiles (ms), SQL statements per call and unexpected statuses of one scenario"""
+    client, samples, statements, errors = ctx['client'], [], 0, 0
+    count = item.repeat or repeat
+    with app.app_context():
+        engine = db.engine
+    with StatementCounter(engine) as counter:
+        for i in range(count):
+            url, options = item.request(ctx, i)
+            headers = dict(ctx['auth'], **options.pop('headers', {}))
+            before = counter.count
+            t0 = time.perf_counter()
+            response = client.open(url, method=item.method, headers=headers, buffered=False, **options)
+            if item.stream:
+                next(iter(response.response))
+            else:
+                response.get_data()
+            samples.append((time.perf_counter() - t0) * 1000)
+            response.close()
+            statements += counter.count - before
+            if response.status_code >= 400:
+                errors += 1
+    samples.sort()
+    return {
+        'method': item.method,
+        'rule': item.rule,
+        'calls': count,
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(percentile(samples, 0.95), 3),
+        'p99_ms': round(percentile(samples, 0.99), 3),
+        'max_ms': round(samples[-1], 3),
+        'queries': round(statements / count, 2),
+        'errors': errors,
+    }
+
+def run_concurrent(app, ctx, readers, writers, seconds, batch=100):
+    """Readers on the dashboard routes while writers post batches; throughput and read latency"""
+    read_urls = [f"/api/sites/{ctx['site_id']}", f"{ctx['section_url']}/readings?type=temperature",
+                 f"/api/readings/latest?site_id={ctx['site_id']}&section_name={ctx['section']}"]
+    stop = threading.Event()
+    lock = threading.Lock()
+    reads, writes, errors = [], [], [0]
+    # Lots horodatés après tout ce que les scénarios unitaires ont écrit
+    counter = itertools.count(10_000)
+
+    def reader():
+        client, samples, urls = app.test_client(), [], itertools.cycle(read_urls)
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            response = client.get(next(urls), headers=ctx['auth'])
+            samples.append((time.perf_counter() - t0) * 1000)
+            if response.status_code != 200:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            reads.extend(samples)
+
+    def writer():
+        client, samples = app.test_client(), []
+        while not stop.is_set():
+            body = _readings(ctx, next(counter), batch)
+            t0 = time.perf_counter()
+            response = client.post('/api/readings/batch', json=body, headers=ctx['auth'])
+            samples.append((time.perf_counter() - t0) * 1000)
+            if response.status_code != 200 or response.get_json()['rejected']:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            writes.extend(samples)
+
+    threads = ([threading.Thread(target=reader) for _ in range(readers)] +
+               [threading.Thread(target=writer) for _ in range(writers)])
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    reads.sort()
+    writes.sort()
+    return {
+        'readers': readers,
+        'writers': writers,
+        'reads_per_s': round(len(reads) / seconds, 1),
+        'read_p50_ms': round(statistics.median(reads), 3) if reads else None,
+        'read_p99_ms': round(percentile(reads, 0.99), 3) if reads else None,
+        'rows_per_s': round(len(writes) * batch / seconds, 1),
+        'write_p99_ms': round(percentile(writes, 0.99), 3) if writes else None,
+        'errors': errors[0],
+    }
+
+def check_thresholds(results, thresholds):
+    """Messages for every measure beyond its threshold.
+
+    Thresholds are {'max_<measure>': limit} or {'min_<measure>': limit}
+    per route scenario, concurrent scenario and for the dataset load.
+    """
+    failures = []
+    measured = {'routes': results['routes'], 'concurrency': results['concurrency'],
+                'dataset': {'load': results['dataset']}}
+    for section, measures in measured.items():
+        for name, limits in thresholds.get(section, {}).items():
+            values = measures.get(name)
+            if values is None:
+                failures.append(f'{section}/{name}: not measured')
+                continue
+            for key, limit in limits.items():
+                bound, measure = key.split('_', 1)
+                value = values.get(measure)
+                if value is None or (value > limit if bound == 'max' else value < limit):
+                    failures.append(f'{section}/{name}: {measure} = {value}, {bound} {limit}')
+    for name, values in results['routes'].items():
+        if values['errors']:
+            failures.append(f"routes/{name}: {values['errors']} error responses")
+    for route in results['uncovered_routes']:
+        failures.append(f'{route}: no scenario')
+    return failures
+
+def derive_thresholds(results):
+    """Thresholds with HEADROOM over this run; SQL statement counts are kept exact"""
+    return {
+        'routes': {name: {'max_p99_ms': round(values['p99_ms'] * HEADROOM + 1, 1),
+                          'max_queries': math.ceil(values['queries'])}
+                   for name, values in results['routes'].items()},
+        'concurrency': {name: {'min_reads_per_s': round(values['reads_per_s'] / HEADROOM, 1),
+                               'max_read_p99_ms': round(values['read_p99_ms'] * HEADROOM + 1, 1),
+                               **({'min_rows_per_s': round(values['rows_per_s'] / HEADROOM, 1)}
+                                  if values['writers'] else {})}
+                        for name, values in results['concurrency'].items()},
+        'dataset': {'load': {'min_rows_per_s': round(results['dataset']['rows_per_s'] / HEADROOM)}},
+    }
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(), 'cpus': os.cpu_count(), 'commit': commit,
+            'date': datetime.now().isoformat(timespec='seconds')}
+
+def run_suite(scale='small', repeat=200, seconds=5):
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        app, dataset = build_app(os.path.join(tmp, 'bench.db'), scale)
+        ctx = make_context(app)
+        routes = {}
+        for item in SCENARIOS:
+            routes[item.name] = run_scenario(app, ctx, item, repeat)
+            values = routes[item.name]
+            print(f"{item.name:<24} {values['p50_ms']:>9.3f}ms {values['p99_ms']:>9.3f}ms "
+                  f"{values['queries']:>7.1f} {values['errors']:>6}", file=sys.stderr)
+        concurrency = {
+            'read_only': run_concurrent(app, ctx, readers=8, writers=0, seconds=seconds),
+            'mixed_ingest_read': run_concurrent(app, ctx, readers=8, writers=2, seconds=seconds),
+        }
+        with app.app_context():
+            db.engine.dispose()
+    return {
+        'scale': scale,
+        'params': SCALES[scale],
+        'environment': environment(),
+        'dataset': dataset,
+        'routes': routes,
+        'concurrency': concurrency,
+        'uncovered_routes': uncovered_routes(app),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks de toutes les routes et seuils de régression')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--repeat', type=int, default=200, help='Appels par route (moins pour les routes lentes)')
+    parser.add_argument('--seconds', type=float, default=5, help='Durée de chaque scénario concurrent')
+    parser.add_argument('--output', default=None, help='Fichier JSON des résultats (défaut : bench_results_<scale>.json)')
+    parser.add_argument('--thresholds', default=THRESHOLDS_FILE)
+    parser.add_argument('--write-thresholds', action='store_true',
+                        help=f'Réécrire les seuils de cette échelle à partir de la mesure (marge x{HEADROOM})')
+    options = parser.parse_args()
+
+    print(f"{'scenario':<24} {'p50':>11} {'p99':>11} {'queries':>7} {'errors':>6}", file=sys.stderr)
+    results = run_suite(options.scale, options.repeat, options.seconds)
+
+    thresholds = {}
+    if os.path.exists(options.thresholds):
+        with open(options.thresholds) as f:
+            thresholds = json.load(f)
+    if options.write_thresholds:
+        thresholds[options.scale] = derive_thresholds(results)
+        with open(options.thresholds, 'w') as f:
+            json.dump(thresholds, f, indent=2, sort_keys=True)
+            f.write('\n')
+    results['regressions'] = check_thresholds(results, thresholds.get(options.scale, {}))
+
+    output = options.output or f'bench_results_{options.scale}.json'
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    for name, values in results['concurrency'].items():
+        print(f"{name}: {values}", file=sys.stderr)
+    for failure in results['regressions']:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    print(f"Résultats : {output}", file=sys.stderr)
+    sys.exit(1 if results['regressions'] else 0)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
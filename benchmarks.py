@@ -0,0 +1,965 @@
+"""Benchmarks hors-ligne des routes capteurs.
+
+Usage : python benchmarks.py latest [max_rows]
+        python benchmarks.py ingest [max_readings]
+        python benchmarks.py concurrency [readers] [seconds]
+        python benchmarks.py rollups [max_rows]
+        python benchmarks.py history [days]
+        python benchmarks.py live [subscribers] [updates]
+        python benchmarks.py serving [clients] [seconds]
+        python benchmarks.py passwords [clients] [seconds]
+        python benchmarks.py partitions [rows]
+        python benchmarks.py stats [points]
+        python benchmarks.py alerts [readings]
+        python benchmarks.py caching [sections]
+        python benchmarks.py commands [controllers] [toggles]
+        python benchmarks.py metrics [requests]
+        python benchmarks.py startup [workers]
+        python benchmarks.py writer [max_workers] [threads] [seconds]
+        python benchmarks.py pagination [sites] [sections_per_site]
+
+Toutes les routes sur un jeu synthétique, avec seuils de régression : python bench_suite.py
+"""
+from flask import Flask
+from config import Config
+from models import db, User, Site, SiteSection, SensorReading
+from database import configure_database
+from migrations import run_migrations
+from latest_cache import latest_cache
+from live_stream import live_hub
+from passwords import password_hasher
+from rollups import rebuild_rollups
+from partitions import route_rows
+from retention import apply_retention
+from analytics import load_series, section_stats
+from alerting import AlertRule, alert_engine
+from ingestion import write_readings
+from ingest_writer import IngestWriter, ingest_writer
+from http_cache import response_cache
+from device_commands import command_waiters
+from instrumentation import instrument_app, metrics
+from routes.site_routes import site_bp
+from routes.auth_routes import auth_bp
+from app import held_threads_limit, LIVE_THREADS_SHARE, DEVICE_THREADS_SHARE
+from datetime import datetime, timedelta
+import contextlib
+import http.client
+import io
+import json
+import math
+import multiprocessing
+import os
+import random
+import resource
+import selectors
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+READING_TYPES = ['temperature', 'ph', 'oxygen']
+
+def make_bench_app(db_path, pragmas=None):
+    """Build an app bound to a throwaway SQLite file"""
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    if pragmas is not None:
+        app.config['SQLITE_PRAGMAS'] = pragmas
+    configure_database(app)
+    app.register_blueprint(site_bp, url_prefix='/api')
+    app.register_blueprint(auth_bp, url_prefix='/api')
+    with app.app_context():
+        db.create_all()
+        run_migrations()
+    # Caches globaux : une nouvelle base réutilise les mêmes id
+    response_cache.invalidate()
+    return app
+
+def create_sections(sites=5, sections_per_site=10):
+    """Create one user with sites/sections and return the section ids"""
+    user = User(email='bench@example.com', password_hash='bench', name='Bench')
+    db.session.add(user)
+    db.session.flush()
+    section_ids = []
+    for s in range(sites):
+        site = Site(name=f'Site {s}', status='En fonctionnement', user_id=user.id)
+        db.session.add(site)
+        db.session.flush()
+        for i in range(sections_per_site):
+            section = SiteSection(site_id=site.id, section_name=f'S{i}', status='En marche')
+            db.session.add(section)
+            db.session.flush()
+            section_ids.append(section.id)
+    db.session.commit()
+    return section_ids
+
+def bulk_load_readings(section_ids, count, start, chunk=50_000):
+    """Insert `count` readings through Core executemany, spread over the sections"""
+    table = SensorReading.__table__
+    inserted = 0
+    while inserted < count:
+        n = min(chunk, count - inserted)
+        rows = [{
+            'section_id': random.choice(section_ids),
+            'reading_type': random.choice(READING_TYPES),
+            'value': round(random.uniform(5, 30), 2),
+            'timestamp': start + timedelta(seconds=inserted + i),
+        } for i in range(n)]
+        db.session.execute(table.insert(), rows)
+        db.session.commit()
+        inserted += n
+    return start + timedelta(seconds=count)
+
+def time_requests(client, url, repeat=200, before=None, headers=None, status=200):
+    """Return (median, p99) latency in milliseconds for GET url"""
+    samples = []
+    for _ in range(repeat):
+        if before:
+            before()
+        t0 = time.perf_counter()
+        response = client.get(url, headers=headers)
+        samples.append((time.perf_counter() - t0) * 1000)
+        assert response.status_code == status, response.get_json()
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+def bench_latest(max_rows=10_000_000):
+    """Latency of /readings/latest and /sensor-data while the table grows"""
+    sizes = [n for n in (10_000, 100_000, 1_000_000, 10_000_000) if n <= max_rows]
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_bench_app(os.path.join(tmp, 'bench.db'))
+        client = app.test_client()
+        with app.app_context():
+            section_ids = create_sections()
+            # /sensor-data lit toujours la section A1 du site 1
+            db.session.add(SiteSection(site_id=1, section_name='A1', status='En marche'))
+            db.session.commit()
+            section_ids.append(SiteSection.query.filter_by(site_id=1, section_name='A1').one().id)
+
+            clock = datetime.now() - timedelta(days=365)
+            loaded = 0
+            print(f"{'rows':>12} {'latest p50':>11} {'latest p99':>11} {'sensor p50':>11} {'sensor p99':>11}"
+                  f" {'cached p50':>11} {'cached p99':>11}")
+            for size in sizes:
+                clock = bulk_load_readings(section_ids, size - loaded, clock)
+                loaded = size
+                # Sans le cache : chaque requête repasse par SQLite
+                latest = time_requests(client, '/api/readings/latest?site_id=1&section_name=S0',
+                                       before=latest_cache.invalidate)
+                sensor = time_requests(client, '/api/sensor-data', before=latest_cache.invalidate)
+                cached = time_requests(client, '/api/readings/latest?site_id=1&section_name=S0')
+                print(f"{size:>12,} {latest[0]:>9.3f}ms {latest[1]:>9.3f}ms {sensor[0]:>9.3f}ms {sensor[1]:>9.3f}ms"
+                      f" {cached[0]:>9.3f}ms {cached[1]:>9.3f}ms")
+
+def bench_ingest(max_readings=100_000):
+    """Per-reading POST vs POST /readings/batch at 1k, 10k and 100k readings"""
+    sizes = [n for n in (1_000, 10_000, 100_000) if n <= max_readings]
+    print(f"{'readings':>10} {'single':>10} {'single/s':>10} {'batch':>10} {'batch/s':>10} {'speedup':>8}")
+    for size in sizes:
+        payload = [{
+            'site_id': 1 + i % 5,
+            'section_name': f'S{i % 10}',
+            'reading_type': READING_TYPES[i % 3],
+            'value': 20.0 if i % 3 == 0 else 7.0,
+            # Horodatages distincts : sans eux le lot n'est qu'une suite de doublons (409)
+            'timestamp': (datetime(2024, 1, 1) + timedelta(seconds=i)).isoformat()
+        } for i in range(size)]
+
+        timings = []
+        for mode in ('single', 'batch'):
+            with tempfile.TemporaryDirectory() as tmp:
+                app = make_bench_app(os.path.join(tmp, 'bench.db'))
+                client = app.test_client()
+                with app.app_context():
+                    create_sections()
+                latest_cache.invalidate()
+                t0 = time.perf_counter()
+                if mode == 'single':
+                    for item in payload:
+                        url = f"/api/sites/{item['site_id']}/sections/{item['section_name']}/readings"
+                        response = client.post(url, json=item)
+                        assert response.status_code == 201, response.get_json()
+                else:
+                    for start in range(0, size, 10_000):
+                        response = client.post('/api/readings/batch', json=payload[start:start + 10_000])
+                        assert response.get_json()['rejected'] == 0
+                timings.append(time.perf_counter() - t0)
+
+        single, batch = timings
+        print(f"{size:>10,} {single:>9.2f}s {size / single:>10,.0f} {batch:>9.2f}s {size / batch:>10,.0f} {single / batch:>7.1f}x")
+
+def bench_concurrency(readers=4, seconds=10):
+    """Parallel readers and one writer, default SQLite settings vs SQLITE_PRAGMAS"""
+    read_url = '/api/readings/latest?site_id=1&section_name=S0'
+    write_url = '/api/sites/1/sections/S0/readings'
+    print(f"{'mode':>10} {'reads/s':>10} {'writes/s':>10} {'read err':>9} {'write err':>9} {'write p99':>10}")
+    for mode, pragmas in (('default', {}), ('tuned', Config.SQLITE_PRAGMAS)):
+        with tempfile.TemporaryDirectory() as tmp:
+            app = make_bench_app(os.path.join(tmp, 'bench.db'), pragmas=pragmas)
+            with app.app_context():
+                section_ids = create_sections()
+                bulk_load_readings(section_ids, 200_000, datetime.now() - timedelta(days=30))
+            # Forcer chaque lecture à passer par SQLite
+            latest_cache.configure(max_sections=0)
+
+            stop = threading.Event()
+            counts = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+            write_latencies = []
+            lock = threading.Lock()
+
+            def reader():
+                client = app.test_client()
+                while not stop.is_set():
+                    response = client.get(read_url)
+                    with lock:
+                        counts['reads' if response.status_code == 200 else 'read_errors'] += 1
+
+            def writer():
+                client = app.test_client()
+                while not stop.is_set():
+                    t0 = time.perf_counter()
+                    response = client.post(write_url, json={'reading_type': 'ph', 'value': 7.0})
+                    write_latencies.append((time.perf_counter() - t0) * 1000)
+                    with lock:
+                        counts['writes' if response.status_code == 201 else 'write_errors'] += 1
+
+            threads = [threading.Thread(target=reader) for _ in range(readers)]
+            threads.append(threading.Thread(target=writer))
+            for thread in threads:
+                thread.start()
+            time.sleep(seconds)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            latest_cache.configure(max_sections=Config.LATEST_CACHE_MAX_SECTIONS)
+
+            write_latencies.sort()
+            p99 = write_latencies[int(len(write_latencies) * 0.99) - 1] if write_latencies else 0
+            print(f"{mode:>10} {counts['reads'] / seconds:>10,.0f} {counts['writes'] / seconds:>10,.0f}"
+                  f" {counts['read_errors']:>9} {counts['write_errors']:>9} {p99:>8.2f}ms")
+
+def bench_rollups(max_rows=10_000_000):
+    """Chart query latency from the rollups while the raw table grows"""
+    sizes = [n for n in (100_000, 1_000_000, 10_000_000) if n <= max_rows]
+    windows = [('1d @ 1m', 1, '1m'), ('7d @ auto', 7, 'auto'), ('30d @ 1h', 30, '1h'), ('365d @ 1d', 365, '1d')]
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_bench_app(os.path.join(tmp, 'bench.db'))
+        client = app.test_client()
+        with app.app_context():
+            section_ids = create_sections(sites=1, sections_per_site=10)
+            clock = datetime(2024, 1, 1)
+            loaded = 0
+            print(f"{'rows':>12} {'rebuild':>9} " + ' '.join(f'{w[0]:>14}' for w in windows))
+            for size in sizes:
+                clock = bulk_load_readings(section_ids, size - loaded, clock)
+                loaded = size
+                t0 = time.perf_counter()
+                rebuild_rollups()
+                rebuild = time.perf_counter() - t0
+                cells = []
+                for _, days, resolution in windows:
+                    start = (clock - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+                    url = (f'/api/sites/1/sections/S0/readings?type=ph&from={start.isoformat()}'
+                           f'&to={(start + timedelta(days=days)).isoformat()}&resolution={resolution}')
+                    p50, _ = time_requests(client, url, repeat=50)
+                    cells.append(f'{p50:>12.2f}ms')
+                print(f"{size:>12,} {rebuild:>8.1f}s " + ' '.join(cells))
+
+def bench_history(days=365):
+    """Import one year of 1-minute values for one tank: legacy ORM path vs /history"""
+    start = datetime(2024, 1, 1)
+    values = [{'value': round(6.5 + (i % 100) / 100, 2),
+               'timestamp': (start + timedelta(minutes=i)).isoformat()}
+              for i in range(days * 24 * 60)]
+    ndjson = ''.join(json.dumps(v) + '\n' for v in values)
+    print(f"{'path':>22} {'rows':>10} {'seconds':>9} {'rows/s':>10}  report")
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_bench_app(os.path.join(tmp, 'bench.db'))
+        client = app.test_client()
+        with app.app_context():
+            section_ids = create_sections(sites=1, sections_per_site=3)
+
+            # Ancien chemin : un objet ORM par valeur puis bulk_save_objects
+            t0 = time.perf_counter()
+            db.session.bulk_save_objects([SensorReading(
+                section_id=section_ids[0], reading_type='ph', value=v['value'],
+                timestamp=datetime.fromisoformat(v['timestamp'])) for v in values])
+            db.session.commit()
+            elapsed = time.perf_counter() - t0
+            print(f"{'legacy ORM':>22} {len(values):>10,} {elapsed:>9.2f} {len(values) / elapsed:>10,.0f}")
+
+        # Une année en JSON dépasse HISTORY_JSON_MAX_BYTES : plafond relevé pour la comparaison
+        app.config['HISTORY_JSON_MAX_BYTES'] = 2 * len(ndjson)
+        runs = [
+            ('/history JSON', 'S1', None),
+            ('/history NDJSON', 'S2', 'application/x-ndjson'),
+            ('/history NDJSON again', 'S2', 'application/x-ndjson'),
+        ]
+        for label, section_name, content_type in runs:
+            t0 = time.perf_counter()
+            if content_type:
+                response = client.post(f'/api/history?site_id=1&section_name={section_name}&reading_type=ph',
+                                       data=ndjson, content_type=content_type)
+            else:
+                response = client.post('/api/history', json={
+                    'site_id': 1, 'section_name': section_name, 'reading_type': 'ph', 'values': values})
+            elapsed = time.perf_counter() - t0
+            report = response.get_json()
+            summary = {k: report[k] for k in ('inserted', 'skipped', 'rejected')}
+            print(f"{label:>22} {len(values):>10,} {elapsed:>9.2f} {len(values) / elapsed:>10,.0f}  {summary}")
+
+def sse_clients(port, count, url, ready, stop, result):
+    """Child process: hold `count` SSE connections open and count the reading frames"""
+    selector = selectors.DefaultSelector()
+    for _ in range(count):
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.sendall(f'GET {url} HTTP/1.1\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n'.encode())
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+    ready.set()
+    frames = 0
+    while not stop.is_set():
+        for key, _ in selector.select(timeout=0.1):
+            data = key.fileobj.recv(65536)
+            frames += data.count(b'event: reading')
+    result.put(frames)
+
+def bench_live(subscribers=1000, updates=500):
+    """CPU cost of the SSE fan-out for 0, 100 and `subscribers` open /live streams"""
+    from werkzeug.serving import make_server
+    import logging
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    # Une socket client et une socket serveur par abonné
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, min(hard, 4 * subscribers + 256)), hard))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_bench_app(os.path.join(tmp, 'bench.db'))
+        # Capacité réelle d'un worker avec la configuration courante, levée pour la mesure
+        limit = held_threads_limit(app, 'LIVE_MAX_SUBSCRIBERS', LIVE_THREADS_SHARE)
+        print(f"per-worker capacity: {limit:,} streams (LIVE_MAX_SUBSCRIBERS, SERVER_THREADS={app.config['SERVER_THREADS']},"
+              f" one thread per stream): {subscribers:,} subscribers need {math.ceil(subscribers / limit):,} workers;"
+              f" limit raised to {subscribers:,} for this run")
+        app.config['LIVE_MAX_SUBSCRIBERS'] = subscribers
+        live_hub.configure(max_subscribers=subscribers)
+        with app.app_context():
+            create_sections(sites=1, sections_per_site=10)
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        client = app.test_client()
+
+        print(f"{'subscribers':>11} {'cpu/update':>11} {'fan-out/sub':>12} {'frames':>9} {'coalesced':>10} {'dropped':>8}")
+        for count in sorted({0, min(100, subscribers), subscribers}):
+            ready, stop, result = multiprocessing.Event(), multiprocessing.Event(), multiprocessing.Queue()
+            process = multiprocessing.Process(target=sse_clients,
+                                              args=(server.port, count, '/api/live?site_id=1', ready, stop, result))
+            process.start()
+            ready.wait()
+            while live_hub.stats()['subscribers'] < count:
+                time.sleep(0.05)
+            before = live_hub.stats()
+
+            cpu0 = time.process_time()
+            for i in range(updates):
+                response = client.post(f'/api/sites/1/sections/S{i % 10}/readings',
+                                       json={'reading_type': READING_TYPES[i % 3], 'value': 20.0 if i % 3 == 0 else 7.0})
+                assert response.status_code == 201, response.get_json()
+                time.sleep(0.002)
+            # Laisser partir les dernières trames fusionnées
+            time.sleep(app.config['LIVE_COALESCE_MS'] / 1000 + 0.5)
+            cpu = time.process_time() - cpu0
+
+            stop.set()
+            frames = result.get()
+            process.join()
+            while live_hub.stats()['subscribers'] > 0:
+                time.sleep(0.05)
+            after = live_hub.stats()
+            if count == 0:
+                baseline = cpu
+            per_sub = (cpu - baseline) / updates / count * 1e6 if count else 0
+            print(f"{count:>11,} {cpu / updates * 1000:>9.3f}ms {per_sub:>10.2f}us {frames:>9,}"
+                  f" {after['coalesced'] - before['coalesced']:>10,} {after['dropped'] - before['dropped']:>8,}")
+        server.shutdown()
+
+def load_test(port, method, url, body, clients, seconds):
+    """Keep-alive HTTP clients in threads; returns (requests/s, p50 ms, p99 ms, errors)"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+    headers = {'Content-Type': 'application/json'}
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        samples = []
+        while time.monotonic() < deadline:
+            t0 = time.perf_counter()
+            try:
+                conn.request(method, url, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status < 300
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                ok = False
+            samples.append((time.perf_counter() - t0) * 1000)
+            if not ok:
+                with lock:
+                    errors[0] += 1
+        conn.close()
+        with lock:
+            latencies.extend(samples)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else 0
+    return len(latencies) / seconds, statistics.median(latencies) if latencies else 0, p99, errors[0]
+
+def bench_serving(clients=32, seconds=10):
+    """Requests/s and p99 of a read and an ingest endpoint for each serve.py server"""
+    # L'écriture d'abord : la lecture renvoie 404 tant que la section n'a pas de lecture
+    endpoints = [
+        ('ingest', 'POST', '/api/sites/1/sections/A1/readings', json.dumps({'reading_type': 'ph', 'value': 7.0})),
+        ('read', 'GET', '/api/readings/latest?site_id=1&section_name=A1', None),
+    ]
+    print(f"{'server':>8} {'endpoint':>8} {'req/s':>9} {'p50':>9} {'p99':>9} {'errors':>7}")
+    for server in ('dev', 'wsgi', 'asgi'):
+        with tempfile.TemporaryDirectory() as tmp:
+            with socket.socket() as probe:
+                probe.bind(('127.0.0.1', 0))
+                port = probe.getsockname()[1]
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            # Journal du serveur dans un fichier : un pipe plein bloquerait le serveur
+            log = open(os.path.join(tmp, 'server.log'), 'w+')
+            process = subprocess.Popen(
+                [sys.executable, 'serve.py', '--server', server, '--host', '127.0.0.1', '--port', str(port)],
+                cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                stdout=log, stderr=subprocess.STDOUT)
+            try:
+                while process.poll() is None:
+                    try:
+                        socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                        break
+                    except OSError:
+                        time.sleep(0.2)
+                if process.poll() is not None:
+                    log.seek(0)
+                    print(f"{server:>8} {'-':>8}  non lancé : {log.read().strip().splitlines()[-1]}")
+                    continue
+                for name, method, url, body in endpoints:
+                    rps, p50, p99, errors = load_test(port, method, url, body, clients, seconds)
+                    print(f"{server:>8} {name:>8} {rps:>9,.0f} {p50:>7.2f}ms {p99:>7.2f}ms {errors:>7}")
+                # Un flux SSE ouvert pendant la lecture : il garde un thread, pas tout le worker
+                with socket.create_connection(('127.0.0.1', port), timeout=5) as stream:
+                    stream.sendall(b'GET /api/live?site_id=1 HTTP/1.1\r\nHost: bench\r\n\r\n')
+                    stream.recv(1024)
+                    name, method, url, body = endpoints[1]
+                    rps, p50, p99, errors = load_test(port, method, url, body, clients, seconds)
+                    print(f"{server:>8} {'read+sse':>8} {rps:>9,.0f} {p50:>7.2f}ms {p99:>7.2f}ms {errors:>7}")
+            finally:
+                process.terminate()
+                try:
+                    process.wait(10)
+                except subprocess.TimeoutExpired:
+                    process.kill()  # arrêt gracieux bloqué par un flux encore ouvert
+                    process.wait()
+                log.close()
+
+def bench_passwords(clients=8, seconds=5):
+    """Logins/s per scrypt cost, and latency of a read request during the login burst"""
+    read_url = '/api/readings/latest?site_id=1&section_name=S0'
+    print(f"{'scrypt n':>9} {'hash':>8} {'logins/s':>9} {'login p99':>10} {'read p50':>9} {'read p99':>9} {'busy':>5}")
+    for n in (2 ** 12, 2 ** 13, 2 ** 14, 2 ** 15, 2 ** 16):
+        password_hasher.configure(n=n)
+        with tempfile.TemporaryDirectory() as tmp:
+            app = make_bench_app(os.path.join(tmp, 'bench.db'))
+            client = app.test_client()
+            with app.app_context():
+                create_sections(sites=1, sections_per_site=1)
+            client.post('/api/sites/1/sections/S0/readings', json={'reading_type': 'ph', 'value': 7.0})
+            t0 = time.perf_counter()
+            response = client.post('/api/register', json={'email': 'login@example.com', 'password': 'secret'})
+            hash_ms = (time.perf_counter() - t0) * 1000
+            assert response.status_code == 201, response.get_json()
+
+            stop = threading.Event()
+            logins, busy, reads = [], [0], []
+            lock = threading.Lock()
+
+            def login():
+                client = app.test_client()
+                while not stop.is_set():
+                    t0 = time.perf_counter()
+                    response = client.post('/api/login', json={'email': 'login@example.com', 'password': 'secret'})
+                    with lock:
+                        if response.status_code == 200:
+                            logins.append((time.perf_counter() - t0) * 1000)
+                        else:
+                            busy[0] += 1
+
+            def read():
+                client = app.test_client()
+                while not stop.is_set():
+                    t0 = time.perf_counter()
+                    client.get(read_url)
+                    reads.append((time.perf_counter() - t0) * 1000)
+                    time.sleep(0.01)
+
+            threads = [threading.Thread(target=login) for _ in range(clients)] + [threading.Thread(target=read)]
+            with contextlib.redirect_stdout(io.StringIO()):
+                for thread in threads:
+                    thread.start()
+                time.sleep(seconds)
+                stop.set()
+                for thread in threads:
+                    thread.join()
+            logins.sort()
+            reads.sort()
+            print(f"{n:>9,} {hash_ms:>6.1f}ms {len(logins) / seconds:>9,.1f} {logins[int(len(logins) * 0.99) - 1]:>8.1f}ms"
+                  f" {statistics.median(reads):>7.2f}ms {reads[int(len(reads) * 0.99) - 1]:>7.2f}ms {busy[0]:>5}")
+    password_hasher.configure(n=Config.PASSWORD_SCRYPT_N)
+
+def bench_partitions(rows=2_000_000, days=180):
+    """Retention over `days` days of readings: batched DELETE vs dropping month partitions"""
+    policies = {t: {'raw': 30, 'minute': 30, 'hour': None, 'day': None} for t in READING_TYPES}
+    # Lectures jusqu'à maintenant : la fenêtre de 7 jours de la route porte sur les dernières
+    start = datetime.now() - timedelta(days=days)
+    step = days * 86400 / rows
+    print(f"{'storage':>10} {'load':>7} {'retention':>10} {'raw purge':>10} {'deleted':>10} {'dropped':>8} "
+          f"{'7d p50':>8} {'latest p50':>11}")
+    for mode in (None, 'month'):
+        with tempfile.TemporaryDirectory() as tmp:
+            app = make_bench_app(os.path.join(tmp, 'bench.db'))
+            app.config['READING_PARTITIONS'] = mode
+            client = app.test_client()
+            with app.app_context():
+                section_ids = create_sections(sites=1, sections_per_site=10)
+                t0 = time.perf_counter()
+                for offset in range(0, rows, 50_000):
+                    batch = [{
+                        'section_id': random.choice(section_ids),
+                        'reading_type': random.choice(READING_TYPES),
+                        'value': round(random.uniform(5, 30), 2),
+                        'timestamp': start + timedelta(seconds=(offset + i) * step),
+                    } for i in range(min(50_000, rows - offset))]
+                    for table, group in route_rows(batch).items():
+                        db.session.execute(table.insert(), group)
+                    db.session.commit()
+                rebuild_rollups()
+                load = time.perf_counter() - t0
+
+                t0 = time.perf_counter()
+                report = apply_retention(policies, pause_ms=0)
+                retention = time.perf_counter() - t0
+            week, _ = time_requests(client, '/api/sites/1/sections/S0/readings?type=ph', repeat=50)
+            latest, _ = time_requests(client, '/api/readings/latest?site_id=1&section_name=S0', repeat=50,
+                                      before=latest_cache.invalidate)
+            print(f"{mode or 'single':>10} {load:>6.1f}s {retention:>9.2f}s {report['raw_purge_s']:>9.2f}s "
+                  f"{report['raw_deleted']:>10,} "
+                  f"{len(report['partitions_dropped']):>8} {week:>6.2f}ms {latest:>9.2f}ms")
+
+def python_stats(readings, window=60, threshold=3.0):
+    """Pure-Python equivalent of analytics.section_stats over ORM readings"""
+    values = [r.value for r in readings]
+    days = [(r.timestamp - readings[0].timestamp).total_seconds() / 86400 for r in readings]
+    count = len(values)
+    mean = sum(values) / count
+    std = math.sqrt(sum((v - mean) ** 2 for v in values) / count)
+    mean_days = sum(days) / count
+    slope = (sum((d - mean_days) * (v - mean) for d, v in zip(days, values))
+             / sum((d - mean_days) ** 2 for d in days))
+    anomalies = 0
+    total = squares = 0.0
+    for i, value in enumerate(values):
+        if i >= window:
+            window_mean = total / window
+            window_std = math.sqrt(max(squares / window - window_mean ** 2, 0.0))
+            if window_std and abs(value - window_mean) / window_std >= threshold:
+                anomalies += 1
+            total -= values[i - window]
+            squares -= values[i - window] ** 2
+        total += value
+        squares += value * value
+    return {'mean': mean, 'std': std, 'trend_per_day': slope, 'anomaly_count': anomalies}
+
+def bench_stats(points=1_000_000):
+    """Section statistics on one series: ORM rows + Python loops vs raw tuples + NumPy"""
+    start = datetime(2024, 1, 1)
+    end = start + timedelta(seconds=30 * points)
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_bench_app(os.path.join(tmp, 'bench.db'))
+        client = app.test_client()
+        with app.app_context():
+            section_ids = create_sections(sites=1, sections_per_site=1)
+            for offset in range(0, points, 50_000):
+                db.session.execute(SensorReading.__table__.insert(), [{
+                    'section_id': section_ids[0], 'reading_type': 'temperature',
+                    'value': round(24 + 2 * math.sin(i / 2880) + random.gauss(0, 0.2), 2),
+                    'timestamp': start + timedelta(seconds=30 * i),
+                } for i in range(offset, min(offset + 50_000, points))])
+                db.session.commit()
+
+            print(f"{'engine':>8} {'load':>8} {'compute':>8} {'total':>8}  result")
+            t0 = time.perf_counter()
+            readings = (SensorReading.query
+                        .filter(SensorReading.section_id == section_ids[0],
+                                SensorReading.reading_type == 'temperature')
+                        .order_by(SensorReading.timestamp).all())
+            t1 = time.perf_counter()
+            result = python_stats(readings)
+            t2 = time.perf_counter()
+            print(f"{'python':>8} {t1 - t0:>7.2f}s {t2 - t1:>7.2f}s {t2 - t0:>7.2f}s  "
+                  f"{ {k: round(v, 4) for k, v in result.items()} }")
+            del readings
+            db.session.expunge_all()
+
+            t0 = time.perf_counter()
+            epochs, values = load_series(section_ids[0], 'temperature', start, end)
+            t1 = time.perf_counter()
+            stats = section_stats(epochs, values)
+            t2 = time.perf_counter()
+            print(f"{'numpy':>8} {t1 - t0:>7.2f}s {t2 - t1:>7.2f}s {t2 - t0:>7.2f}s  "
+                  f"{ {k: stats[k] for k in ('mean', 'std', 'trend_per_day', 'anomaly_count')} }")
+
+        url = (f'/api/sites/1/sections/S0/stats?type=temperature'
+               f'&from={start.isoformat()}&to={end.isoformat()}')
+        p50, p99 = time_requests(client, url, repeat=5)
+        print(f"GET /stats over {points:,} points: p50 {p50:.0f}ms, p99 {p99:.0f}ms")
+
+def bench_alerts(readings=1_000_000):
+    """Alert rule evaluation cost per reading, alone and within batched ingestion"""
+    rules = [('above', 30, 0), ('above', 28, 600), ('below', 18, 0), ('rate', 1, 0)]
+    start = datetime(2024, 1, 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_bench_app(os.path.join(tmp, 'bench.db'))
+        alert_engine.configure()
+        with app.app_context():
+            create_sections(sites=1, sections_per_site=10)
+            sections = SiteSection.query.all()
+            stream = [{
+                'section_id': sections[i % 10].id, 'site_id': sections[i % 10].site_id,
+                'section_name': sections[i % 10].section_name, 'reading_type': READING_TYPES[i % 3],
+                'value': round(24 + 5 * math.sin(i / 5000) + random.gauss(0, 0.1), 2),
+                'timestamp': start + timedelta(seconds=i),
+            } for i in range(readings)]
+
+            print(f"{'rules/type':>10} {'evaluate':>12} {'alerts':>7} {'ingest rows/s':>14}")
+            for count in (0, 1, len(rules)):
+                AlertRule.query.delete()
+                for reading_type in READING_TYPES:
+                    for kind, threshold, duration_s in rules[:count]:
+                        db.session.add(AlertRule(site_id=1, reading_type=reading_type, kind=kind,
+                                                 threshold=threshold, duration_s=duration_s))
+                db.session.commit()
+                alert_engine.configure()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    t0 = time.perf_counter()
+                    for offset in range(0, readings, 500):
+                        alert_engine.evaluate(stream[offset:offset + 500])
+                    evaluate = (time.perf_counter() - t0) / readings * 1e6
+                opened = alert_engine.stats()['opened']
+
+                # Même flux via write_readings (insertion, agrégats, valeurs courantes), 100k lectures
+                alert_engine.configure()
+                shifted = [dict(r, timestamp=r['timestamp'] + timedelta(days=30 * (count + 1)))
+                           for r in stream[:100_000]]
+                t0 = time.perf_counter()
+                for offset in range(0, len(shifted), 500):
+                    write_readings(shifted[offset:offset + 500])
+                ingest = len(shifted) / (time.perf_counter() - t0)
+                print(f"{count:>10} {evaluate:>9.2f}us {opened:>7} {ingest:>14,.0f}")
+
+def bench_caching(sections=50):
+    """GET /sites/<id>: serialized on every request, from the response cache, and 304 revalidation"""
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_bench_app(os.path.join(tmp, 'bench.db'))
+        client = app.test_client()
+        with app.app_context():
+            create_sections(sites=1, sections_per_site=sections)
+        url = '/api/sites/1'
+        print(f"{'mode':>12} {'p50':>8} {'p99':>8} {'bytes':>7}")
+        for mode in ('no cache', 'cache', '304'):
+            response_cache.configure(max_entries=0 if mode == 'no cache' else 10000)
+            response = client.get(url)
+            headers = {'If-None-Match': response.headers['ETag']} if mode == '304' else None
+            p50, p99 = time_requests(client, url, repeat=500, headers=headers, status=304 if mode == '304' else 200)
+            size = 0 if mode == '304' else len(response.get_data())
+            print(f"{mode:>12} {p50:>6.3f}ms {p99:>6.3f}ms {size:>7,}")
+        print(response_cache.stats())
+        response_cache.configure(max_entries=Config.RESPONSE_CACHE_MAX_ENTRIES)
+
+def bench_commands(controllers=1000, toggles=300):
+    """Toggle-to-controller latency and database load with `controllers` concurrent long-polls"""
+    from sqlalchemy import event
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_bench_app(os.path.join(tmp, 'bench.db'))
+        # Capacité réelle d'un worker avec la configuration courante, levée pour la mesure
+        limit = held_threads_limit(app, 'DEVICE_MAX_WAITERS', DEVICE_THREADS_SHARE)
+        print(f"per-worker capacity: {limit:,} long-polls (DEVICE_MAX_WAITERS, SERVER_THREADS={app.config['SERVER_THREADS']},"
+              f" one thread per long-poll): {controllers:,} controllers need {math.ceil(controllers / limit):,} workers;"
+              f" limit raised to {controllers:,} for this run")
+        command_waiters.configure(max_waiters=controllers)
+        with app.app_context():
+            create_sections(sites=controllers, sections_per_site=1)
+            engine = db.engine
+        statements = [0]
+
+        def count_statement(*args):
+            statements[0] += 1
+
+        event.listen(engine, 'before_cursor_execute', count_statement)
+
+        sent = {}  # site_id -> instant de la bascule en cours
+        latencies = []
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def controller(site_id):
+            client = app.test_client()
+            url = f'/api/sites/{site_id}/commands?wait=30'
+            while not stop.is_set():
+                commands = client.get(url).get_json()['commands']
+                if commands:
+                    received = time.perf_counter()
+                    with lock:
+                        latencies.append((received - sent.pop(site_id)) * 1000)
+                    client.post(f'/api/sites/{site_id}/commands/ack', json={'ids': [c['id'] for c in commands]})
+
+        threads = [threading.Thread(target=controller, args=(site_id,), daemon=True)
+                   for site_id in range(1, controllers + 1)]
+        for thread in threads:
+            thread.start()
+        while command_waiters.stats()['waiting'] < controllers:
+            time.sleep(0.1)
+
+        # Contrôleurs connectés sans commande : aucune requête SQL
+        before = statements[0]
+        time.sleep(5)
+        idle = (statements[0] - before) / 5
+
+        client = app.test_client()
+        before = statements[0]
+        for _ in range(toggles):
+            site_id = random.randint(1, controllers)
+            with lock:
+                if site_id in sent:
+                    continue
+                sent[site_id] = time.perf_counter()
+            client.post(f'/api/sites/{site_id}/sections/S0/toggle', json={'action': 'toggle'})
+            time.sleep(0.005)
+        while sent:
+            time.sleep(0.05)
+        per_command = (statements[0] - before) / len(latencies)
+
+        latencies.sort()
+        print(f"{controllers} long-polls, {len(latencies)} commands")
+        print(f"idle: {idle:.1f} statements/s (polling every second: ~{controllers}/s)")
+        print(f"wake latency p50 {statistics.median(latencies):.2f}ms "
+              f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.2f}ms, {per_command:.1f} statements/command")
+        print(command_waiters.stats())
+
+        stop.set()
+        for site_id in range(1, controllers + 1):
+            command_waiters.notify(site_id)
+        for thread in threads:
+            thread.join()
+        event.remove(engine, 'before_cursor_execute', count_statement)
+        command_waiters.configure(max_waiters=app.config['DEVICE_MAX_WAITERS'])
+
+def bench_metrics(requests=5000):
+    """Per-request cost of the instrumentation on a cached read and on a SQL-backed read"""
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_bench_app(os.path.join(tmp, 'bench.db'))
+        instrument_app(app)
+        with app.app_context():
+            section_ids = create_sections()
+            bulk_load_readings(section_ids, 10_000, datetime(2024, 1, 1))
+            latest_cache.configure(max_sections=Config.LATEST_CACHE_MAX_SECTIONS)
+            latest_cache.warm()
+        client = app.test_client()
+        urls = ['/api/readings/latest?site_id=1&section_name=S0', '/api/sections/threshold?type=ph&below=10']
+
+        print(f"{'url':<45} {'off p50':>9} {'on p50':>9} {'overhead':>9}")
+        for url in urls:
+            # Rondes alternées, meilleure médiane de chaque mode : la dérive du processus s'annule
+            p50s = [float('inf'), float('inf')]
+            for _ in range(3):
+                for enabled in (False, True):
+                    metrics.configure(enabled=enabled, slow_request_ms=Config.SLOW_REQUEST_MS)
+                    p50s[enabled] = min(p50s[enabled], time_requests(client, url, repeat=requests)[0])
+            print(f"{url:<45} {p50s[0]:>7.3f}ms {p50s[1]:>7.3f}ms {(p50s[1] - p50s[0]) * 1000:>7.1f}us")
+
+        t0 = time.perf_counter()
+        body = metrics.render()
+        print(f"/metrics: {len(body.splitlines())} lines rendered in {(time.perf_counter() - t0) * 1000:.2f}ms")
+
+def writer_process(db_path, address):
+    app = make_bench_app(db_path)
+    IngestWriter(app, address, b'bench').serve_forever()
+
+def ingest_worker(db_path, address, threads, seconds, sections, results):
+    """One HTTP worker: `threads` clients posting single readings for `seconds`"""
+    app = make_bench_app(db_path)
+    if address:
+        ingest_writer.configure(address=address, authkey=b'bench')
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client():
+        test_client = app.test_client()
+        samples, failed = [], []
+        while time.monotonic() < deadline:
+            site_id, section = random.choice(sections)
+            t0 = time.perf_counter()
+            response = test_client.post(f'/api/sites/{site_id}/sections/{section}/readings',
+                                        json={'reading_type': 'ph', 'value': round(random.uniform(6, 8), 2)})
+            samples.append((time.perf_counter() - t0) * 1000)
+            if response.status_code >= 300:
+                failed.append(response.get_json().get('error', response.status_code))
+        with lock:
+            latencies.extend(samples)
+            errors.extend(failed)
+
+    workers = [threading.Thread(target=client) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    results.put((latencies, errors))
+
+def bench_writer(max_workers=4, threads=8, seconds=10):
+    """Single-reading ingest with 1..max_workers processes: each writing to SQLite, or through the writer process"""
+    context = multiprocessing.get_context('fork')
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        address = os.path.join(tmp, 'ingest.sock')
+        app = make_bench_app(db_path)
+        with app.app_context():
+            create_sections(sites=10, sections_per_site=10)
+            sections = [(site_id, section_name) for site_id, section_name in
+                        db.session.query(SiteSection.site_id, SiteSection.section_name)]
+            db.engine.dispose()  # pas de connexion héritée par les processus forkés
+
+        writer = context.Process(target=writer_process, args=(db_path, address), daemon=True)
+        writer.start()
+        while not os.path.exists(address):
+            time.sleep(0.05)
+
+        print(f"{'mode':<8} {'workers':>7} {'readings/s':>11} {'p50':>8} {'p99':>9} {'errors':>7}")
+        workers = 1
+        while workers <= max_workers:
+            for mode in ('direct', 'writer'):
+                results = context.Queue()
+                processes = [context.Process(target=ingest_worker, args=(
+                    db_path, address if mode == 'writer' else None, threads, seconds, sections, results))
+                    for _ in range(workers)]
+                for process in processes:
+                    process.start()
+                latencies, errors = [], []
+                for _ in processes:
+                    samples, failed = results.get()
+                    latencies += samples
+                    errors += failed
+                for process in processes:
+                    process.join()
+                latencies.sort()
+                print(f"{mode:<8} {workers:>7} {len(latencies) / seconds:>11.0f} {statistics.median(latencies):>6.1f}ms "
+                      f"{latencies[int(len(latencies) * 0.99) - 1]:>7.1f}ms {len(errors):>7}")
+                for message in sorted(set(map(str, errors)))[:3]:
+                    print(f"         {message}")
+            workers *= 2
+        writer.terminate()
+
+def bench_pagination(sites=1000, sections_per_site=20):
+    """First and last keyset pages of /sites and /sections against the full /sites array, one user"""
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_bench_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            create_sections(sites=sites, sections_per_site=sections_per_site)
+        client = app.test_client()
+        email = 'bench@example.com'
+        # Toutes les pages une fois : curseur de la dernière
+        last = {}
+        for name, url in (('sites', f'/api/sites?email={email}&limit=100'),
+                          ('sections', f'/api/sections?email={email}&limit=100')):
+            cursor = None
+            while True:
+                page = client.get(url + (f'&cursor={cursor}' if cursor else '')).get_json()
+                if page['next_cursor'] is None:
+                    break
+                cursor = page['next_cursor']
+            last[name] = f'{url}&cursor={cursor}'
+
+        print(f"{sites} sites, {sites * sections_per_site} sections")
+        for label, url in (('sites, all (array)', f'/api/sites?email={email}'),
+                           ('sites, first page', f'/api/sites?email={email}&limit=100'),
+                           ('sites, last page', last['sites']),
+                           ('sections, first page', f'/api/sections?email={email}&limit=100'),
+                           ('sections, last page', last['sections']),
+                           ('sections, 3 fields', f'/api/sections?email={email}&limit=100&fields=id,section_name,values')):
+            size = len(client.get(url).get_data())
+            p50, p99 = time_requests(client, url, repeat=100)
+            print(f"{label:<22} p50 {p50:>7.2f}ms p99 {p99:>7.2f}ms {size / 1024:>8.1f} KiB")
+
+STARTUP_SCRIPT = '''
+import time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app()
+print((imported - started) * 1000, (time.perf_counter() - imported) * 1000)
+'''
+
+def bench_startup(workers=8):
+    """Cold start of `workers` fresh processes (import + create_app), per-worker init against init-db once"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}')
+        subprocess.run([sys.executable, '-c', 'import serve; serve.init_database_once()'], env=env, check=True)
+
+        print(f"{'mode':<22} {'import p50':>11} {'create_app p50':>15} {'max':>8}")
+        for mode, init in (('DB_INIT_ON_STARTUP', 'true'), ('init-db once', 'false')):
+            imports, creates = [], []
+            for _ in range(workers):
+                output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], env=dict(env, DB_INIT_ON_STARTUP=init),
+                                        check=True, capture_output=True, text=True).stdout.split()
+                imports.append(float(output[-2]))
+                creates.append(float(output[-1]))
+            print(f"{mode:<22} {statistics.median(imports):>9.0f}ms {statistics.median(creates):>13.1f}ms "
+                  f"{max(creates):>6.1f}ms")
+
+BENCHMARKS = {
+    'latest': bench_latest,
+    'ingest': bench_ingest,
+    'concurrency': bench_concurrency,
+    'rollups': bench_rollups,
+    'history': bench_history,
+    'live': bench_live,
+    'serving': bench_serving,
+    'passwords': bench_passwords,
+    'partitions': bench_partitions,
+    'stats': bench_stats,
+    'alerts': bench_alerts,
+    'caching': bench_caching,
+    'commands': bench_commands,
+    'metrics': bench_metrics,
+    'startup': bench_startup,
+    'writer': bench_writer,
+    'pagination': bench_pagination,
+}
+
+if __name__ == '__main__':
+    name = sys.argv[1] if len(sys.argv) > 1 else 'latest'
+    args = [int(a) for a in sys.argv[2:]]
+    BENCHMARKS[name](*args)
\ No newline at end of file
@@ -1,7 +1,143 @@
+import json
 import os
 
 class Config:
-    # Configuration de la base de données SQLite
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///smart_aqua_farm.db'
+    # Configuration de la base de données SQLite (DATABASE_URL prioritaire)
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///smartaqua.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SECRET_KEY = 'votre_clé_secrète'  # Utilisez une clé secrète plus sécurisée en production
\ No newline at end of file
+
+    # Pragmas appliqués à chaque nouvelle connexion SQLite
+    SQLITE_PRAGMAS = {
+        # Avant journal_mode : ne s'applique qu'à une base encore vide (sinon, voir
+        # `flask apply-retention --enable-incremental-vacuum`)
+        'auto_vacuum': 'INCREMENTAL',
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),  # négatif = Kio, soit 64 Mo
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 268435456)),
+        'temp_store': 'MEMORY',
+    }
+
+    # Initialisation de la base (schéma, migrations, données de démonstration) : une fois par
+    # `flask init-db` ou par serve.py avant les workers. true = à chaque create_app (ancien comportement)
+    DB_INIT_ON_STARTUP = os.environ.get('DB_INIT_ON_STARTUP') == 'true'
+    DEMO_DATA = os.environ.get('DEMO_DATA', 'true') == 'true'
+
+    # Pool de connexions (bases fichier uniquement)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_POOL_MAX_OVERFLOW = int(os.environ.get('DB_POOL_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'votre_clé_secrète')  # Utilisez une clé secrète plus sécurisée en production
+
+    # Jetons d'accès signés renvoyés par /api/login (Authorization: Bearer)
+    TOKEN_MAX_AGE = int(os.environ.get('TOKEN_MAX_AGE', 7 * 24 * 3600))
+    # Refuser les requêtes sans jeton (sinon l'ancien paramètre email reste accepté)
+    AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED') == 'true'
+    # Cache utilisateur -> sites possédés, durée de vie à définir avec plusieurs processus
+    OWNERSHIP_CACHE_TTL = float(os.environ['OWNERSHIP_CACHE_TTL']) if os.environ.get('OWNERSHIP_CACHE_TTL') else None
+
+    # Hachage scrypt des mots de passe (coût n = 2**14 : ~65 ms par hash sur un cœur)
+    PASSWORD_SCRYPT_N = int(os.environ.get('PASSWORD_SCRYPT_N', 2 ** 14))
+    PASSWORD_SCRYPT_R = int(os.environ.get('PASSWORD_SCRYPT_R', 8))
+    PASSWORD_SCRYPT_P = int(os.environ.get('PASSWORD_SCRYPT_P', 1))
+    # Hashs calculés en parallèle, et en attente avant de répondre 503
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 64))
+
+    # Partitions mensuelles des lectures brutes ('month' : sensor_reading_AAAAMM, supprimées
+    # en bloc par la rétention). Une fois activé, ne plus désactiver : les partitions ne seraient plus lues
+    READING_PARTITIONS = os.environ.get('READING_PARTITIONS') or None
+
+    # Rétention par type de lecture, en jours (None = conserver) : brut 30 jours,
+    # agrégats minute 30 jours, puis seulement les agrégats heure et jour
+    RETENTION_POLICIES = json.loads(os.environ['RETENTION_POLICIES']) if os.environ.get('RETENTION_POLICIES') else {
+        reading_type: {
+            'raw': int(os.environ.get('RETENTION_RAW_DAYS', 30)),
+            'minute': int(os.environ.get('RETENTION_MINUTE_DAYS', 30)),
+            'hour': None,
+            'day': None,
+        } for reading_type in ('temperature', 'ph', 'oxygen')
+    }
+    RETENTION_BATCH_ROWS = int(os.environ.get('RETENTION_BATCH_ROWS', 5000))
+    RETENTION_BATCH_PAUSE_MS = int(os.environ.get('RETENTION_BATCH_PAUSE_MS', 10))
+    # Tâche de fond toutes les N heures (0 = CLI `flask apply-retention` uniquement)
+    RETENTION_INTERVAL_HOURS = float(os.environ.get('RETENTION_INTERVAL_HOURS', 0))
+
+    # Règles d'alerte relues toutes les N secondes, à définir quand plusieurs processus les modifient
+    ALERT_RULES_TTL = float(os.environ['ALERT_RULES_TTL']) if os.environ.get('ALERT_RULES_TTL') else None
+
+    # Cache des dernières lectures (état courant des sections)
+    LATEST_CACHE_MAX_SECTIONS = int(os.environ.get('LATEST_CACHE_MAX_SECTIONS', 10000))
+    # Durée de vie en secondes, à définir quand plusieurs processus écrivent dans la base
+    LATEST_CACHE_TTL = float(os.environ['LATEST_CACHE_TTL']) if os.environ.get('LATEST_CACHE_TTL') else None
+    # Charger toutes les sections au démarrage de chaque worker (sinon rempli au premier accès)
+    LATEST_CACHE_WARM = os.environ.get('LATEST_CACHE_WARM', 'true') == 'true'
+
+    # Réponses GET /sites et /sites/<id> sérialisées en cache (0 = désactivé), invalidées par les
+    # écritures du processus ; durée de vie à définir quand plusieurs processus écrivent
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 10000))
+    RESPONSE_CACHE_TTL = float(os.environ['RESPONSE_CACHE_TTL']) if os.environ.get('RESPONSE_CACHE_TTL') else None
+
+    # Listes paginées (GET /api/sites avec limit/cursor/filtres, GET /api/sections) : taille des pages
+    PAGE_DEFAULT_LIMIT = int(os.environ.get('PAGE_DEFAULT_LIMIT', 100))
+    PAGE_MAX_LIMIT = int(os.environ.get('PAGE_MAX_LIMIT', 1000))
+
+    # Taille maximale d'un lot sur POST /api/readings/batch
+    BATCH_MAX_READINGS = int(os.environ.get('BATCH_MAX_READINGS', 100000))
+
+    # Taille des transactions de l'import historique (POST /api/history)
+    HISTORY_CHUNK_ROWS = int(os.environ.get('HISTORY_CHUNK_ROWS', 5000))
+    # Corps JSON de POST /api/history, chargé en entier en mémoire (le NDJSON est lu en flux)
+    HISTORY_JSON_MAX_BYTES = int(os.environ.get('HISTORY_JSON_MAX_BYTES', 16 * 1024 * 1024))
+
+    # Tampon d'écriture différée pour les routes d'ingestion unitaires
+    INGEST_BUFFER_ENABLED = os.environ.get('INGEST_BUFFER_ENABLED') == 'true'
+    INGEST_BUFFER_MAX_ROWS = int(os.environ.get('INGEST_BUFFER_MAX_ROWS', 10000))
+    INGEST_FLUSH_ROWS = int(os.environ.get('INGEST_FLUSH_ROWS', 500))
+    INGEST_FLUSH_INTERVAL_MS = int(os.environ.get('INGEST_FLUSH_INTERVAL_MS', 200))
+
+    # Processus d'écriture unique des lectures (plusieurs workers) : les workers lui transmettent
+    # les lectures validées par un socket Unix et il les enregistre par lots, un seul commit pour
+    # toutes les requêtes en attente. Lancé par serve.py, ou par `flask --app app ingest-writer`
+    INGEST_WRITER_ENABLED = os.environ.get('INGEST_WRITER_ENABLED') == 'true'
+    INGEST_WRITER_SOCKET = os.environ.get('INGEST_WRITER_SOCKET', '/tmp/smartaqua-ingest.sock')
+    INGEST_WRITER_BATCH_ROWS = int(os.environ.get('INGEST_WRITER_BATCH_ROWS', 5000))
+    # Attente maximale de l'enregistrement par le processus d'écriture (secondes, puis 503)
+    INGEST_WRITER_TIMEOUT_S = float(os.environ.get('INGEST_WRITER_TIMEOUT_S', 10))
+
+    # Flux temps réel GET /api/live (Server-Sent Events) : chaque flux occupe un thread du serveur
+    # tant qu'il est ouvert. Maximum par worker, par défaut le quart de SERVER_THREADS (puis 503),
+    # soit 8 flux par worker avec SERVER_THREADS=32 : 1 000 tableaux de bord ouverts demandent
+    # 125 workers, ou SERVER_THREADS=4000 sur un seul (voir `python benchmarks.py live`)
+    LIVE_MAX_SUBSCRIBERS = int(os.environ['LIVE_MAX_SUBSCRIBERS']) if os.environ.get('LIVE_MAX_SUBSCRIBERS') else None
+    LIVE_SUBSCRIBER_BUFFER = int(os.environ.get('LIVE_SUBSCRIBER_BUFFER', 100))  # lectures en attente par client
+    LIVE_COALESCE_MS = int(os.environ.get('LIVE_COALESCE_MS', 250))
+    LIVE_KEEPALIVE_S = int(os.environ.get('LIVE_KEEPALIVE_S', 15))
+
+    # File de commandes des contrôleurs (GET /api/sites/<id>/commands en long-poll) : chaque
+    # long-poll occupe un thread du serveur pendant l'attente. Maximum par worker, par défaut
+    # la moitié de SERVER_THREADS pour garder des threads aux autres requêtes (puis 503), soit
+    # 16 contrôleurs par worker avec SERVER_THREADS=32 : 5 000 contrôleurs connectés demandent
+    # 313 workers, ou SERVER_THREADS=10000 sur un seul (voir `python benchmarks.py commands`)
+    DEVICE_MAX_WAITERS = int(os.environ['DEVICE_MAX_WAITERS']) if os.environ.get('DEVICE_MAX_WAITERS') else None
+    DEVICE_POLL_MAX_WAIT = float(os.environ.get('DEVICE_POLL_MAX_WAIT', 60))
+    # Commande livrée sans acquittement renvoyée après ce délai (secondes)
+    DEVICE_COMMAND_REDELIVER_S = int(os.environ.get('DEVICE_COMMAND_REDELIVER_S', 60))
+    # Relecture de la file pendant l'attente, pour les commandes créées par un autre processus
+    DEVICE_COMMAND_RECHECK_S = float(os.environ['DEVICE_COMMAND_RECHECK_S']) if os.environ.get('DEVICE_COMMAND_RECHECK_S') else None
+
+    # Instrumentation : latence par route, requêtes SQL par requête HTTP et lignes ingérées sur GET /metrics
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true') == 'true'
+    # Journaux : niveau, part des requêtes journalisées (0 à 1) et seuil des requêtes lentes,
+    # toujours journalisées (ms)
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 0.01))
+    SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 500))
+
+    # Serveur (python serve.py) : dev, wsgi (gunicorn) ou asgi (uvicorn)
+    SERVER_MODE = os.environ.get('SERVER_MODE', 'dev')
+    SERVER_HOST = os.environ.get('HOST', '0.0.0.0')
+    SERVER_PORT = int(os.environ.get('PORT', 5000))
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', 1))
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 32))
\ No newline at end of file
@@ -0,0 +1,48 @@
+from models import db
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+def is_sqlite_file(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+def engine_options(config, uri):
+    """SQLAlchemy engine options from the DB_POOL_* settings.
+
+    Pool sizing only applies to file databases: in-memory SQLite runs on a
+    single shared connection (StaticPool).
+    """
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    if is_sqlite_file(uri):
+        options.setdefault('pool_size', config['DB_POOL_SIZE'])
+        options.setdefault('max_overflow', config['DB_POOL_MAX_OVERFLOW'])
+        options.setdefault('pool_timeout', config['DB_POOL_TIMEOUT'])
+        options.setdefault('pool_pre_ping', False)
+    return options
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Run the PRAGMA statements on every new DBAPI connection of the engine"""
+    if engine.url.get_backend_name() != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+def configure_database(app):
+    """Build the engine options, bind db and apply the SQLite pragmas.
+
+    Replaces a direct db.init_app(app) call. The URI comes from
+    SQLALCHEMY_DATABASE_URI (DATABASE_URL in the environment, see Config).
+    """
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config, uri)
+    db.init_app(app)
+
+    with app.app_context():
+        apply_sqlite_pragmas(db.engine, app.config.get('SQLITE_PRAGMAS'))
\ No newline at end of file
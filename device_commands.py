@@ -0,0 +1,186 @@
+from models import db, SiteSection
+from sqlalchemy import update, select, or_, and_
+from datetime import datetime, timedelta
+import threading
+import time
+
+# États d'une commande : pending -> delivered -> acked ; superseded quand une commande plus
+# récente pour la même section est créée avant la livraison
+PENDING, DELIVERED, ACKED, SUPERSEDED = 'pending', 'delivered', 'acked', 'superseded'
+
+class DeviceCommand(db.Model):
+    """Durable command for a tank controller, fetched by long-poll and acknowledged"""
+    __tablename__ = 'device_command'
+
+    id = db.Column(db.Integer, primary_key=True)
+    site_id = db.Column(db.Integer, db.ForeignKey('site.id'), nullable=False)
+    section_id = db.Column(db.Integer, db.ForeignKey('site_section.id'), nullable=False)
+    command = db.Column(db.String(20), nullable=False)
+    # Action demandée (start, stop, toggle) : une clé d'idempotence ne rejoue que la même requête
+    action = db.Column(db.String(10), nullable=True)
+    idempotency_key = db.Column(db.String(100), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default=PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    delivered_at = db.Column(db.DateTime, nullable=True)
+    acked_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        # Commandes à livrer d'un site, dans l'ordre
+        db.Index('ix_device_command_site_status', 'site_id', 'status', 'id'),
+        # Une seule commande par clé d'idempotence et par site (NULL autorisé plusieurs fois)
+        db.Index('ux_device_command_idempotency', 'site_id', 'idempotency_key', unique=True),
+    )
+
+def serialize_command(command, section_name):
+    return {
+        'id': command.id,
+        'section_name': section_name,
+        'command': command.command,
+        'status': command.status,
+        'attempts': command.attempts,
+        'created_at': command.created_at.isoformat()
+    }
+
+class TooManyWaiters(Exception):
+    """Raised when the maximum number of long-polling controllers is reached"""
+
+class CommandWaiters:
+    """Wake the long-polls of a site when one of its commands is enqueued.
+
+    One Condition per site with waiters, sharing a single lock: a new
+    command only wakes the controllers of its own site. Notifications are
+    per process; with several workers, waiters also re-check the database
+    every `recheck_s` seconds.
+    """
+
+    def __init__(self, max_waiters=5000, recheck_s=None):
+        self.max_waiters = max_waiters
+        self.recheck_s = recheck_s
+        self._lock = threading.Lock()
+        self._versions = {}  # site_id -> nombre de commandes notifiées
+        self._conditions = {}  # site_id -> [Condition, waiters], seulement pour les sites en attente
+        self._waiting = 0
+        self.notified = 0
+
+    def configure(self, max_waiters=None, recheck_s=None):
+        with self._lock:
+            if max_waiters is not None:
+                self.max_waiters = max_waiters
+            self.recheck_s = recheck_s
+
+    def version(self, site_id):
+        with self._lock:
+            return self._versions.get(site_id, 0)
+
+    def notify(self, site_id):
+        with self._lock:
+            self._versions[site_id] = self._versions.get(site_id, 0) + 1
+            self.notified += 1
+            entry = self._conditions.get(site_id)
+            if entry is not None:
+                entry[0].notify_all()
+
+    def wait(self, site_id, version, timeout):
+        """Block until a notify(site_id) past `version`, `timeout` or the recheck interval. True if notified."""
+        changed = lambda: self._versions.get(site_id, 0) != version
+        with self._lock:
+            if changed():
+                return True
+            if self._waiting >= self.max_waiters:
+                raise TooManyWaiters('Trop de contrôleurs en attente, réessayez plus tard')
+            entry = self._conditions.get(site_id)
+            if entry is None:
+                entry = self._conditions[site_id] = [threading.Condition(self._lock), 0]
+            entry[1] += 1
+            self._waiting += 1
+            try:
+                if self.recheck_s:
+                    timeout = min(timeout, self.recheck_s)
+                return entry[0].wait_for(changed, timeout)
+            finally:
+                entry[1] -= 1
+                self._waiting -= 1
+                if entry[1] == 0:
+                    del self._conditions[site_id]
+
+    def stats(self):
+        with self._lock:
+            return {'waiting': self._waiting, 'sites': len(self._conditions),
+                    'max_waiters': self.max_waiters, 'notified': self.notified}
+
+command_waiters = CommandWaiters()
+
+def enqueue_command(section, command, idempotency_key=None, action=None):
+    """Add a command for the section's controller, in the caller's transaction.
+
+    Undelivered commands of the same section are superseded: a controller
+    that was offline only receives the latest state.
+    """
+    db.session.execute(update(DeviceCommand).where(
+        DeviceCommand.section_id == section.id,
+        DeviceCommand.status == PENDING
+    ).values(status=SUPERSEDED))
+    entry = DeviceCommand(site_id=section.site_id, section_id=section.id, command=command,
+                          action=action or command, idempotency_key=idempotency_key)
+    db.session.add(entry)
+    return entry
+
+def find_command(site_id, idempotency_key):
+    return DeviceCommand.query.filter_by(site_id=site_id, idempotency_key=idempotency_key).first()
+
+def claim_commands(site_id, limit, redeliver_after):
+    """Mark up to `limit` commands of the site as delivered and return them serialized, oldest first.
+
+    Pending commands, and delivered ones not acknowledged within
+    `redeliver_after` seconds (at-least-once delivery). Committed before
+    the response is sent.
+    """
+    now = datetime.now()
+    stale = now - timedelta(seconds=redeliver_after)
+    deliverable = (DeviceCommand.site_id == site_id,
+                   or_(DeviceCommand.status == PENDING,
+                       and_(DeviceCommand.status == DELIVERED, DeviceCommand.delivered_at < stale)))
+    ids = db.session.execute(
+        select(DeviceCommand.id).where(*deliverable).order_by(DeviceCommand.id).limit(limit)
+    ).scalars().all()
+    if not ids:
+        db.session.commit()
+        return []
+    # Conditions répétées : une commande réclamée entre-temps par un autre long-poll n'est pas reprise
+    db.session.execute(update(DeviceCommand).where(DeviceCommand.id.in_(ids), *deliverable).values(
+        status=DELIVERED, delivered_at=now, attempts=DeviceCommand.attempts + 1))
+    rows = (db.session.query(DeviceCommand, SiteSection.section_name)
+            .join(SiteSection, SiteSection.id == DeviceCommand.section_id)
+            .filter(DeviceCommand.id.in_(ids), DeviceCommand.delivered_at == now)
+            .order_by(DeviceCommand.id)
+            .all())
+    commands = [serialize_command(command, section_name) for command, section_name in rows]
+    db.session.commit()
+    return commands
+
+def fetch_commands(site_id, limit=50, wait=25, redeliver_after=60):
+    """Long-poll: commands to deliver, waiting up to `wait` seconds for one to be enqueued"""
+    deadline = time.monotonic() + wait
+    while True:
+        # Version lue avant la requête : une commande créée entre les deux réveille l'attente
+        version = command_waiters.version(site_id)
+        commands = claim_commands(site_id, limit, redeliver_after)
+        remaining = deadline - time.monotonic()
+        if commands or remaining <= 0:
+            return commands
+        # Ne pas garder de connexion du pool pendant l'attente
+        db.session.remove()
+        command_waiters.wait(site_id, version, remaining)
+
+def ack_commands(site_id, ids):
+    """Acknowledge commands; acknowledging twice is harmless. Returns the number newly acknowledged."""
+    if not ids:
+        return 0
+    result = db.session.execute(update(DeviceCommand).where(
+        DeviceCommand.site_id == site_id,
+        DeviceCommand.id.in_(ids),
+        DeviceCommand.status == DELIVERED
+    ).values(status=ACKED, acked_at=datetime.now()))
+    db.session.commit()
+    return result.rowcount
\ No newline at end of file
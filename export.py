@@ -0,0 +1,79 @@
+from models import db, SiteSection
+from partitions import reading_tables
+from sqlalchemy import select
+import csv
+import io
+import json
+import zlib
+
+EXPORT_COLUMNS = ['section_name', 'reading_type', 'value', 'timestamp']
+
+def export_queries(site_id, section_name=None, reading_type=None, start=None, end=None):
+    """One statement per reading table overlapping [start, end), oldest first.
+
+    Rows are ordered by section, type and timestamp within each table, so
+    with month partitions the export is ordered by month first.
+    """
+    statements = []
+    for table in reading_tables(start, end):
+        stmt = (select(SiteSection.section_name, table.c.reading_type, table.c.value, table.c.timestamp)
+                .join(SiteSection, SiteSection.id == table.c.section_id)
+                .where(SiteSection.site_id == site_id))
+        if section_name:
+            stmt = stmt.where(SiteSection.section_name == section_name)
+        if reading_type:
+            stmt = stmt.where(table.c.reading_type == reading_type)
+        if start:
+            stmt = stmt.where(table.c.timestamp >= start)
+        if end:
+            stmt = stmt.where(table.c.timestamp < end)
+        # Ordre de l'index (section, type, timestamp) : pas de tri en mémoire
+        statements.append(stmt.order_by(table.c.section_id, table.c.reading_type, table.c.timestamp))
+    return statements
+
+def stream_partitions(statements, batch_size=5000):
+    """Yield lists of rows from server-side cursors, `batch_size` rows at a time"""
+    for stmt in statements:
+        result = db.session.execute(stmt.execution_options(stream_results=True, yield_per=batch_size))
+        try:
+            for partition in result.partitions():
+                yield partition
+        finally:
+            result.close()
+
+def csv_chunks(partitions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    for rows in partitions:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows((name, reading_type, value, timestamp.isoformat())
+                         for name, reading_type, value, timestamp in rows)
+        yield buffer.getvalue()
+
+def ndjson_chunks(partitions):
+    for rows in partitions:
+        yield ''.join(
+            json.dumps({'section_name': name, 'reading_type': reading_type,
+                        'value': value, 'timestamp': timestamp.isoformat()}) + '\n'
+            for name, reading_type, value, timestamp in rows
+        )
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = en-tête gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_stream(site_id, fmt='csv', compress=False, batch_size=5000, **filters):
+    """Body of an export response: str chunks, or gzip bytes when `compress`.
+
+    Memory use is bounded by `batch_size` rows whatever the result size.
+    """
+    partitions = stream_partitions(export_queries(site_id, **filters), batch_size)
+    chunks = csv_chunks(partitions) if fmt == 'csv' else ndjson_chunks(partitions)
+    return gzip_chunks(chunks) if compress else chunks
\ No newline at end of file
@@ -0,0 +1,123 @@
+from models import db
+from ingestion import validate_reading, parse_timestamp, store_history, inserted_readings
+from latest_cache import latest_cache
+from http_cache import response_cache
+from instrumentation import metrics
+from ingest_writer import ingest_writer, WriterUnavailable, WriteFailed
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Nombre d'erreurs détaillées renvoyées dans le rapport d'import
+MAX_REPORTED_ERRORS = 100
+
+def iter_ndjson(stream, block_size=65536):
+    """Yield one parsed object per line of a binary stream, None for invalid lines.
+
+    The stream is read in blocks: line iteration on the WSGI input stream
+    reads it one byte at a time.
+    """
+    pending = b''
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        lines = (pending + block).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield from _parse_line(line)
+    yield from _parse_line(pending)
+
+def _parse_line(line):
+    line = line.strip()
+    if not line:
+        return
+    try:
+        yield json.loads(line)
+    except ValueError:
+        yield None
+
+def parse_item(item, section_id, reading_type):
+    """Return (row, None) or (None, error message) for one {value, timestamp} item"""
+    if not isinstance(item, dict):
+        return None, 'Ligne invalide'
+    value, error = validate_reading(reading_type, item.get('value'))
+    if error:
+        return None, error
+    try:
+        timestamp = parse_timestamp(item['timestamp'])
+    except (KeyError, TypeError, ValueError):
+        return None, 'Timestamp invalide'
+    return {
+        'section_id': section_id,
+        'reading_type': reading_type,
+        'value': value,
+        'timestamp': timestamp
+    }, None
+
+def import_history(section, reading_type, items, chunk_size=5000):
+    """Import historical values for one section and reading type.
+
+    `items` is any iterable of {value, timestamp} (a parsed JSON list or a
+    streamed NDJSON body). Rows are inserted `chunk_size` at a time, each
+    chunk in its own transaction with INSERT OR IGNORE, so duplicates are
+    skipped and an invalid row or a failed chunk does not abort the import.
+    The section's current value follows the newest inserted row when it is
+    more recent than the stored one.
+    With INGEST_WRITER_ENABLED the chunks are committed by the writer
+    process; ingest_writer.WriterUnavailable then aborts the import, and
+    importing the same values again only adds the missing ones.
+    """
+    report = {'inserted': 0, 'skipped': 0, 'rejected': 0, 'errors': []}
+
+    def reject(position, error, count=1):
+        report['rejected'] += count
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': position, 'error': error})
+
+    def flush(chunk, position):
+        try:
+            if ingest_writer.enabled:
+                ids = ingest_writer.import_history(chunk)
+            else:
+                ids = store_history(chunk)
+        except WriterUnavailable:
+            raise
+        except WriteFailed as e:
+            logger.error(f"History import chunk error ({len(chunk)} rows up to line {position}): {e}")
+            reject(position, "Échec de l'enregistrement du bloc", len(chunk))
+            return
+        except Exception as e:
+            db.session.rollback()
+            # Le détail de l'erreur reste dans les journaux, pas dans la réponse
+            logger.exception(f"History import chunk error ({len(chunk)} rows up to line {position}): {e}")
+            reject(position, "Échec de l'enregistrement du bloc", len(chunk))
+            return
+        inserted = sum(1 for row_id in ids if row_id is not None)
+        report['inserted'] += inserted
+        metrics.count_ingested(inserted, 'history')
+        report['skipped'] += len(chunk) - inserted
+        if not inserted:
+            return
+        # Valeurs déjà enregistrées ignorées : seules les lignes insérées font avancer l'état courant
+        newest = max(inserted_readings(chunk, ids), key=lambda row: row['timestamp'])
+        latest_cache.update(section.site_id, section.section_name,
+                            reading_type, newest['value'], newest['timestamp'])
+        response_cache.invalidate(('site', section.site_id))
+
+    chunk = []
+    position = 0
+    for position, item in enumerate(items, 1):
+        row, error = parse_item(item, section.id, reading_type)
+        if error:
+            reject(position, error)
+            continue
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            flush(chunk, position)
+            chunk = []
+    if chunk:
+        flush(chunk, position)
+
+    return report
\ No newline at end of file
@@ -0,0 +1,124 @@
+from collections import OrderedDict, namedtuple
+from flask import request, Response, current_app
+from email.utils import format_datetime, parsedate_to_datetime
+from datetime import timezone
+import hashlib
+import threading
+import time
+
+# Réponse JSON sérialisée une fois, avec ses validateurs HTTP
+CachedResponse = namedtuple('CachedResponse', 'body etag last_modified stored_at')
+
+def make_etag(*parts):
+    """Weak ETag from the version fields of the resource"""
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+class ResponseCache:
+    """Serialized GET responses keyed by resource, e.g. ('site', 3) or ('sites', user_id).
+
+    LRU over `max_entries`. The write routes call invalidate() for the
+    resources they change; with several worker processes, set `ttl` so
+    changes made elsewhere are picked up.
+    """
+
+    def __init__(self, max_entries=10000, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0  # incrémenté à chaque invalidation
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.bytes_saved = 0
+
+    def configure(self, max_entries=None, ttl=None):
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = max_entries
+            self.ttl = ttl
+            self._entries.clear()
+
+    def get(self, key):
+        """(entry or None, generation to pass to put() after a miss)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry.stored_at <= self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry, self._generation
+            self.misses += 1
+            return None, self._generation
+
+    def put(self, key, payload, etag, last_modified, generation):
+        entry = CachedResponse(current_app.json.dumps(payload).encode(), etag, last_modified, time.monotonic())
+        with self._lock:
+            # Une invalidation pendant la construction : la réponse est servie mais pas gardée
+            if self.max_entries and generation == self._generation:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, key=None):
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def record_not_modified(self, entry):
+        with self._lock:
+            self.not_modified += 1
+            self.bytes_saved += len(entry.body)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                    'not_modified': self.not_modified, 'bytes_saved': self.bytes_saved}
+
+response_cache = ResponseCache()
+
+def is_not_modified(entry):
+    """Conditional GET: If-None-Match first, If-Modified-Since only without it"""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        tags = {tag.strip() for tag in if_none_match.split(',')}
+        # Comparaison faible : W/"x" et "x" désignent la même version
+        return '*' in tags or entry.etag in tags or entry.etag[2:] in tags
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since and entry.last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            return False
+        return entry.last_modified.replace(microsecond=0) <= since
+    return False
+
+def cached_json(key, build):
+    """JSON response for `key`, built by `build()` only on a cache miss.
+
+    `build` returns (payload, etag, last_modified) or None for a 404. A
+    request whose validators match gets a 304 without a body.
+    """
+    entry, generation = response_cache.get(key)
+    if entry is None:
+        built = build()
+        if built is None:
+            return None
+        entry = response_cache.put(key, *built, generation)
+
+    headers = {'ETag': entry.etag, 'Cache-Control': 'private, no-cache'}
+    if entry.last_modified is not None:
+        # Dates naïves de la base envoyées telles quelles en GMT : le client ne fait que les renvoyer
+        headers['Last-Modified'] = format_datetime(
+            entry.last_modified.replace(microsecond=0, tzinfo=timezone.utc), usegmt=True)
+    if is_not_modified(entry):
+        response_cache.record_not_modified(entry)
+        return Response(status=304, headers=headers)
+    return Response(entry.body, status=200, mimetype='application/json', headers=headers)
\ No newline at end of file
@@ -0,0 +1,137 @@
+from ingestion import write_readings
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class BufferFull(Exception):
+    """Raised when the ingestion queue cannot take more readings"""
+
+class IngestBuffer:
+    """Write-behind queue for validated readings, flushed by a background worker.
+
+    The worker group-commits whatever is queued every `flush_rows` readings
+    or `flush_interval_ms` milliseconds, whichever comes first, through
+    ingestion.write_readings. The queue is bounded: submit() raises
+    BufferFull instead of blocking the request.
+    """
+
+    def __init__(self, max_rows=10000, flush_rows=500, flush_interval_ms=200):
+        self.max_rows = max_rows
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue = None
+        self._app = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = 0
+        self.flushed_rows = 0
+        self.failed_rows = 0
+        self.flushes = 0
+        self.flush_time = 0.0
+        self.last_flush_ms = None
+        self.max_flush_ms = 0.0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app, max_rows=None, flush_rows=None, flush_interval_ms=None):
+        if self.running:
+            return
+        if max_rows is not None:
+            self.max_rows = max_rows
+        if flush_rows is not None:
+            self.flush_rows = flush_rows
+        if flush_interval_ms is not None:
+            self.flush_interval = flush_interval_ms / 1000
+        self._app = app
+        self._queue = queue.Queue(maxsize=self.max_rows)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='ingest-buffer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=30):
+        """Flush what is queued and stop the worker"""
+        if not self.running:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+
+    def submit(self, reading):
+        """Queue a reading built by ingestion.make_reading"""
+        if not self.running or self._stopping.is_set():
+            raise BufferFull('Tampon d\'ingestion arrêté')
+        try:
+            self._queue.put_nowait(reading)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise BufferFull('Tampon d\'ingestion plein')
+        with self._lock:
+            self.accepted += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self.running,
+                'queue_depth': self._queue.qsize() if self._queue else 0,
+                'max_rows': self.max_rows,
+                'flush_rows': self.flush_rows,
+                'flush_interval_ms': self.flush_interval * 1000,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'flushed_rows': self.flushed_rows,
+                'failed_rows': self.failed_rows,
+                'flushes': self.flushes,
+                'avg_flush_ms': round(self.flush_time / self.flushes * 1000, 3) if self.flushes else None,
+                'last_flush_ms': self.last_flush_ms,
+                'max_flush_ms': round(self.max_flush_ms, 3)
+            }
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.flush_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 and not self._stopping.is_set():
+                    break
+                try:
+                    # À l'arrêt, on vide la file sans attendre
+                    batch.append(self._queue.get_nowait() if self._stopping.is_set()
+                                 else self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        t0 = time.perf_counter()
+        try:
+            with self._app.app_context():
+                write_readings(batch)
+        except Exception as e:
+            with self._lock:
+                self.failed_rows += len(batch)
+            logger.exception(f"Ingest buffer flush error ({len(batch)} readings lost): {e}")
+            return
+        elapsed = time.perf_counter() - t0
+        with self._lock:
+            self.flushes += 1
+            self.flushed_rows += len(batch)
+            self.flush_time += elapsed
+            self.last_flush_ms = round(elapsed * 1000, 3)
+            self.max_flush_ms = max(self.max_flush_ms, elapsed * 1000)
+
+ingest_buffer = IngestBuffer()
\ No newline at end of file
@@ -0,0 +1,322 @@
+from flask.cli import with_appcontext
+from flask import current_app
+from multiprocessing.connection import Listener, Client
+import click
+import logging
+import os
+import queue
+import stat
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Champs d'une lecture (ingestion.make_reading) transmis au processus d'écriture, dans cet ordre
+READING_FIELDS = ('section_id', 'site_id', 'section_name', 'reading_type', 'value', 'timestamp')
+# Champs d'une ligne d'import d'historique (history_import.parse_item)
+HISTORY_FIELDS = ('section_id', 'reading_type', 'value', 'timestamp')
+
+class WriterUnavailable(Exception):
+    """Raised when the writer process cannot be reached or does not answer in time"""
+
+class WriteFailed(Exception):
+    """Raised when the writer process could not commit the readings"""
+
+class IngestWriterClient:
+    """Forward readings from an HTTP worker to the writer process.
+
+    One connection per thread, opened on first use; write() blocks until
+    the writer has committed the readings. Sending again after a lost
+    connection is safe: readings already stored are ignored by the unique
+    (section, type, timestamp) index.
+    """
+
+    def __init__(self):
+        self.address = None
+        self.authkey = None
+        self.timeout = 10
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.rows = 0
+        self.unavailable = 0
+        self.failed = 0
+        self.wait_time = 0.0
+
+    @property
+    def enabled(self):
+        return self.address is not None
+
+    def configure(self, address=None, authkey=None, timeout=10):
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+        return connection
+
+    def _close(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            try:
+                connection.close()
+            except OSError:
+                pass
+
+    def _call(self, message):
+        for attempt in range(2):
+            try:
+                connection = self._connection()
+                connection.send(message)
+                if not connection.poll(self.timeout):
+                    # Réponse tardive : la connexion n'est plus utilisable
+                    self._close()
+                    raise WriterUnavailable("Processus d'écriture sans réponse, réessayez plus tard")
+                return connection.recv()
+            except (OSError, EOFError) as e:
+                # Processus d'écriture redémarré : une nouvelle connexion, une fois
+                self._close()
+                if attempt:
+                    raise WriterUnavailable(f"Processus d'écriture indisponible : {e}")
+
+    def write(self, readings):
+        """Commit readings built by ingestion.make_reading; returns their ids (see ingestion.insert_readings)"""
+        return self._send('write', READING_FIELDS, readings)
+
+    def import_history(self, rows):
+        """Commit one chunk of a history import (see history_import); returns the ids of its rows"""
+        return self._send('history', HISTORY_FIELDS, rows)
+
+    def _send(self, kind, fields, readings):
+        t0 = time.perf_counter()
+        try:
+            status, value = self._call((kind, [tuple(r[f] for f in fields) for r in readings]))
+        except WriterUnavailable:
+            with self._lock:
+                self.unavailable += 1
+            raise
+        with self._lock:
+            self.requests += 1
+            self.rows += len(readings)
+            self.wait_time += time.perf_counter() - t0
+            if status != 'ok':
+                self.failed += 1
+        if status != 'ok':
+            raise WriteFailed(value)
+        return value
+
+    def writer_stats(self):
+        """Counters of the writer process itself"""
+        return self._call(('stats', None))[1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'requests': self.requests,
+                'rows': self.rows,
+                'unavailable': self.unavailable,
+                'failed': self.failed,
+                'avg_wait_ms': round(self.wait_time / self.requests * 1000, 3) if self.requests else None
+            }
+
+ingest_writer = IngestWriterClient()
+
+class PendingWrite:
+    def __init__(self, readings, kind='write'):
+        self.readings = readings
+        self.kind = kind
+        self.done = threading.Event()
+        self.reply = None
+
+class IngestWriter:
+    """The only process writing sensor readings to the database.
+
+    One thread per connected HTTP worker thread receives readings and
+    waits; a single writer thread commits everything queued meanwhile in
+    one transaction (group commit), up to `max_batch_rows` rows, so the
+    batch size grows with the load instead of the lock contention. When a
+    group fails, its requests are retried one by one so that only the
+    faulty one gets the error. History import chunks are committed alone,
+    in their own transaction.
+    """
+
+    def __init__(self, app, address, authkey, max_batch_rows=5000):
+        self.app = app
+        self.address = address
+        self.authkey = authkey
+        self.max_batch_rows = max_batch_rows
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._listener = None
+        self.connections = 0
+        self.requests = 0
+        self.rows = 0
+        self.inserted = 0
+        self.failed = 0
+        self.commits = 0
+        self.commit_time = 0.0
+        self.max_batch = 0
+
+    def serve_forever(self):
+        if os.path.exists(self.address) and stat.S_ISSOCK(os.stat(self.address).st_mode):
+            os.unlink(self.address)  # socket d'un processus précédent
+        self._listener = Listener(self.address, family='AF_UNIX', authkey=self.authkey)
+        os.chmod(self.address, 0o600)
+        threading.Thread(target=self._write_loop, name='ingest-writer', daemon=True).start()
+        logger.info(f"Ingest writer listening on {self.address}")
+        try:
+            while True:
+                try:
+                    connection = self._listener.accept()
+                except Exception as e:
+                    if self._listener is None:
+                        return  # close()
+                    # Clé refusée ou client parti pendant l'authentification : on continue
+                    logger.warning(f"Ingest writer connection refused: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+        finally:
+            self.close()
+
+    def close(self):
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.close()
+
+    def _serve_connection(self, connection):
+        with self._lock:
+            self.connections += 1
+        try:
+            while True:
+                try:
+                    kind, payload = connection.recv()
+                except (EOFError, OSError):
+                    return
+                if kind == 'stats':
+                    connection.send(('ok', self.stats()))
+                    continue
+                fields = HISTORY_FIELDS if kind == 'history' else READING_FIELDS
+                pending = PendingWrite([dict(zip(fields, row)) for row in payload], kind)
+                self._queue.put(pending)
+                pending.done.wait()
+                connection.send(pending.reply)
+        finally:
+            with self._lock:
+                self.connections -= 1
+            connection.close()
+
+    def _write_loop(self):
+        while True:
+            pending = self._queue.get()
+            group = []
+            rows = 0
+            # Tout ce qui est arrivé pendant le commit précédent part dans cette transaction,
+            # jusqu'au prochain bloc d'import d'historique
+            while pending is not None and pending.kind == 'write':
+                group.append(pending)
+                rows += len(pending.readings)
+                pending = None
+                if rows >= self.max_batch_rows:
+                    break
+                try:
+                    pending = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if group:
+                self._commit(group, rows)
+            if pending is not None:
+                self._commit_history(pending)
+
+    def _commit(self, group, rows):
+        from ingestion import store_readings
+        t0 = time.perf_counter()
+        with self.app.app_context():
+            try:
+                replies = [('ok', ids) for ids in store_readings([p.readings for p in group])]
+            except Exception as e:
+                if len(group) == 1:
+                    logger.exception(f"Ingest writer commit error ({rows} readings): {e}")
+                    replies = [('error', str(e))]
+                else:
+                    replies = []
+                    for pending in group:
+                        try:
+                            replies.append(('ok', store_readings([pending.readings])[0]))
+                        except Exception as e:
+                            logger.exception(f"Ingest writer commit error ({len(pending.readings)} readings): {e}")
+                            replies.append(('error', str(e)))
+        self._done(group, rows, replies, time.perf_counter() - t0)
+
+    def _commit_history(self, pending):
+        from ingestion import store_history
+        t0 = time.perf_counter()
+        with self.app.app_context():
+            try:
+                reply = ('ok', store_history(pending.readings))
+            except Exception as e:
+                logger.exception(f"Ingest writer history error ({len(pending.readings)} rows): {e}")
+                reply = ('error', str(e))
+        self._done([pending], len(pending.readings), [reply], time.perf_counter() - t0)
+
+    def _done(self, group, rows, replies, elapsed):
+        with self._lock:
+            self.commits += 1
+            self.commit_time += elapsed
+            self.requests += len(group)
+            self.rows += rows
+            self.max_batch = max(self.max_batch, rows)
+            for status, value in replies:
+                if status == 'ok':
+                    self.inserted += sum(1 for row_id in value if row_id is not None)
+                else:
+                    self.failed += 1
+        for pending, reply in zip(group, replies):
+            pending.reply = reply
+            pending.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'connections': self.connections,
+                'queue_depth': self._queue.qsize(),
+                'requests': self.requests,
+                'rows': self.rows,
+                'inserted': self.inserted,
+                'failed': self.failed,
+                'commits': self.commits,
+                'avg_batch_rows': round(self.rows / self.commits, 1) if self.commits else None,
+                'max_batch_rows': self.max_batch,
+                'avg_commit_ms': round(self.commit_time / self.commits * 1000, 3) if self.commits else None
+            }
+
+def writer_authkey(config):
+    return config['SECRET_KEY'].encode()
+
+def run_ingest_writer():
+    """Writer process entry point (serve.py): an app without caches nor background workers"""
+    from app import create_app
+    from instrumentation import configure_logging
+    app = create_app({
+        'INGEST_WRITER_ENABLED': False,
+        'INGEST_BUFFER_ENABLED': False,
+        'LATEST_CACHE_WARM': False,
+        'RETENTION_INTERVAL_HOURS': 0,
+        'METRICS_ENABLED': False
+    })
+    configure_logging(app.config['LOG_LEVEL'])
+    IngestWriter(app, app.config['INGEST_WRITER_SOCKET'], writer_authkey(app.config),
+                 app.config['INGEST_WRITER_BATCH_ROWS']).serve_forever()
+
+@click.command('ingest-writer')
+@with_appcontext
+def ingest_writer_command():
+    """Run the sensor readings writer process (INGEST_WRITER_ENABLED=true in the HTTP workers)."""
+    app = current_app._get_current_object()
+    IngestWriter(app, app.config['INGEST_WRITER_SOCKET'], writer_authkey(app.config),
+                 app.config['INGEST_WRITER_BATCH_ROWS']).serve_forever()
\ No newline at end of file
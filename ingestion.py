@@ -0,0 +1,281 @@
+from models import db, SiteSection
+from latest_cache import latest_cache
+from live_stream import live_hub
+from rollups import update_rollups, refresh_rollups, raw_watermarks
+from section_values import section_value_update
+from partitions import route_rows
+from alerting import alert_engine
+from http_cache import response_cache
+from instrumentation import metrics
+from ingest_writer import ingest_writer
+from datetime import datetime
+import json
+
+VALID_TYPES = ['temperature', 'ph', 'oxygen']
+
+# Plages de valeurs acceptées par type de lecture
+VALUE_RANGES = {
+    'temperature': (15, 35, 'Température doit être entre 15°C et 35°C'),
+    'ph': (0, 14, 'pH doit être entre 0 et 14'),
+    'oxygen': (0, 20, 'Oxygène doit être entre 0 et 20 mg/L'),
+}
+
+def validate_reading(reading_type, value):
+    """Validate a reading, return (value, None) or (None, error message)"""
+    if reading_type not in VALID_TYPES:
+        return None, 'Type de lecture invalide'
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None, 'Valeur invalide'
+    low, high, message = VALUE_RANGES[reading_type]
+    if not (low <= value <= high):
+        return None, message
+    return value, None
+
+def parse_timestamp(value):
+    """ISO 8601 timestamp as a naive local datetime, like datetime.now().
+
+    An offset ('Z', '+02:00') is converted to local time rather than
+    dropped, so that aware and naive timestamps compare and sort together.
+    Raises TypeError or ValueError when the value is not a timestamp.
+    """
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return timestamp
+
+def parse_batch(body, content_type):
+    """Return the list of items of a batch request body.
+
+    Accepts a JSON array, an object with a "readings" array, or NDJSON
+    (one object per line). Unparseable NDJSON lines are returned as None
+    so they are reported as rejected at their position.
+    """
+    if 'ndjson' in (content_type or ''):
+        items = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)
+        return items
+
+    data = json.loads(body)
+    if isinstance(data, dict):
+        data = data.get('readings')
+    if not isinstance(data, list):
+        raise ValueError('Un tableau de lectures est requis')
+    return data
+
+# Même (section, type, timestamp) qu'une lecture du lot ou déjà enregistrée
+DUPLICATE = {'status': 409, 'error': 'Lecture en double', 'duplicate': True}
+
+def _site_id(item):
+    try:
+        return int(item['site_id'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def ingest_batch(items):
+    """Validate and insert a batch of readings in one transaction.
+
+    Sections are resolved with one query, the rows go through a single Core
+    executemany. Returns one result per item, in order; an item already
+    stored is a 409 with duplicate: true.
+    """
+    results = [None] * len(items)
+
+    site_ids = {_site_id(item) for item in items} - {None}
+    sections = {}
+    if site_ids:
+        for section in SiteSection.query.filter(SiteSection.site_id.in_(site_ids)):
+            sections[(section.site_id, section.section_name)] = section
+
+    now = datetime.now()
+    readings = []
+    positions = []  # index de chaque lecture de `readings` dans `items`
+    seen = set()
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not all(k in item for k in ['site_id', 'section_name', 'reading_type', 'value']):
+            results[index] = {'index': index, 'status': 400, 'error': 'Données manquantes'}
+            continue
+        if not isinstance(item['section_name'], str):
+            results[index] = {'index': index, 'status': 400, 'error': 'section_name invalide'}
+            continue
+
+        section = sections.get((_site_id(item), item['section_name']))
+        if not section:
+            results[index] = {'index': index, 'status': 404, 'error': 'Section non trouvée'}
+            continue
+
+        value, error = validate_reading(item['reading_type'], item['value'])
+        if error:
+            results[index] = {'index': index, 'status': 400, 'error': error}
+            continue
+
+        timestamp = now
+        if item.get('timestamp'):
+            try:
+                timestamp = parse_timestamp(item['timestamp'])
+            except (TypeError, ValueError):
+                results[index] = {'index': index, 'status': 400, 'error': 'Timestamp invalide'}
+                continue
+
+        # Une seule lecture par (section, type, timestamp), cf. ux_sensor_reading_section_type_ts
+        key = (section.id, item['reading_type'], timestamp)
+        if key in seen:
+            results[index] = DUPLICATE | {'index': index}
+            continue
+        seen.add(key)
+
+        readings.append(make_reading(section, item['reading_type'], value, timestamp))
+        positions.append(index)
+
+    for index, row_id in zip(positions, write_readings(readings)):
+        # Déjà enregistrée (INSERT OR IGNORE) : rien n'a été écrit
+        results[index] = {'index': index, 'status': 201} if row_id is not None else DUPLICATE | {'index': index}
+    return results
+
+def make_reading(section, reading_type, value, timestamp):
+    """Row accepted by write_readings"""
+    return {
+        'section_id': section.id,
+        'site_id': section.site_id,
+        'section_name': section.section_name,
+        'reading_type': reading_type,
+        'value': value,
+        'timestamp': timestamp
+    }
+
+def insert_readings(rows, refresh_rollups_in_sql=False):
+    """INSERT OR IGNORE rows into their reading table and fold them into the rollups.
+
+    Each row goes to sensor_reading or its month partition (see
+    partitions.route_rows). Rows colliding with an existing (section, type, timestamp) are skipped:
+    RETURNING tells which rows were actually inserted, and only those reach the rollups.
+    Runs in the caller's transaction and returns the id of each row, None when skipped
+    (ids are per table). Bulk imports pass refresh_rollups_in_sql to re-aggregate the
+    touched buckets with INSERT ... SELECT instead of upserting from Python.
+    """
+    ids = {}
+    for table, group in route_rows(rows).items():
+        statement = (table.insert().prefix_with('OR IGNORE')
+                     .returning(table.c.id, table.c.section_id, table.c.reading_type, table.c.timestamp))
+        for row_id, section_id, reading_type, timestamp in db.session.execute(statement, group):
+            ids[(section_id, reading_type, timestamp)] = row_id
+    # pop : une clé répétée dans `rows` n'est insérée qu'une fois
+    row_ids = [ids.pop((row['section_id'], row['reading_type'], row['timestamp']), None) for row in rows]
+    rows = [row for row, row_id in zip(rows, row_ids) if row_id is not None]
+    if not refresh_rollups_in_sql:
+        update_rollups(rows)
+        return row_ids
+
+    # Avant le watermark de rétention, les buckets ne peuvent plus être recalculés
+    # depuis les lectures brutes : on y ajoute les lignes insérées
+    watermarks = raw_watermarks()
+    if watermarks:
+        purged = [row for row in rows if row['timestamp'] < watermarks.get(row['reading_type'], row['timestamp'])]
+        if purged:
+            update_rollups(purged)
+            rows = [row for row in rows if row['timestamp'] >= watermarks.get(row['reading_type'], row['timestamp'])]
+
+    # Import en masse : recalculer les buckets touchés
+    spans = {}
+    for row in rows:
+        key = (row['section_id'], row['reading_type'])
+        start, end = spans.get(key, (row['timestamp'], row['timestamp']))
+        spans[key] = (min(start, row['timestamp']), max(end, row['timestamp']))
+    for (section_id, reading_type), (start, end) in spans.items():
+        refresh_rollups(section_id, reading_type, start, end)
+    return row_ids
+
+def newest_readings(readings):
+    """{(section_id, reading_type): most recent reading}"""
+    newest = {}
+    for reading in readings:
+        key = (reading['section_id'], reading['reading_type'])
+        if key not in newest or reading['timestamp'] >= newest[key]['timestamp']:
+            newest[key] = reading
+    return newest
+
+def store_readings(groups):
+    """Insert groups of validated readings and update the sections' current values.
+
+    One transaction for all the groups: a Core executemany per group for
+    the readings (see insert_readings), then one UPDATE per (section, type)
+    with the newest value only. The alert rules are evaluated once the
+    transaction is committed. Duplicates of stored readings are left out of
+    both. Returns the ids of each group (see insert_readings).
+    """
+    try:
+        ids = [insert_readings([{
+            'section_id': r['section_id'],
+            'reading_type': r['reading_type'],
+            'value': r['value'],
+            'timestamp': r['timestamp']
+        } for r in group]) for group in groups]
+        readings = inserted_readings([reading for group in groups for reading in group],
+                                     [row_id for group_ids in ids for row_id in group_ids])
+        for (section_id, reading_type), reading in newest_readings(readings).items():
+            db.session.execute(section_value_update(section_id, reading_type, reading['value'], reading['timestamp']))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    alert_engine.evaluate(sorted(readings, key=lambda r: r['timestamp']))
+    return ids
+
+def store_history(rows):
+    """Commit one chunk of a history import (see history_import); returns the ids of its rows.
+
+    Same transaction as store_readings for the current values: the newest
+    inserted row of each (section, type) moves them forward, never back.
+    No alert is evaluated for past values.
+    """
+    try:
+        ids = insert_readings(rows, refresh_rollups_in_sql=True)
+        for (section_id, reading_type), row in newest_readings(inserted_readings(rows, ids)).items():
+            db.session.execute(section_value_update(section_id, reading_type, row['value'], row['timestamp']))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return ids
+
+def inserted_readings(readings, ids):
+    """The readings that were inserted, given their ids from insert_readings"""
+    return [reading for reading, row_id in zip(readings, ids) if row_id is not None]
+
+def write_readings(readings, source='readings'):
+    """Store validated readings, then update the latest readings cache.
+
+    In this process, or by the writer process when INGEST_WRITER_ENABLED
+    (see ingest_writer): the call returns once the readings are committed.
+    `source` labels the rows in backapp_ingested_rows_total. Returns the
+    id of each reading, None for a duplicate of a stored reading: those
+    are not propagated to the caches and live streams.
+    """
+    if not readings:
+        return []
+
+    if ingest_writer.enabled:
+        ids = ingest_writer.write(readings)
+    else:
+        ids = store_readings([readings])[0]
+
+    inserted = inserted_readings(readings, ids)
+    metrics.count_ingested(len(inserted), source)
+    for reading in newest_readings(inserted).values():
+        reading_committed(reading['site_id'], reading['section_name'],
+                          reading['reading_type'], reading['value'], reading['timestamp'])
+    return ids
+
+def reading_committed(site_id, section_name, reading_type, value, timestamp):
+    """Propagate a committed reading to the latest readings cache, the site response cache and the live streams"""
+    latest_cache.update(site_id, section_name, reading_type, value, timestamp)
+    response_cache.invalidate(('site', site_id))
+    live_hub.publish(site_id, section_name, reading_type, value, timestamp)
\ No newline at end of file
@@ -1,28 +1,49 @@
 from models import db, Site, SiteSection, User
+import section_values  # colonnes numériques temperature_value, ph_value, oxygen_value
+# Tables déclarées hors de models : create_all ne crée que les modèles importés
+import alerting, device_commands, partitions, rollups
+from migrations import run_migrations
+from passwords import password_hasher
+from flask.cli import with_appcontext
 from datetime import datetime
+import click
+import logging
 
-_initialized = False
+logger = logging.getLogger(__name__)
+
+def init_database(reset=False, demo=True):
+    """Create the schema, apply pending migrations and add the demo data.
+
+    Idempotent: run once per deployment (flask init-db, or serve.py before
+    starting the workers), not by every worker. Returns the migrations applied.
+    """
+    if reset:
+        db.drop_all()
+        logger.info("Database reset completed")
+    db.create_all()
+    applied = run_migrations()
+    if demo:
+        init_demo_data()
+    return applied
 
 def init_demo_data():
-    global _initialized
-    if _initialized:
-        return
-        
+    """Demo user with three sites, created only when that user has no site yet"""
     try:
         # Check if test user already exists
         test_user = User.query.filter_by(email='test@example.com').first()
         if not test_user:
             test_user = User(
                 email='test@example.com',
-                password_hash='test123',
+                password_hash=password_hasher.hash('test123'),
                 name='Test User'
             )
             db.session.add(test_user)
             db.session.flush()
         
-        # Clear existing sites and sections for this user
-        Site.query.filter_by(user_id=test_user.id).delete()
-        db.session.commit()
+        # Sites déjà présents : rien n'est supprimé ni recréé
+        if Site.query.filter_by(user_id=test_user.id).first():
+            db.session.commit()
+            return
         
         # Create sites
         sites = [
@@ -44,17 +65,25 @@ def init_demo_data():
                     site_id=site.id,
                     section_name=section_name,
                     status='En marche',
-                    temperature='24.0°C',
-                    ph_level='7.0',
-                    oxygen_level='6.0 mg/L'
+                    temperature_value=24.0,
+                    ph_value=7.0,
+                    oxygen_value=6.0
                 )
                 db.session.add(section)
         
         db.session.commit()
-        _initialized = True
-        print("Données de démonstration initialisées avec succès")
+        logger.info("Données de démonstration initialisées avec succès")
         
     except Exception as e:
         db.session.rollback()
-        print(f"Erreur lors de l'initialisation des données: {e}")
+        logger.error(f"Erreur lors de l'initialisation des données: {e}")
         raise  # Re-raise the exception for debugging
+
+@click.command('init-db')
+@click.option('--reset', is_flag=True, help='Supprimer toutes les tables avant de les recréer')
+@click.option('--no-demo', is_flag=True, help='Sans les données de démonstration')
+@with_appcontext
+def init_db_command(reset, no_demo):
+    """Créer le schéma, appliquer les migrations et les données de démonstration."""
+    applied = init_database(reset=reset, demo=not no_demo)
+    click.echo(f"Base initialisée, migrations appliquées : {', '.join(applied) or 'aucune'}")
@@ -0,0 +1,245 @@
+from models import db
+from flask import request, Response
+from sqlalchemy import event
+from bisect import bisect_left
+import json
+import logging
+import random
+import threading
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+# Bornes des histogrammes : secondes (valeurs par défaut des clients Prometheus) et requêtes SQL
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+def log_event(log, level, event_name, sample_rate=1.0, **fields):
+    """Log `event_name` followed by key=value fields (logfmt).
+
+    Keeps about one call in 1/sample_rate; nothing is formatted when the
+    level is disabled or the call is not sampled.
+    """
+    if not log.isEnabledFor(level) or (sample_rate < 1 and random.random() >= sample_rate):
+        return
+    pairs = ' '.join(f'{key}={json.dumps(value, default=str, ensure_ascii=False)}' for key, value in fields.items())
+    log.log(level, '%s %s', event_name, pairs)
+
+def configure_logging(level):
+    """Root handler for the application loggers, unless the server already installed one (gunicorn)"""
+    root = logging.getLogger()
+    if not root.handlers:
+        logging.basicConfig(format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    root.setLevel(level)
+
+class Histogram:
+    """Cumulative histogram in the Prometheus sense (observations <= each bound)"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # dernier seau : +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def copy(self):
+        other = Histogram(self.buckets)
+        other.counts, other.sum, other.count = self.counts[:], self.sum, self.count
+        return other
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+class RouteStats:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.sql_seconds = 0.0
+        self.statuses = {}
+
+class Metrics:
+    """Per-route request latency, SQL statements per request and ingested rows.
+
+    SQL statements are counted by engine events into a per-thread
+    accumulator opened by each request, so statements are attributed to
+    the route that ran them without any lock on the hot path; they are
+    added to the process totals when the request finishes. Statements run
+    outside a request (background workers, streamed bodies) take the lock.
+    Values are per process: each worker exposes its own /metrics.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.slow_request_ms = None
+        self.log_sample_rate = 0.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._routes = {}  # (method, route) -> RouteStats
+        self._ingested = {}  # source -> lignes insérées
+        self._sql_queries = 0
+        self._sql_seconds = 0.0
+        self._collectors = {}  # préfixe -> fonction stats() des caches et files
+        self._engines = weakref.WeakSet()
+        self.startup_seconds = None  # durée du dernier create_app du processus
+
+    def configure(self, enabled=True, slow_request_ms=None, log_sample_rate=0.0):
+        with self._lock:
+            self.enabled = enabled
+            self.slow_request_ms = slow_request_ms
+            self.log_sample_rate = log_sample_rate
+            self._routes.clear()
+            self._ingested.clear()
+            self._sql_queries, self._sql_seconds = 0, 0.0
+
+    def register_collector(self, name, stats):
+        """Expose the numeric values of `stats()` as gauges named backapp_<name>_<key>"""
+        with self._lock:
+            self._collectors[name] = stats
+
+    def instrument_engine(self, engine):
+        with self._lock:
+            if engine in self._engines:
+                return
+            self._engines.add(engine)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info['query_start'] = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info.pop('query_start', time.perf_counter())
+        current = getattr(self._local, 'request', None)
+        if current is not None:
+            current[0] += 1
+            current[1] += elapsed
+            return
+        with self._lock:
+            self._sql_queries += 1
+            self._sql_seconds += elapsed
+
+    def start_request(self):
+        # [requêtes SQL, secondes SQL, début]
+        self._local.request = [0, 0.0, time.perf_counter()]
+
+    def finish_request(self, method, route, status):
+        """Record the request opened by start_request(); returns (ms, SQL statements, SQL ms) or None"""
+        current = getattr(self._local, 'request', None)
+        self._local.request = None
+        if current is None:
+            return None
+        queries, sql_seconds, started = current
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            stats = self._routes.get((method, route))
+            if stats is None:
+                stats = self._routes[(method, route)] = RouteStats()
+            stats.latency.observe(elapsed)
+            stats.queries.observe(queries)
+            stats.sql_seconds += sql_seconds
+            self._sql_queries += queries
+            self._sql_seconds += sql_seconds
+            status_class = f'{status // 100}xx'
+            stats.statuses[status_class] = stats.statuses.get(status_class, 0) + 1
+        return elapsed * 1000, queries, sql_seconds * 1000
+
+    def count_ingested(self, rows, source):
+        if rows:
+            with self._lock:
+                self._ingested[source] = self._ingested.get(source, 0) + rows
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            routes = [(key, stats.latency.copy(), stats.queries.copy(), stats.sql_seconds, dict(stats.statuses))
+                      for key, stats in sorted(self._routes.items())]
+            ingested = sorted(self._ingested.items())
+            sql_queries, sql_seconds = self._sql_queries, self._sql_seconds
+            collectors = list(self._collectors.items())
+            startup_seconds = self.startup_seconds
+
+        lines = ['# HELP backapp_request_duration_seconds Request latency (streamed bodies: until the first byte)',
+                 '# TYPE backapp_request_duration_seconds histogram']
+        query_lines = ['# HELP backapp_request_sql_queries SQL statements run by one request',
+                       '# TYPE backapp_request_sql_queries histogram']
+        sql_time_lines = ['# HELP backapp_request_sql_seconds_total Time spent in SQL statements by route',
+                          '# TYPE backapp_request_sql_seconds_total counter']
+        status_lines = ['# HELP backapp_requests_total Requests by route and status class',
+                        '# TYPE backapp_requests_total counter']
+        for (method, route), latency, queries, route_sql, statuses in routes:
+            labels = f'method="{method}",route="{route}"'
+            lines += latency.render('backapp_request_duration_seconds', labels)
+            query_lines += queries.render('backapp_request_sql_queries', labels)
+            sql_time_lines.append(f'backapp_request_sql_seconds_total{{{labels}}} {route_sql:.6f}')
+            status_lines += [f'backapp_requests_total{{{labels},status="{status}"}} {count}'
+                             for status, count in sorted(statuses.items())]
+        lines += query_lines + sql_time_lines + status_lines
+
+        lines += ['# HELP backapp_sql_queries_total SQL statements, requests and background workers',
+                  '# TYPE backapp_sql_queries_total counter',
+                  f'backapp_sql_queries_total {sql_queries}',
+                  '# TYPE backapp_sql_seconds_total counter',
+                  f'backapp_sql_seconds_total {sql_seconds:.6f}',
+                  '# HELP backapp_ingested_rows_total Sensor readings inserted, by ingestion path',
+                  '# TYPE backapp_ingested_rows_total counter']
+        lines += [f'backapp_ingested_rows_total{{source="{source}"}} {rows}' for source, rows in ingested]
+        if startup_seconds is not None:
+            lines += ['# HELP backapp_startup_seconds Duration of create_app in this worker',
+                      '# TYPE backapp_startup_seconds gauge', f'backapp_startup_seconds {startup_seconds:.6f}']
+
+        for name, stats in collectors:
+            for key, value in stats().items():
+                # Valeurs numériques seulement (pas les rapports imbriqués ni les booléens)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines += [f'# TYPE backapp_{name}_{key} gauge', f'backapp_{name}_{key} {value}']
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+def _start_request():
+    if metrics.enabled:
+        metrics.start_request()
+
+def _finish_request(response):
+    if not metrics.enabled:
+        return response
+    # Modèle de la route (/api/sites/<int:site_id>) : une série par route, pas par URL
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    recorded = metrics.finish_request(request.method, route, response.status_code)
+    if recorded is None:
+        return response
+    elapsed_ms, queries, sql_ms = recorded
+    fields = dict(method=request.method, route=route, status=response.status_code,
+                  ms=round(elapsed_ms, 2), sql_queries=queries, sql_ms=round(sql_ms, 2))
+    if metrics.slow_request_ms is not None and elapsed_ms >= metrics.slow_request_ms:
+        log_event(logger, logging.WARNING, 'slow_request', path=request.path, **fields)
+    else:
+        log_event(logger, logging.INFO, 'request', sample_rate=metrics.log_sample_rate, **fields)
+    return response
+
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def instrument_app(app):
+    """Time every request of the app, count its SQL statements and serve GET /metrics"""
+    metrics.configure(
+        enabled=app.config['METRICS_ENABLED'],
+        slow_request_ms=app.config['SLOW_REQUEST_MS'],
+        log_sample_rate=app.config['LOG_SAMPLE_RATE']
+    )
+    with app.app_context():
+        metrics.instrument_engine(db.engine)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint)
\ No newline at end of file
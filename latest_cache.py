@@ -0,0 +1,164 @@
+from collections import OrderedDict
+from models import SiteSection
+from sensor_queries import latest_readings, latest_readings_by_section
+import threading
+import time
+
+class LatestReadingsCache:
+    """Process-level "current state" of each section, maintained on write.
+
+    Values are indexed by (site_id, section_name, reading_type); eviction is
+    LRU at the section level so inactive sections leave the cache first.
+    A value is only replaced by a reading with an equal or newer timestamp,
+    so late historical imports never roll the current state back.
+
+    Each worker process has its own copy. When several processes write to
+    the same database, set `ttl` so entries written elsewhere get re-read.
+
+    Readings committed while a section is being loaded are kept aside and
+    merged when the load stores its result: the database read may have
+    started before their commit.
+    """
+
+    def __init__(self, max_sections=10000, ttl=None):
+        self.max_sections = max_sections
+        self.ttl = ttl
+        self._sections = OrderedDict()  # (site_id, section_name) -> (loaded_at, {type: (value, ts)})
+        self._lock = threading.Lock()
+        self._loading = {}  # (site_id, section_name) -> chargements en cours ; None : warm()
+        self._pending = {}  # (site_id, section_name) -> {type: (value, ts)} reçus pendant un chargement
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, max_sections=None, ttl=None):
+        with self._lock:
+            if max_sections is not None:
+                self.max_sections = max_sections
+            self.ttl = ttl
+            self._evict()
+
+    def update(self, site_id, section_name, reading_type, value, timestamp):
+        """Record a committed reading.
+
+        Sections that are not cached are left alone: a partial entry would
+        hide the other reading types, the next read loads the full state.
+        While a load is in progress the reading is kept for set_section.
+        """
+        key = (site_id, section_name)
+        with self._lock:
+            entry = self._sections.get(key)
+            if entry is None:
+                if key in self._loading or None in self._loading:
+                    self._merge(self._pending.setdefault(key, {}), reading_type, value, timestamp)
+                return
+            self._merge(entry[1], reading_type, value, timestamp)
+            self._sections.move_to_end(key)
+
+    def set_section(self, site_id, section_name, readings):
+        """Store the state of a section read from the database, {reading_type: (value, ts)}; returns the merged state"""
+        key = (site_id, section_name)
+        with self._lock:
+            entry = self._sections.get(key)
+            values = dict(entry[1]) if entry else {}
+            for reading_type, (value, timestamp) in readings.items():
+                self._merge(values, reading_type, value, timestamp)
+            # Lectures validées après le début de la lecture en base
+            for reading_type, (value, timestamp) in self._pending.get(key, {}).items():
+                self._merge(values, reading_type, value, timestamp)
+            self._sections[key] = (time.monotonic(), values)
+            self._sections.move_to_end(key)
+            self._evict()
+            return values
+
+    @staticmethod
+    def _merge(values, reading_type, value, timestamp):
+        current = values.get(reading_type)
+        if current is None or current[1] is None or timestamp is None or timestamp >= current[1]:
+            values[reading_type] = (value, timestamp)
+
+    def get(self, site_id, section_name):
+        """Return {reading_type: value} or None on a miss"""
+        key = (site_id, section_name)
+        with self._lock:
+            entry = self._sections.get(key)
+            if entry is None or (self.ttl is not None and time.monotonic() - entry[0] > self.ttl):
+                self.misses += 1
+                return None
+            self._sections.move_to_end(key)
+            self.hits += 1
+            return {reading_type: value for reading_type, (value, _) in entry[1].items()}
+
+    def invalidate(self, site_id=None, section_name=None):
+        with self._lock:
+            if site_id is None:
+                self._sections.clear()
+            else:
+                self._sections.pop((site_id, section_name), None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'sections': len(self._sections),
+                'max_sections': self.max_sections,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None
+            }
+
+    def _evict(self):
+        while len(self._sections) > self.max_sections:
+            self._sections.popitem(last=False)
+            self.evictions += 1
+
+    def _begin_load(self, key):
+        with self._lock:
+            self._loading[key] = self._loading.get(key, 0) + 1
+
+    def _end_load(self, key):
+        with self._lock:
+            self._loading[key] -= 1
+            if not self._loading[key]:
+                del self._loading[key]
+            if None in self._loading:
+                return
+            for pending in ([key] if key is not None else list(self._pending)):
+                if pending not in self._loading:
+                    self._pending.pop(pending, None)
+
+    def load(self, site_id, section_name):
+        """Read a section from the database into the cache (cache miss path).
+
+        Returns None when the section does not exist. Registered before the
+        first query, so that the read snapshot starts after it.
+        """
+        key = (site_id, section_name)
+        self._begin_load(key)
+        try:
+            section = SiteSection.query.filter_by(site_id=site_id, section_name=section_name).first()
+            if not section:
+                return None
+            readings = self.set_section(site_id, section_name, latest_readings(section.id))
+            return {reading_type: value for reading_type, (value, _) in readings.items()}
+        finally:
+            self._end_load(key)
+
+    def warm(self):
+        """Fill the cache from the database, up to max_sections sections, in two statements"""
+        self._begin_load(None)
+        try:
+            sections = (SiteSection.query
+                        .with_entities(SiteSection.id, SiteSection.site_id, SiteSection.section_name)
+                        .order_by(SiteSection.id)
+                        .limit(self.max_sections)
+                        .all())
+            latest = latest_readings_by_section(self.max_sections)
+            for section_id, site_id, section_name in sections:
+                self.set_section(site_id, section_name, latest.get(section_id, {}))
+            return len(sections)
+        finally:
+            self._end_load(None)
+
+latest_cache = LatestReadingsCache()
\ No newline at end of file
@@ -0,0 +1,164 @@
+from collections import OrderedDict
+import json
+import threading
+import time
+
+class TooManySubscribers(Exception):
+    """Raised when the hub already serves max_subscribers streams"""
+
+class Subscriber:
+    """Pending events of one live stream client.
+
+    Events are keyed by (section_name, reading_type): a newer reading
+    replaces the one not yet sent (coalescing), so a slow client gets the
+    current state rather than a backlog. At most `max_pending` keys are
+    held; beyond that the oldest pending event is dropped.
+    """
+
+    def __init__(self, site_id, section_name=None, max_pending=100):
+        self.site_id = site_id
+        self.section_name = section_name
+        self.max_pending = max_pending
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self.closed = False
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def offer(self, key, frame):
+        with self._cond:
+            if key in self._pending:
+                self.coalesced += 1
+                self._pending[key] = frame
+            else:
+                if len(self._pending) >= self.max_pending:
+                    self._pending.popitem(last=False)
+                    self.dropped += 1
+                self._pending[key] = frame
+            self._cond.notify()
+
+    def wait(self, timeout):
+        """Return the pending frames, waiting up to `timeout` seconds for one"""
+        with self._cond:
+            if not self._pending and not self.closed:
+                self._cond.wait(timeout)
+            frames = list(self._pending.values())
+            self._pending.clear()
+            self.sent += len(frames)
+            return frames
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+class LiveHub:
+    """Fan-out of committed readings to the live stream subscribers of this process.
+
+    publish() is called once a reading is committed; the SSE frame is
+    encoded once and offered to every subscriber of the site (optionally
+    filtered on a section). Like latest_cache, each worker process has its
+    own hub and only sees the readings written by that process.
+    """
+
+    def __init__(self, max_subscribers=2000, max_pending=100):
+        self.max_subscribers = max_subscribers
+        self.max_pending = max_pending
+        self._sites = {}  # site_id -> set of Subscriber
+        self._count = 0
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+
+    def configure(self, max_subscribers=None, max_pending=None):
+        with self._lock:
+            if max_subscribers is not None:
+                self.max_subscribers = max_subscribers
+            if max_pending is not None:
+                self.max_pending = max_pending
+
+    def subscribe(self, site_id, section_name=None):
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise TooManySubscribers('Trop de flux ouverts')
+            subscriber = Subscriber(site_id, section_name, self.max_pending)
+            self._sites.setdefault(site_id, set()).add(subscriber)
+            self._count += 1
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._sites.get(subscriber.site_id)
+            if subscribers and subscriber in subscribers:
+                subscribers.discard(subscriber)
+                self._count -= 1
+                if not subscribers:
+                    del self._sites[subscriber.site_id]
+        subscriber.close()
+
+    def publish(self, site_id, section_name, reading_type, value, timestamp):
+        with self._lock:
+            subscribers = list(self._sites.get(site_id, ()))
+            self.published += 1
+        if not subscribers:
+            return 0
+
+        frame = sse_frame('reading', {
+            'site_id': site_id,
+            'section_name': section_name,
+            'type': reading_type,
+            'value': value,
+            'timestamp': timestamp.isoformat() if timestamp else None
+        })
+        key = (section_name, reading_type)
+        delivered = 0
+        for subscriber in subscribers:
+            if subscriber.section_name is None or subscriber.section_name == section_name:
+                subscriber.offer(key, frame)
+                delivered += 1
+        with self._lock:
+            self.delivered += delivered
+        return delivered
+
+    def stats(self):
+        with self._lock:
+            subscribers = [s for site in self._sites.values() for s in site]
+            return {
+                'subscribers': self._count,
+                'max_subscribers': self.max_subscribers,
+                'max_pending': self.max_pending,
+                'published': self.published,
+                'delivered': self.delivered,
+                'coalesced': sum(s.coalesced for s in subscribers),
+                'dropped': sum(s.dropped for s in subscribers)
+            }
+
+def sse_frame(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+def sse_stream(hub, subscriber, snapshot=None, coalesce_ms=250, keepalive_s=15):
+    """Body of a text/event-stream response for one subscriber.
+
+    Frames are sent at most every `coalesce_ms` milliseconds; readings
+    arriving in between are merged by the subscriber. A comment line is
+    sent every `keepalive_s` seconds without data so proxies keep the
+    connection open. The subscriber is removed when the client goes away.
+    """
+    try:
+        yield 'retry: 3000\n\n'
+        if snapshot:
+            yield sse_frame('snapshot', snapshot)
+        while not subscriber.closed:
+            frames = subscriber.wait(keepalive_s)
+            if frames:
+                yield ''.join(frames)
+                # Les lectures reçues pendant la pause sont fusionnées par le subscriber
+                if coalesce_ms:
+                    time.sleep(coalesce_ms / 1000)
+            else:
+                yield ': keepalive\n\n'
+    finally:
+        hub.unsubscribe(subscriber)
+
+live_hub = LiveHub()
\ No newline at end of file
@@ -0,0 +1,91 @@
+from models import db
+from sqlalchemy import text
+from datetime import datetime
+
+def add_column(table, column, type_):
+    """Migration step: ALTER TABLE ADD COLUMN, skipped when create_all already created it"""
+    def step(conn):
+        columns = {row[1] for row in conn.execute(text(f'PRAGMA table_info({table})'))}
+        if column not in columns:
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {type_}'))
+    return step
+
+# Migrations appliquées après db.create_all(), dans l'ordre.
+# Chaque entrée est (nom, [instructions SQL ou fonctions(conn)]) et n'est exécutée qu'une seule fois.
+MIGRATIONS = [
+    ('0001_sensor_reading_latest_index', [
+        # Index couvrant : (section, type) -> dernière valeur par timestamp,
+        # sans retour à la table grâce à la colonne value en fin d'index
+        'CREATE INDEX IF NOT EXISTS ix_sensor_reading_section_type_ts '
+        'ON sensor_reading (section_id, reading_type, timestamp, value)',
+    ]),
+    ('0002_sensor_reading_unique_timestamp', [
+        # Une seule lecture par (section, type, timestamp) : on garde la plus ancienne
+        'DELETE FROM sensor_reading WHERE id NOT IN ('
+        'SELECT MIN(id) FROM sensor_reading GROUP BY section_id, reading_type, timestamp)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS ux_sensor_reading_section_type_ts '
+        'ON sensor_reading (section_id, reading_type, timestamp)',
+    ]),
+    ('0003_site_section_numeric_values', [
+        # Valeurs actuelles en FLOAT (cf. section_values), reprises des anciennes
+        # chaînes formatées : CAST garde le préfixe numérique de '24.0°C'
+        add_column('site_section', 'temperature_value', 'FLOAT'),
+        add_column('site_section', 'ph_value', 'FLOAT'),
+        add_column('site_section', 'oxygen_value', 'FLOAT'),
+        "UPDATE site_section SET temperature_value = CAST(temperature AS REAL) "
+        "WHERE temperature_value IS NULL AND temperature GLOB '*[0-9]*'",
+        "UPDATE site_section SET ph_value = CAST(ph_level AS REAL) "
+        "WHERE ph_value IS NULL AND ph_level GLOB '*[0-9]*'",
+        "UPDATE site_section SET oxygen_value = CAST(oxygen_level AS REAL) "
+        "WHERE oxygen_value IS NULL AND oxygen_level GLOB '*[0-9]*'",
+        'CREATE INDEX IF NOT EXISTS ix_site_section_temperature_value ON site_section (temperature_value)',
+        'CREATE INDEX IF NOT EXISTS ix_site_section_ph_value ON site_section (ph_value)',
+        'CREATE INDEX IF NOT EXISTS ix_site_section_oxygen_value ON site_section (oxygen_value)',
+    ]),
+    ('0004_site_section_updated_at', [
+        # Version des valeurs actuelles, pour les réponses conditionnelles (cf. http_cache)
+        add_column('site_section', 'updated_at', 'DATETIME'),
+    ]),
+    ('0005_site_and_section_parent_indexes', [
+        # Sites d'un utilisateur et sections d'un site : chaque entrée d'index porte aussi le
+        # rowid, l'index sert donc aussi la pagination par id (WHERE user_id = ? AND id > ? ORDER BY id)
+        'CREATE INDEX IF NOT EXISTS ix_site_user_id ON site (user_id)',
+        'CREATE INDEX IF NOT EXISTS ix_site_section_site_id ON site_section (site_id)',
+    ]),
+    ('0006_site_section_value_timestamps', [
+        # Instant de la lecture de chaque valeur actuelle : les valeurs n'avancent que dans le temps
+        add_column('site_section', 'temperature_at', 'DATETIME'),
+        add_column('site_section', 'ph_at', 'DATETIME'),
+        add_column('site_section', 'oxygen_at', 'DATETIME'),
+    ]),
+    ('0007_device_command_action', [
+        # Action demandée avec une clé d'idempotence, comparée lors d'un rejeu
+        add_column('device_command', 'action', 'VARCHAR(10)'),
+    ]),
+]
+
+def run_migrations(engine=None):
+    """Apply pending schema migrations and return the names applied"""
+    engine = engine or db.engine
+    applied_now = []
+    with engine.begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_migrations ('
+            'name VARCHAR(100) PRIMARY KEY, applied_at DATETIME NOT NULL)'
+        ))
+        applied = {row[0] for row in conn.execute(text('SELECT name FROM schema_migrations'))}
+
+        for name, statements in MIGRATIONS:
+            if name in applied:
+                continue
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(text(statement))
+            conn.execute(
+                text('INSERT INTO schema_migrations (name, applied_at) VALUES (:name, :applied_at)'),
+                {'name': name, 'applied_at': datetime.now()}
+            )
+            applied_now.append(name)
+    return applied_now
\ No newline at end of file
@@ -0,0 +1,72 @@
+from flask import request, current_app
+from sqlalchemy import tuple_
+import base64
+import json
+
+class PageError(ValueError):
+    """Invalid limit, cursor, filter or field list (400)"""
+
+def encode_cursor(*values):
+    """Opaque cursor for the position after a row (its sort key)"""
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, size=1):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise PageError('Curseur invalide')
+    if not isinstance(values, list) or len(values) != size:
+        raise PageError('Curseur invalide')
+    return values
+
+def page_limit():
+    """?limit=, PAGE_DEFAULT_LIMIT by default and at most PAGE_MAX_LIMIT"""
+    limit = request.args.get('limit', current_app.config['PAGE_DEFAULT_LIMIT'], type=int)
+    if limit < 1:
+        raise PageError('limit doit être positif')
+    return min(limit, current_app.config['PAGE_MAX_LIMIT'])
+
+def selected_fields(allowed):
+    """Fields requested by ?fields=a,b (all of `allowed` when absent), in the order of `allowed`"""
+    requested = request.args.get('fields')
+    if not requested:
+        return list(allowed)
+    fields = {field.strip() for field in requested.split(',') if field.strip()}
+    unknown = fields - set(allowed)
+    if unknown:
+        raise PageError(f"Champs inconnus : {', '.join(sorted(unknown))}")
+    return [field for field in allowed if field in fields]
+
+def bool_arg(name):
+    """?name=true|false as a boolean, None when absent"""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    if value not in ('true', 'false'):
+        raise PageError(f"{name} doit valoir true ou false")
+    return value == 'true'
+
+def keyset_page(query, keys, row_key, serialize, fields):
+    """One page of `query` ordered by the integer columns `keys`, after ?cursor=.
+
+    `keys` must identify a row and follow an index so that the page is
+    read in order, without sorting what precedes it; `row_key(row)`
+    returns their values for a row. Fetches one row more than the limit
+    to know whether another page follows. Returns (items restricted to
+    `fields`, next cursor or None).
+    """
+    limit = page_limit()
+    cursor = request.args.get('cursor')
+    if cursor:
+        after = decode_cursor(cursor, len(keys))
+        if not all(isinstance(value, int) for value in after):
+            raise PageError('Curseur invalide')
+        query = query.filter(tuple_(*keys) > tuple_(*after) if len(keys) > 1 else keys[0] > after[0])
+    rows = query.order_by(*keys).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    items = []
+    for row in rows:
+        data = serialize(row)
+        items.append({field: data[field] for field in fields})
+    return items, encode_cursor(*row_key(rows[-1])) if more else None
\ No newline at end of file
@@ -0,0 +1,135 @@
+from models import db, SensorReading
+from flask import current_app
+from sqlalchemy import MetaData, Table, Column, Index, select, union_all, text
+from sqlalchemy.schema import CreateTable, CreateIndex
+from datetime import datetime
+import threading
+
+# Partitions mensuelles de sensor_reading : sensor_reading_AAAAMM, mêmes colonnes et index.
+# Actives quand READING_PARTITIONS = 'month' ; sensor_reading reste alors lue comme
+# partition par défaut (lignes antérieures au partitionnement).
+PARTITION_PREFIX = 'sensor_reading_'
+
+_metadata = MetaData()
+_tables = {}
+_lock = threading.Lock()
+
+def month_key(timestamp):
+    return f'{timestamp.year:04d}{timestamp.month:02d}'
+
+def month_bounds(key):
+    """(first instant, first instant of the next month) of a partition"""
+    year, month = int(key[:4]), int(key[4:])
+    start = datetime(year, month, 1)
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    return start, end
+
+def partition_table(key):
+    """Table object of a month partition (not necessarily created yet)"""
+    with _lock:
+        table = _tables.get(key)
+        if table is None:
+            name = PARTITION_PREFIX + key
+            # Colonnes de SensorReading, sans les clés étrangères (autre MetaData)
+            columns = [Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable)
+                       for c in SensorReading.__table__.columns]
+            table = Table(name, _metadata, *columns)
+            Index(f'ix_{name}_section_type_ts', table.c.section_id, table.c.reading_type,
+                  table.c.timestamp, table.c.value)
+            Index(f'ux_{name}_section_type_ts', table.c.section_id, table.c.reading_type,
+                  table.c.timestamp, unique=True)
+            _tables[key] = table
+        return table
+
+def partitioning_enabled():
+    return current_app.config.get('READING_PARTITIONS') == 'month'
+
+def partition_keys():
+    """Month keys of the partitions present in the database, oldest first.
+
+    Read from sqlite_master on every call, never cached: partitions are
+    created by whichever process writes first to a new month and dropped
+    by retention in another one, and a stale list either misses the newest
+    rows or queries a table that no longer exists.
+    """
+    names = db.session.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'table' "
+        "AND name GLOB 'sensor_reading_[0-9][0-9][0-9][0-9][0-9][0-9]'"
+    )).scalars()
+    return sorted(name[len(PARTITION_PREFIX):] for name in names)
+
+def reading_tables(start=None, end=None):
+    """sensor_reading and the partitions overlapping [start, end), oldest partition first"""
+    tables = [SensorReading.__table__]
+    if not partitioning_enabled():
+        return tables
+    for key in partition_keys():
+        low, high = month_bounds(key)
+        if (end is None or low < end) and (start is None or high > start):
+            tables.append(partition_table(key))
+    return tables
+
+def readings_union(columns, conditions, start=None, end=None):
+    """Subquery selecting `columns` from every table overlapping [start, end).
+
+    `conditions(table)` returns the WHERE clauses for one table. With no
+    partition the subquery reads sensor_reading alone.
+    """
+    selects = [select(*[table.c[name] for name in columns]).where(*conditions(table))
+               for table in reading_tables(start, end)]
+    return (selects[0] if len(selects) == 1 else union_all(*selects)).subquery()
+
+def readings_source_sql():
+    """FROM clause (text) for raw SQL over all the readings"""
+    tables = reading_tables()
+    if len(tables) == 1:
+        return tables[0].name
+    return '(' + ' UNION ALL '.join(
+        f'SELECT section_id, reading_type, value, timestamp FROM {table.name}' for table in tables
+    ) + ')'
+
+def route_rows(rows):
+    """Group rows by destination table.
+
+    With READING_PARTITIONS = 'month', each row goes to the partition of its
+    timestamp, created on first use in the caller's transaction. Otherwise
+    everything goes to sensor_reading.
+    """
+    if not partitioning_enabled():
+        return {SensorReading.__table__: rows}
+    groups = {}
+    for row in rows:
+        groups.setdefault(month_key(row['timestamp']), []).append(row)
+    existing = partition_keys()
+    return {_existing_partition(key, existing): group for key, group in groups.items()}
+
+def reading_table(timestamp, create=False):
+    """Table holding the readings of `timestamp`'s month.
+
+    A lookup by default: None when the month partition does not exist.
+    With create=True (write path, see route_rows) a missing partition is
+    created in the caller's transaction.
+    """
+    if not partitioning_enabled():
+        return SensorReading.__table__
+    key, existing = month_key(timestamp), partition_keys()
+    if create:
+        return _existing_partition(key, existing)
+    return partition_table(key) if key in existing else None
+
+def _existing_partition(key, existing):
+    table = partition_table(key)
+    if key not in existing:
+        create_partition(table)
+    return table
+
+def create_partition(table):
+    connection = db.session.connection()
+    connection.execute(CreateTable(table, if_not_exists=True))
+    for index in table.indexes:
+        connection.execute(CreateIndex(index, if_not_exists=True))
+
+def drop_partition(key):
+    """Drop a whole month: constant time whatever the number of rows"""
+    db.session.execute(text(f'DROP TABLE IF EXISTS {PARTITION_PREFIX}{key}'))
+    db.session.commit()
\ No newline at end of file
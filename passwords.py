@@ -0,0 +1,103 @@
+from concurrent.futures import ThreadPoolExecutor
+import base64
+import hashlib
+import hmac
+import os
+import threading
+
+SCHEME = 'scrypt'
+
+class HasherBusy(Exception):
+    """Raised when too many hash computations are already waiting"""
+
+def _b64(data):
+    return base64.b64encode(data).decode()
+
+def parse_hash(stored):
+    """'scrypt$n$r$p$salt$hash' -> (n, r, p, salt, digest), None for other values (legacy plaintext)"""
+    parts = (stored or '').split('$')
+    if len(parts) != 6 or parts[0] != SCHEME:
+        return None
+    try:
+        return int(parts[1]), int(parts[2]), int(parts[3]), base64.b64decode(parts[4]), base64.b64decode(parts[5])
+    except ValueError:
+        return None
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+class PasswordHasher:
+    """scrypt password hashing run on a bounded thread pool.
+
+    At most `workers` hashes are computed at once, so a burst of logins
+    cannot take every request thread's CPU; past `max_pending` waiting
+    computations, calls raise HasherBusy instead of queueing further.
+    The cost (n, r, p) is tunable: hashes made with other parameters, and
+    legacy plaintext values, are reported by needs_rehash().
+    """
+
+    def __init__(self, n=2 ** 14, r=8, p=1, workers=2, max_pending=64):
+        self.n = n
+        self.r = r
+        self.p = p
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def configure(self, n=None, r=None, p=None, workers=None, max_pending=None):
+        with self._lock:
+            if n is not None:
+                self.n = n
+            if r is not None:
+                self.r = r
+            if p is not None:
+                self.p = p
+            if max_pending is not None:
+                self.max_pending = max_pending
+            if workers is not None and workers != self.workers:
+                self.workers = workers
+                if self._executor:
+                    self._executor.shutdown(wait=False)
+                    self._executor = None
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HasherBusy('Trop de connexions en cours, réessayez')
+            self._pending += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hasher')
+            executor = self._executor
+        try:
+            return executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def hash(self, password):
+        salt = os.urandom(16)
+        n, r, p = self.n, self.r, self.p
+        digest = self._run(_scrypt, password, salt, n, r, p)
+        return f'{SCHEME}${n}${r}${p}${_b64(salt)}${_b64(digest)}'
+
+    def verify(self, stored, password):
+        parsed = parse_hash(stored)
+        if parsed is None:
+            # Anciens mots de passe stockés en clair, remplacés au prochain login
+            return stored is not None and hmac.compare_digest(stored.encode(), password.encode())
+        n, r, p, salt, digest = parsed
+        return hmac.compare_digest(self._run(_scrypt, password, salt, n, r, p), digest)
+
+    def needs_rehash(self, stored):
+        parsed = parse_hash(stored)
+        return parsed is None or parsed[:3] != (self.n, self.r, self.p)
+
+    def stats(self):
+        with self._lock:
+            return {'n': self.n, 'r': self.r, 'p': self.p, 'workers': self.workers,
+                    'pending': self._pending, 'max_pending': self.max_pending}
+
+password_hasher = PasswordHasher()
\ No newline at end of file
@@ -0,0 +1,249 @@
+from models import db, SiteSection
+from rollups import RawWatermark, RESOLUTIONS, bucket_start, sql_timestamp, refresh_rollups
+from partitions import readings_union, reading_tables, partition_keys, partitioning_enabled, month_bounds, drop_partition
+from sensor_queries import READING_TYPES
+from sqlalchemy import text, func
+from datetime import datetime, timedelta
+import click
+import json
+import logging
+import threading
+import time
+from flask import current_app
+from flask.cli import with_appcontext
+
+logger = logging.getLogger(__name__)
+
+def cutoff(now, days):
+    """Start of the day `days` days ago: buckets of every resolution are either wholly kept or wholly purged"""
+    return bucket_start(now - timedelta(days=days), 'day')
+
+def _delete_in_batches(statement, params, batch_size, pause):
+    """Run a DELETE ... LIMIT statement until it deletes less than a batch.
+
+    Each batch is its own short transaction, so writers only wait for one
+    batch at a time.
+    """
+    deleted = 0
+    while True:
+        try:
+            count = db.session.execute(statement, dict(params, batch_size=batch_size)).rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        deleted += count
+        if count < batch_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+# Table de lectures (sensor_reading ou partition mensuelle) passée par format()
+DELETE_RAW = (
+    'DELETE FROM {table} WHERE id IN ('
+    'SELECT id FROM {table} WHERE section_id = :section_id AND reading_type = :reading_type '
+    'AND timestamp < :before LIMIT :batch_size)'
+)
+DELETE_ROLLUP = text(
+    'DELETE FROM sensor_rollup WHERE rowid IN ('
+    'SELECT rowid FROM sensor_rollup WHERE resolution = :resolution AND section_id = :section_id '
+    'AND reading_type = :reading_type AND bucket < :before LIMIT :batch_size)'
+)
+
+# Recalcul des agrégats avant purge, par tranches de jours (transactions courtes)
+SEAL_DAYS = 7
+
+def _seal_rollups(section_id, reading_type, before, pause):
+    """Recompute from the raw rows the buckets about to lose them.
+
+    The rollups are maintained on ingest, but a database that predates
+    them (or was never backfilled) would otherwise lose that history.
+    """
+    readings = readings_union(
+        ['timestamp'],
+        lambda t: (t.c.section_id == section_id, t.c.reading_type == reading_type, t.c.timestamp < before),
+        end=before)
+    oldest = db.session.query(func.min(readings.c.timestamp)).scalar()
+    day = bucket_start(oldest, 'day') if oldest else before
+    while day < before:
+        end = min(day + timedelta(days=SEAL_DAYS), before)
+        try:
+            refresh_rollups(section_id, reading_type, day, end - timedelta(microseconds=1))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        day = end
+        if pause:
+            time.sleep(pause)
+
+def _advance_watermark(reading_type, before):
+    watermark = db.session.get(RawWatermark, reading_type)
+    if watermark is None:
+        db.session.add(RawWatermark(reading_type=reading_type, purged_before=before))
+    elif watermark.purged_before < before:
+        watermark.purged_before = before
+    db.session.commit()
+
+def _expired_partitions(raw_cutoffs):
+    """Month partitions wholly older than the raw cutoff of every reading type"""
+    if not partitioning_enabled() or any(t not in raw_cutoffs for t in READING_TYPES):
+        return []
+    before = min(raw_cutoffs.values())
+    return [key for key in partition_keys() if month_bounds(key)[1] <= before]
+
+def database_pages():
+    """(page_count, freelist_count, page_size, auto_vacuum) of the main database"""
+    return tuple(db.session.execute(text(f'PRAGMA {name}')).scalar()
+                 for name in ('page_count', 'freelist_count', 'page_size', 'auto_vacuum'))
+
+def apply_retention(policies, now=None, batch_size=5000, pause_ms=0, vacuum=True):
+    """Delete raw readings and rollups past their retention, per reading type.
+
+    `policies` maps a reading type to the number of days to keep for 'raw'
+    and each rollup resolution ('minute', 'hour', 'day'); None keeps
+    forever. The rollups of the raw rows to delete are recomputed first,
+    the type's watermark advanced (see rollups.RawWatermark), then the raw
+    rows deleted: month partitions past the cutoff of every type are
+    dropped whole, the remaining rows deleted in `batch_size` transactions.
+    Finally the free pages are given back with
+    PRAGMA incremental_vacuum when the database has auto_vacuum=INCREMENTAL.
+    Returns a report of what was deleted and reclaimed.
+    """
+    now = now or datetime.now()
+    pause = pause_ms / 1000
+    started = time.perf_counter()
+    pages_before, _, page_size, auto_vacuum = database_pages()
+    section_ids = [row[0] for row in db.session.query(SiteSection.id).order_by(SiteSection.id)]
+    db.session.commit()
+
+    report = {'types': {reading_type: {'raw_deleted': 0, 'rollups_deleted': {}} for reading_type in policies},
+              'partitions_dropped': []}
+    raw_cutoffs = {reading_type: cutoff(now, policy['raw'])
+                   for reading_type, policy in policies.items() if policy.get('raw') is not None}
+    for reading_type, before in raw_cutoffs.items():
+        # Le watermark d'abord : un import concurrent de lignes plus anciennes
+        # les ajoute aux agrégats au lieu de recalculer des buckets purgés
+        _advance_watermark(reading_type, before)
+        for section_id in section_ids:
+            _seal_rollups(section_id, reading_type, before, pause)
+
+    # Mois entièrement expirés pour tous les types : DROP TABLE, sans parcourir les lignes
+    purge_started = time.perf_counter()
+    for key in _expired_partitions(raw_cutoffs):
+        drop_partition(key)
+        report['partitions_dropped'].append(key)
+
+    for reading_type, before in raw_cutoffs.items():
+        entry = report['types'][reading_type]
+        entry['raw_before'] = before.isoformat()
+        for table in reading_tables(end=before):
+            statement = text(DELETE_RAW.format(table=table.name))
+            for section_id in section_ids:
+                entry['raw_deleted'] += _delete_in_batches(statement, {
+                    'section_id': section_id, 'reading_type': reading_type, 'before': sql_timestamp(before)
+                }, batch_size, pause)
+    report['raw_purge_s'] = round(time.perf_counter() - purge_started, 3)
+
+    for reading_type, policy in policies.items():
+        entry = report['types'][reading_type]
+        for resolution, _ in RESOLUTIONS:
+            if policy.get(resolution) is None:
+                continue
+            before = cutoff(now, policy[resolution])
+            deleted = 0
+            for section_id in section_ids:
+                deleted += _delete_in_batches(DELETE_ROLLUP, {
+                    'resolution': resolution, 'section_id': section_id,
+                    'reading_type': reading_type, 'before': sql_timestamp(before)
+                }, batch_size, pause)
+            entry['rollups_deleted'][resolution] = deleted
+
+    _, freelist_before, _, _ = database_pages()
+    # auto_vacuum : 0 = NONE, 1 = FULL, 2 = INCREMENTAL
+    if vacuum and auto_vacuum == 2 and freelist_before:
+        # Une page libérée par pas d'exécution : cursor.execute() s'arrête au premier pas,
+        # executescript() va jusqu'au bout. Le checkpoint reporte la réduction dans le fichier.
+        cursor = db.session.connection().connection.cursor()
+        try:
+            cursor.executescript('PRAGMA incremental_vacuum; PRAGMA wal_checkpoint(PASSIVE);')
+        finally:
+            cursor.close()
+        db.session.commit()
+    pages_after, freelist_after, _, _ = database_pages()
+
+    report.update({
+        'raw_deleted': sum(e['raw_deleted'] for e in report['types'].values()),
+        'rollups_deleted': sum(sum(e['rollups_deleted'].values()) for e in report['types'].values()),
+        'auto_vacuum': {0: 'NONE', 1: 'FULL', 2: 'INCREMENTAL'}.get(auto_vacuum, auto_vacuum),
+        'pages_before': pages_before,
+        'pages_after': pages_after,
+        'free_pages': freelist_after,
+        'pages_reclaimed': pages_before - pages_after,
+        'bytes_reclaimed': (pages_before - pages_after) * page_size,
+        'elapsed_s': round(time.perf_counter() - started, 3)
+    })
+    return report
+
+class RetentionWorker:
+    """Background thread running apply_retention every `interval_hours`"""
+
+    def __init__(self):
+        self._thread = None
+        self._stopping = threading.Event()
+        self.last_report = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app, interval_hours):
+        if self.running:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, args=(app, interval_hours * 3600),
+                                        name='retention', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=30):
+        self._stopping.set()
+        if self.running:
+            self._thread.join(timeout)
+
+    def _run(self, app, interval):
+        while not self._stopping.wait(interval):
+            try:
+                with app.app_context():
+                    self.last_report = apply_retention(
+                        app.config['RETENTION_POLICIES'],
+                        batch_size=app.config['RETENTION_BATCH_ROWS'],
+                        pause_ms=app.config['RETENTION_BATCH_PAUSE_MS'])
+                logger.info(f"Retention: {self.last_report['raw_deleted']} raw rows, "
+                            f"{len(self.last_report['partitions_dropped'])} partitions, "
+                            f"{self.last_report['rollups_deleted']} rollups deleted, "
+                            f"{self.last_report['pages_reclaimed']} pages reclaimed "
+                            f"in {self.last_report['elapsed_s']}s")
+            except Exception as e:
+                logger.exception(f"Retention error: {e}")
+
+retention_worker = RetentionWorker()
+
+@click.command('apply-retention')
+@click.option('--batch-size', type=int, default=None, help='Lignes supprimées par transaction')
+@click.option('--no-vacuum', is_flag=True, help='Ne pas lancer PRAGMA incremental_vacuum')
+@click.option('--enable-incremental-vacuum', is_flag=True,
+              help='Passer la base en auto_vacuum=INCREMENTAL (VACUUM complet, une seule fois)')
+@with_appcontext
+def apply_retention_command(batch_size, no_vacuum, enable_incremental_vacuum):
+    """Supprimer les lectures brutes et agrégats au-delà de RETENTION_POLICIES."""
+    if enable_incremental_vacuum:
+        click.echo("VACUUM de la base pour activer auto_vacuum=INCREMENTAL...")
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.exec_driver_sql('VACUUM')
+    report = apply_retention(
+        current_app.config['RETENTION_POLICIES'],
+        batch_size=batch_size or current_app.config['RETENTION_BATCH_ROWS'],
+        pause_ms=current_app.config['RETENTION_BATCH_PAUSE_MS'],
+        vacuum=not no_vacuum)
+    click.echo(json.dumps(report, indent=2))
\ No newline at end of file
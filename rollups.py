@@ -0,0 +1,249 @@
+from models import db
+from partitions import readings_union, readings_source_sql
+from sqlalchemy import func, cast, Integer, text, select, delete, literal
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import datetime, timedelta
+import calendar
+import click
+from flask.cli import with_appcontext
+
+# Largeur des agrégats en secondes, du plus fin au plus grossier
+RESOLUTIONS = [('minute', 60), ('hour', 3600), ('day', 86400)]
+
+# Format de bucket identique au stockage DateTime de SQLAlchemy sous SQLite
+BUCKET_FORMATS = {
+    'minute': '%Y-%m-%d %H:%M:00.000000',
+    'hour': '%Y-%m-%d %H:00:00.000000',
+    'day': '%Y-%m-%d 00:00:00.000000',
+}
+
+# Pas proposés quand le client ne précise pas de résolution
+AUTO_STEPS = [60, 300, 900, 3600, 3 * 3600, 6 * 3600, 86400, 7 * 86400]
+AUTO_POINTS = 500
+MAX_POINTS = 5000
+
+EPOCH = datetime(1970, 1, 1)
+
+class SensorRollup(db.Model):
+    """Min/avg/max of sensor_reading per section, type and time bucket"""
+    __tablename__ = 'sensor_rollup'
+
+    resolution = db.Column(db.String(10), primary_key=True)
+    section_id = db.Column(db.Integer, db.ForeignKey('site_section.id'), primary_key=True)
+    reading_type = db.Column(db.String(20), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    value_count = db.Column(db.Integer, nullable=False)
+    value_sum = db.Column(db.Float, nullable=False)
+    value_min = db.Column(db.Float, nullable=False)
+    value_max = db.Column(db.Float, nullable=False)
+
+class RawWatermark(db.Model):
+    """Raw readings of a type older than `purged_before` were deleted by retention.
+
+    Rollup buckets before the watermark are no longer backed by
+    sensor_reading: they must never be recomputed from it, only added to.
+    """
+    __tablename__ = 'raw_watermark'
+
+    reading_type = db.Column(db.String(20), primary_key=True)
+    purged_before = db.Column(db.DateTime, nullable=False)
+
+def raw_watermarks():
+    """{reading_type: purged_before} for the types touched by retention"""
+    return dict(db.session.query(RawWatermark.reading_type, RawWatermark.purged_before).all())
+
+def sql_timestamp(value):
+    """DateTime as stored by SQLAlchemy under SQLite, for text() comparisons"""
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+def bucket_start(timestamp, resolution):
+    if resolution == 'minute':
+        return timestamp.replace(second=0, microsecond=0)
+    if resolution == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def update_rollups(readings):
+    """Fold new readings into the rollups, in the caller's transaction.
+
+    `readings` are dicts with section_id, reading_type, value and timestamp.
+    They are pre-aggregated per bucket, then upserted with one executemany.
+    """
+    buckets = {}
+    for reading in readings:
+        for resolution, _ in RESOLUTIONS:
+            key = (resolution, reading['section_id'], reading['reading_type'],
+                   bucket_start(reading['timestamp'], resolution))
+            value = reading['value']
+            agg = buckets.get(key)
+            if agg is None:
+                buckets[key] = [1, value, value, value]
+            else:
+                agg[0] += 1
+                agg[1] += value
+                agg[2] = min(agg[2], value)
+                agg[3] = max(agg[3], value)
+
+    if not buckets:
+        return
+
+    table = SensorRollup.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.resolution, table.c.section_id, table.c.reading_type, table.c.bucket],
+        set_={
+            'value_count': table.c.value_count + stmt.excluded.value_count,
+            'value_sum': table.c.value_sum + stmt.excluded.value_sum,
+            'value_min': func.min(table.c.value_min, stmt.excluded.value_min),
+            'value_max': func.max(table.c.value_max, stmt.excluded.value_max),
+        }
+    )
+    db.session.execute(stmt, [{
+        'resolution': resolution,
+        'section_id': section_id,
+        'reading_type': reading_type,
+        'bucket': bucket,
+        'value_count': count,
+        'value_sum': total,
+        'value_min': low,
+        'value_max': high,
+    } for (resolution, section_id, reading_type, bucket), (count, total, low, high) in buckets.items()])
+
+def rebuild_rollups(section_id=None):
+    """Recompute the rollups from sensor_reading (backfill). Returns rows written per resolution.
+
+    Buckets older than a type's raw watermark are kept as they are: their
+    raw readings were deleted by retention.
+    """
+    params = {'section_id': section_id}
+    conditions = ['section_id = :section_id'] if section_id is not None else []
+    purged = []
+    for i, (reading_type, purged_before) in enumerate(raw_watermarks().items()):
+        purged.append(f'(reading_type = :type_{i} AND {{column}} < :purged_{i})')
+        params[f'type_{i}'] = reading_type
+        params[f'purged_{i}'] = sql_timestamp(purged_before)
+    if purged:
+        conditions.append(f"NOT ({' OR '.join(purged)})")
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    written = {}
+    try:
+        db.session.execute(text(f'DELETE FROM sensor_rollup {where_clause.format(column="bucket")}'), params)
+        for resolution, _ in RESOLUTIONS:
+            result = db.session.execute(text(
+                'INSERT INTO sensor_rollup (resolution, section_id, reading_type, bucket, '
+                'value_count, value_sum, value_min, value_max) '
+                'SELECT :resolution, section_id, reading_type, strftime(:bucket_format, timestamp), '
+                'count(*), sum(value), min(value), max(value) '
+                f'FROM {readings_source_sql()} {where_clause.format(column="timestamp")} '
+                'GROUP BY section_id, reading_type, 4'
+            ), dict(params, resolution=resolution, bucket_format=BUCKET_FORMATS[resolution]))
+            written[resolution] = result.rowcount
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return written
+
+def refresh_rollups(section_id, reading_type, start, end):
+    """Recompute from the raw readings the buckets of one series overlapping [start, end].
+
+    Used when the rows actually inserted are not known, e.g. after an
+    INSERT OR IGNORE. Runs in the caller's transaction.
+    """
+    table = SensorRollup.__table__
+    for resolution, width in RESOLUTIONS:
+        low = bucket_start(start, resolution)
+        high = bucket_start(end, resolution) + timedelta(seconds=width)
+        db.session.execute(delete(table).where(
+            table.c.resolution == resolution,
+            table.c.section_id == section_id,
+            table.c.reading_type == reading_type,
+            table.c.bucket >= low,
+            table.c.bucket < high))
+        readings = readings_union(
+            ['section_id', 'reading_type', 'value', 'timestamp'],
+            lambda t: (t.c.section_id == section_id, t.c.reading_type == reading_type,
+                       t.c.timestamp >= low, t.c.timestamp < high),
+            start=low, end=high)
+        bucket = func.strftime(BUCKET_FORMATS[resolution], readings.c.timestamp)
+        db.session.execute(table.insert().from_select(
+            ['resolution', 'section_id', 'reading_type', 'bucket',
+             'value_count', 'value_sum', 'value_min', 'value_max'],
+            select(literal(resolution), readings.c.section_id, readings.c.reading_type, bucket,
+                   func.count(), func.sum(readings.c.value),
+                   func.min(readings.c.value), func.max(readings.c.value))
+            .group_by(readings.c.section_id, readings.c.reading_type, bucket)))
+
+def parse_step(value):
+    """'90', '15m', '1h', '1d' -> seconds"""
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    value = value.strip().lower()
+    if value[-1:] in units:
+        return int(value[:-1]) * units[value[-1]]
+    return int(value)
+
+def pick_resolution(step):
+    """Coarsest rollup whose bucket width divides the step (seconds, a multiple of 60)"""
+    return next(resolution for resolution, width in reversed(RESOLUTIONS) if step % width == 0)
+
+def snap_window(start, end, width):
+    """[start, end) widened to whole buckets of `width` seconds"""
+    low = calendar.timegm(start.timetuple())
+    high = calendar.timegm(end.timetuple()) + (1 if end.microsecond else 0)
+    return (EPOCH + timedelta(seconds=low - low % width),
+            EPOCH + timedelta(seconds=-(-high // width) * width))
+
+def query_series(section_id, reading_type, start, end, step=None):
+    """Return the chart points between start and end, one per `step` seconds.
+
+    Reads only the coarsest rollup whose buckets divide the step, the window
+    being widened to whole buckets of it: the first and last points cover
+    their full bucket. The cost follows the number of buckets in the window
+    and not the number of raw readings, and a window older than the minute
+    rollups' retention is still served by the hour or day ones.
+    """
+    span = (end - start).total_seconds()
+    if step is None:
+        step = next((s for s in AUTO_STEPS if span / s <= AUTO_POINTS), AUTO_STEPS[-1])
+    if step <= 0 or step % 60:
+        raise ValueError('La résolution doit être un multiple de 60 secondes')
+
+    resolution = pick_resolution(step)
+    start, end = snap_window(start, end, dict(RESOLUTIONS)[resolution])
+    if (end - start).total_seconds() / step > MAX_POINTS:
+        raise ValueError(f'Trop de points demandés (maximum {MAX_POINTS})')
+
+    start_epoch = calendar.timegm(start.timetuple())
+    r = SensorRollup
+    index = cast((cast(func.strftime('%s', r.bucket), Integer) - start_epoch) / step, Integer).label('idx')
+    rows = (db.session.query(
+                index,
+                func.sum(r.value_count),
+                func.sum(r.value_sum),
+                func.min(r.value_min),
+                func.max(r.value_max))
+            .filter(r.resolution == resolution,
+                    r.section_id == section_id,
+                    r.reading_type == reading_type,
+                    r.bucket >= start,
+                    r.bucket < end)
+            .group_by(index)
+            .order_by(index)
+            .all())
+
+    return resolution, step, [{
+        'date': (start + timedelta(seconds=idx * step)).isoformat(),
+        'value': round(total / count, 2),
+        'min': low,
+        'max': high,
+        'count': count
+    } for idx, count, total, low, high in rows]
+
+@click.command('rebuild-rollups')
+@click.option('--section-id', type=int, default=None, help='Limiter à une section')
+@with_appcontext
+def rebuild_rollups_command(section_id):
+    """Recalculer les agrégats minute/heure/jour depuis sensor_reading."""
+    started = datetime.now()
+    written = rebuild_rollups(section_id)
+    click.echo(f"Agrégats reconstruits en {(datetime.now() - started).total_seconds():.1f}s : {written}")
\ No newline at end of file
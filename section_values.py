@@ -0,0 +1,86 @@
+from models import db, Site, SiteSection
+from sqlalchemy import update, or_
+from datetime import datetime
+
+# Valeurs actuelles numériques de chaque section. Les anciennes colonnes
+# texte de SiteSection ('24.0°C', '6.0 mg/L') ne sont plus écrites : le
+# formatage se fait à la sérialisation. Colonnes créées par create_all sur
+# une base neuve, ajoutées par la migration 0003 sur une base existante.
+SiteSection.temperature_value = db.Column(db.Float, index=True)
+SiteSection.ph_value = db.Column(db.Float, index=True)
+SiteSection.oxygen_value = db.Column(db.Float, index=True)
+# Dernière modification des valeurs de la section (ETag / Last-Modified de GET /sites/<id>),
+# migration 0004 ; NULL pour les sections jamais mises à jour depuis
+SiteSection.updated_at = db.Column(db.DateTime)
+# Instant de la lecture de chaque valeur actuelle (migration 0006) : une lecture plus ancienne
+# (import en retard, lot horodaté) ne remplace pas la valeur ; NULL = inconnu, toujours remplacé
+SiteSection.temperature_at = db.Column(db.DateTime)
+SiteSection.ph_at = db.Column(db.DateTime)
+SiteSection.oxygen_at = db.Column(db.DateTime)
+
+# Type de lecture -> (colonne numérique, champ de l'API, format d'affichage)
+SECTION_VALUES = {
+    'temperature': ('temperature_value', 'temperature', '{}°C'),
+    'ph': ('ph_value', 'ph_level', '{}'),
+    'oxygen': ('oxygen_value', 'oxygen_level', '{} mg/L'),
+}
+
+def value_column(reading_type):
+    return getattr(SiteSection, SECTION_VALUES[reading_type][0])
+
+def set_section_value(section, reading_type, value, timestamp):
+    """Mettre à jour la valeur actuelle de la section (ORM), lue à `timestamp`"""
+    setattr(section, SECTION_VALUES[reading_type][0], value)
+    setattr(section, f'{reading_type}_at', timestamp)
+    section.updated_at = datetime.now()
+
+def section_value_update(section_id, reading_type, value, timestamp):
+    """Same as set_section_value, as a Core UPDATE for the write path.
+
+    Only moves forward: the row is left alone when the stored value was
+    read after `timestamp`, as in latest_cache.
+    """
+    table = SiteSection.__table__
+    read_at = table.c[f'{reading_type}_at']
+    return (update(table)
+            .where(table.c.id == section_id, or_(read_at.is_(None), read_at <= timestamp))
+            .values({SECTION_VALUES[reading_type][0]: value, read_at.key: timestamp, 'updated_at': datetime.now()}))
+
+def format_value(reading_type, value):
+    if value is None:
+        return None
+    return SECTION_VALUES[reading_type][2].format(value)
+
+def serialize_section_values(section):
+    """API fields of the current values: formatted strings as before, plus the raw numbers"""
+    data = {}
+    numbers = {}
+    for reading_type, (column, field, _) in SECTION_VALUES.items():
+        value = getattr(section, column)
+        data[field] = format_value(reading_type, value)
+        numbers[reading_type] = value
+    data['values'] = numbers
+    return data
+
+def sections_beyond_threshold(reading_type, below=None, above=None, user_id=None, limit=1000):
+    """Sections whose current value is < below or > above, in one indexed query.
+
+    Returns (site_id, site_name, section_name, is_active, value) rows,
+    the furthest from the threshold first.
+    """
+    column = value_column(reading_type)
+    conditions = []
+    if below is not None:
+        conditions.append(column < below)
+    if above is not None:
+        conditions.append(column > above)
+
+    query = (db.session.query(Site.id, Site.name, SiteSection.section_name,
+                              SiteSection.is_active, column)
+             .join(Site, Site.id == SiteSection.site_id)
+             .filter(or_(*conditions)))
+    if user_id is not None:
+        query = query.filter(Site.user_id == user_id)
+    # Sous le seuil bas : les plus basses d'abord, sinon les plus hautes
+    order = column.asc() if below is not None else column.desc()
+    return query.order_by(order, Site.id, SiteSection.section_name).limit(limit).all()
\ No newline at end of file
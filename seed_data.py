@@ -1,73 +1,152 @@
-from app import create_app
-from models import db, User, Site, SiteSection, SensorReading
+"""Données de test : le jeu de démonstration ou un parc synthétique de grande taille.
+
+Usage : python seed_data.py                      (3 sites x 2 sections x 7 jours, une lecture par jour)
+        python seed_data.py --users 20 --sites 5 --sections 8 --days 90 --interval 300
+
+La base de l'application (DATABASE_URL) est vidée puis rechargée, sauf avec --keep.
+"""
+from models import db, User, Site, SiteSection
+from section_values import set_section_value
+from sensor_queries import READING_TYPES
+from partitions import reading_table, month_key, partition_keys, drop_partition
+from rollups import rebuild_rollups, sql_timestamp
+from migrations import run_migrations
+from passwords import password_hasher
 from datetime import datetime, timedelta
+import argparse
+import math
 import random
+import time
+
+BASE_VALUES = {'temperature': 24, 'ph': 7.0, 'oxygen': 6.2}
+VARIATION = {'temperature': 3, 'ph': 0.5, 'oxygen': 1.0}
+SITE_STATUSES = ['En fonctionnement', 'En maintenance', 'En fonctionnement']
+# Mot de passe de tous les utilisateurs générés (un seul hash calculé)
+PASSWORD = 'test123'
+
+def reset_database():
+    """Drop every table and month partition, then recreate the schema"""
+    for key in partition_keys():
+        drop_partition(key)
+    db.drop_all()
+    db.create_all()
+    run_migrations()
+
+def generate_data(users=1, sites_per_user=3, sections_per_site=2, days=7, interval_s=86400,
+                  seed=42, end=None, chunk_rows=50_000):
+    """Bulk-load a synthetic fleet and return what was created.
+
+    Each section gets one reading per type every `interval_s` seconds over
+    `days` days: a daily cycle around the demo values plus noise, the same
+    for a given `seed`. Readings are inserted by the driver's executemany
+    in transactions of about `chunk_rows` rows, into the month partitions
+    when enabled; current values and rollups are set once at the end.
+    """
+    rng = random.Random(seed)
+    end = (end or datetime.now()).replace(microsecond=0)
+    started = time.perf_counter()
+
+    password_hash = password_hasher.hash(PASSWORD)
+    existing = User.query.count()  # --keep : numéros d'utilisateur à la suite
+    sections = []
+    for u in range(existing, existing + users):
+        # Premier utilisateur d'une base vide : le compte de démonstration habituel
+        email = 'test@example.com' if u == 0 else f'user{u}@example.com'
+        user = User(email=email, password_hash=password_hash, name=f'User {u}')
+        db.session.add(user)
+        db.session.flush()
+        site_objects = [Site(name=f'Site {chr(65 + s % 26)}{s // 26 or ""}', status=SITE_STATUSES[s % 3],
+                             last_update=end - timedelta(hours=s * 8), user_id=user.id)
+                        for s in range(sites_per_user)]
+        db.session.add_all(site_objects)
+        db.session.flush()
+        for s, site in enumerate(site_objects):
+            for j in range(1, sections_per_site + 1):
+                # A1, A2... B1 : noms du jeu de démonstration (/sensor-data lit A1 du site 1)
+                is_active = not (s % 3 == 1 and j == 2)
+                section = SiteSection(site_id=site.id, section_name=f'{chr(65 + s % 26)}{j}',
+                                      status='En marche' if is_active else 'En maintenance',
+                                      volume=f'{rng.randint(300, 600)} L', is_active=is_active)
+                sections.append(section)
+        db.session.add_all(sections[-sites_per_user * sections_per_site:])
+        db.session.flush()
 
-app = create_app()
+    steps = max(1, int(days * 86400 // interval_s))
+    timestamps = [end - timedelta(seconds=interval_s * (steps - 1 - k)) for k in range(steps)]
+    # Cycle journalier commun, déphasé par section
+    cycle = [math.sin(2 * math.pi * (t.hour * 3600 + t.minute * 60 + t.second) / 86400) for t in timestamps]
+    # Table de destination (partition du mois) et date au format stocké, calculées une fois par instant
+    months = {}
+    for timestamp in timestamps:
+        if month_key(timestamp) not in months:
+            months[month_key(timestamp)] = reading_table(timestamp, create=True).name
+    targets = [months[month_key(t)] for t in timestamps]
+    stored = [sql_timestamp(t) for t in timestamps]
 
-with app.app_context():
-    # Vider les tables existantes
-    db.session.query(SensorReading).delete()
-    db.session.query(SiteSection).delete()
-    db.session.query(Site).delete()
-    db.session.query(User).delete()
-    
-    # Créer un utilisateur test
-    user = User(email='test@example.com', password_hash='firebase_auth')
-    db.session.add(user)
-    db.session.flush()
-    
-    # Créer des sites
-    site_names = ['Site A', 'Site B', 'Site C']
-    site_statuses = ['En fonctionnement', 'En maintenance', 'En fonctionnement']
-    
-    sites = []
-    for i in range(3):
-        site = Site(
-            name=site_names[i],
-            status=site_statuses[i],
-            last_update=datetime.now() - timedelta(hours=i*8),
-            user_id=user.id
-        )
-        sites.append(site)
-        db.session.add(site)
-    
-    db.session.flush()
-    
-    # Créer des sections pour chaque site
-    for i, site in enumerate(sites):
-        for j in range(1, 3):
-            section_name = f'{"ABC"[i]}{j}'
-            is_active = not (i == 1 and j == 2)  # Site B, section 2 inactive
-            
-            section = SiteSection(
-                section_name=section_name,
-                status='En marche' if is_active else 'En maintenance',
-                volume=f'{random.randint(300, 600)} L',
-                temperature=f'{20 + random.random() * 8:.1f}°C',
-                ph_level=f'{6.5 + random.random() * 1:.1f}',
-                oxygen_level=f'{5 + random.random() * 3:.1f} mg/L',
-                is_active=is_active,
-                site_id=site.id
-            )
-            db.session.add(section)
-            db.session.flush()
-            
-            # Ajouter des lectures de capteurs pour cette section
-            for k in range(7):  # 7 jours de données
-                for reading_type in ['temperature', 'ph', 'oxygen']:
-                    base_values = {'temperature': 24, 'ph': 7.0, 'oxygen': 6.2}
-                    variation = {'temperature': 3, 'ph': 0.5, 'oxygen': 1.0}
-                    
-                    value = base_values[reading_type] + (random.random() - 0.5) * variation[reading_type]
-                    
-                    reading = SensorReading(
-                        reading_type=reading_type,
-                        value=round(value, 2),
-                        timestamp=datetime.now() - timedelta(days=6-k),
-                        section_id=section.id
-                    )
-                    db.session.add(reading)
-    
+    pending, queued, readings = {}, 0, 0
+    for section in sections:
+        phase = rng.randrange(steps)
+        for reading_type in READING_TYPES:
+            base, amplitude = BASE_VALUES[reading_type], VARIATION[reading_type] / 2
+            noise = VARIATION[reading_type] / 10
+            value = base
+            for k in range(steps):
+                value = round(base + amplitude * cycle[(k + phase) % steps] + rng.gauss(0, noise), 2)
+                pending.setdefault(targets[k], []).append((section.id, reading_type, value, stored[k]))
+            set_section_value(section, reading_type, value, timestamps[-1])
+            readings += steps
+            queued += steps
+            if queued >= chunk_rows:
+                _insert_rows(pending)
+                queued = 0
+    _insert_rows(pending)
     db.session.commit()
-    print("Données de test ajoutées avec succès")
\ No newline at end of file
+    loaded = time.perf_counter() - started
+
+    rebuild_rollups()
+    return {
+        'users': users,
+        'sites': users * sites_per_user,
+        'sections': len(sections),
+        'readings': readings,
+        'load_s': round(loaded, 2),
+        'rows_per_s': round(readings / loaded) if loaded else None,
+        'rollups_s': round(time.perf_counter() - started - loaded, 2)
+    }
+
+def _insert_rows(pending):
+    """Insert {table name: [(section_id, reading_type, value, timestamp)]} and empty it, one transaction"""
+    # executemany du pilote sur des tuples : pas de compilation ni de conversion par ligne
+    connection = db.session.connection()
+    for table, rows in pending.items():
+        if rows:
+            connection.exec_driver_sql(
+                f'INSERT INTO {table} (section_id, reading_type, value, timestamp) VALUES (?, ?, ?, ?)', rows)
+    db.session.commit()
+    pending.clear()
+
+def main():
+    parser = argparse.ArgumentParser(description='Charger des données de test')
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--sites', type=int, default=3, help='Sites par utilisateur')
+    parser.add_argument('--sections', type=int, default=2, help='Sections par site')
+    parser.add_argument('--days', type=float, default=7)
+    parser.add_argument('--interval', type=int, default=86400, help='Secondes entre deux lectures')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--keep', action='store_true', help='Ne pas vider la base avant le chargement')
+    options = parser.parse_args()
+
+    from app import create_app
+    from init_db import init_database
+    app = create_app()
+    with app.app_context():
+        if options.keep:
+            init_database(demo=False)
+        else:
+            reset_database()
+        report = generate_data(options.users, options.sites, options.sections, options.days,
+                               options.interval, options.seed)
+    print(f"Données de test ajoutées avec succès : {report}")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
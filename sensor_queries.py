@@ -0,0 +1,96 @@
+from models import db, SiteSection
+from partitions import reading_tables
+from sqlalchemy import select, union_all, literal, bindparam
+from functools import lru_cache
+
+READING_TYPES = ['temperature', 'ph', 'oxygen']
+
+def latest_readings(section_id, reading_types=READING_TYPES):
+    """Return {reading_type: (value, timestamp)} for the newest reading of each type.
+
+    One statement for all types: each branch is an ORDER BY ... LIMIT 1
+    seek on ix_sensor_reading_section_type_ts, so the cost depends on the
+    index depth and not on the number of rows stored for the section.
+    With month partitions only sensor_reading and the newest partition are
+    read first; older partitions are read, in a second statement, for the
+    types not found there.
+    """
+    newest, older = newest_tables_first()
+    latest = _read_latest(newest, reading_types, section_id)
+    missing = [reading_type for reading_type in reading_types if reading_type not in latest]
+    if missing and older:
+        latest.update(_read_latest(older, missing, section_id))
+    return latest
+
+def newest_tables_first():
+    """(sensor_reading and the newest partition, the older partitions).
+
+    Partitions hold disjoint months, so a type found in the newest one is
+    never newer elsewhere; sensor_reading keeps the rows stored before
+    partitioning and is always read.
+    """
+    tables = reading_tables()
+    if len(tables) <= 2:
+        return tables, []
+    return [tables[0], tables[-1]], tables[1:-1]
+
+def _read_latest(tables, reading_types, section_id):
+    statement = _latest_statement(tuple(tables), tuple(reading_types))
+    latest = {}
+    for reading_type, value, timestamp in db.session.execute(statement, {'section_id': section_id}):
+        if reading_type not in latest or timestamp > latest[reading_type][1]:
+            latest[reading_type] = (value, timestamp)
+    return latest
+
+@lru_cache(maxsize=64)
+def _latest_statement(tables, reading_types):
+    """UNION ALL of the LIMIT 1 seeks, built once per set of tables (section id bound at execution)"""
+    branches = []
+    for table in tables:
+        for reading_type in reading_types:
+            newest = (
+                select(literal(reading_type).label('reading_type'), table.c.value, table.c.timestamp)
+                .where(table.c.section_id == bindparam('section_id'),
+                       table.c.reading_type == reading_type)
+                .order_by(table.c.timestamp.desc())
+                .limit(1)
+                .subquery()
+            )
+            branches.append(select(newest.c.reading_type, newest.c.value, newest.c.timestamp))
+    return union_all(*branches)
+
+def latest_readings_by_section(max_sections, reading_types=READING_TYPES):
+    """Return {section_id: {reading_type: (value, timestamp)}} for the first `max_sections` sections by id.
+
+    One statement whatever the number of sections: for each section, type
+    and table, a correlated LIMIT 1 seek finds the id of the newest reading.
+    The cost follows the number of sections, not the number of readings.
+    Sections without readings are absent from the result.
+    """
+    sections = select(SiteSection.id).order_by(SiteSection.id).limit(max_sections).subquery()
+    branches = []
+    for table in reading_tables():
+        for reading_type in reading_types:
+            newest_id = (
+                select(table.c.id)
+                .where(table.c.section_id == sections.c.id, table.c.reading_type == reading_type)
+                .order_by(table.c.timestamp.desc())
+                .limit(1)
+                .correlate(sections)
+                .scalar_subquery()
+            )
+            branches.append(
+                select(sections.c.id, literal(reading_type).label('reading_type'), table.c.value, table.c.timestamp)
+                .select_from(sections.join(table, table.c.id == newest_id))
+            )
+    latest = {}
+    for section_id, reading_type, value, timestamp in db.session.execute(union_all(*branches)):
+        readings = latest.setdefault(section_id, {})
+        if reading_type not in readings or timestamp > readings[reading_type][1]:
+            readings[reading_type] = (value, timestamp)
+    return latest
+
+def latest_values(section_id, reading_types=READING_TYPES):
+    """Return {reading_type: value} for the newest reading of each type"""
+    return {reading_type: value
+            for reading_type, (value, _) in latest_readings(section_id, reading_types).items()}
\ No newline at end of file
@@ -0,0 +1,184 @@
+"""Lancement du serveur.
+
+Usage : python serve.py [--server dev|wsgi|asgi] [--host H] [--port P] [--workers N] [--threads N]
+                        [--no-init-db] [--no-ingest-writer]
+
+  dev  : serveur de développement Flask (werkzeug threadé), comme l'ancien `python app.py`
+  wsgi : gunicorn, workers gthread (pip install gunicorn)
+  asgi : uvicorn, l'application WSGI servie par a2wsgi.WSGIMiddleware (pip install uvicorn a2wsgi)
+
+Les valeurs par défaut viennent de Config (SERVER_MODE, SERVER_WORKERS, SERVER_THREADS, PORT).
+La base est initialisée (schéma, migrations, DEMO_DATA) une fois ici, avant les workers, qui
+démarrent sans écrire en base ; --no-init-db quand `flask --app app init-db` est lancé au déploiement.
+Avec INGEST_WRITER_ENABLED=true, le processus d'écriture des lectures est lancé ici avant les
+workers (sauf --no-ingest-writer, quand `flask --app app ingest-writer` tourne à part) : un seul
+processus écrit les lectures, les workers lisent la base directement (instantanés WAL).
+latest_cache, live_hub, l'état des règles d'alerte, le cache de réponses et le tampon
+d'ingestion sont propres à chaque processus : avec plusieurs workers, définir
+LATEST_CACHE_TTL, ALERT_RULES_TTL, RESPONSE_CACHE_TTL et DEVICE_COMMAND_RECHECK_S ;
+les flux /api/live et les alertes ne voient que les lectures écrites par leur propre worker.
+Les long-polls des contrôleurs (/api/sites/<id>/commands) et les flux /api/live gardent un
+thread pendant qu'ils sont ouverts : chaque worker accepte DEVICE_MAX_WAITERS long-polls (par
+défaut --threads / 2) et LIVE_MAX_SUBSCRIBERS flux (par défaut --threads / 4) puis répond 503,
+le dernier quart restant aux autres requêtes. --threads x --workers doit donc couvrir deux fois
+les contrôleurs connectés et quatre fois les tableaux de bord ouverts.
+GET /metrics décrit le seul worker qui répond : avec plusieurs workers, les agréger côté Prometheus.
+"""
+from config import Config
+import argparse
+import atexit
+import importlib
+import os
+import socket
+import subprocess
+import sys
+import time
+
+def create_asgi_app():
+    """ASGI application for uvicorn (factory, loaded once per worker).
+
+    The blueprints stay synchronous: each request runs in a pool of
+    ASGI_THREADS threads while the event loop keeps handling connections.
+    (asgiref's WsgiToAsgi runs every request on one thread per worker: a
+    single /live stream or long-poll would block the worker.)
+    """
+    from a2wsgi import WSGIMiddleware
+    from app import create_app
+    threads = int(os.environ.get('ASGI_THREADS', Config.SERVER_THREADS))
+    return WSGIMiddleware(create_app({'SERVER_THREADS': threads}), workers=threads)
+
+def get_local_ip():
+    """Get the local IP address"""
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect(("8.8.8.8", 80))
+        ip = s.getsockname()[0]
+        s.close()
+        return ip
+    except OSError:
+        return "0.0.0.0"
+
+def init_database_once():
+    """Schema, migrations and demo data in the launching process, before any worker starts"""
+    from flask import Flask
+    from database import configure_database
+    from init_db import init_database
+    from models import db
+    # Application minimale : ni caches ni threads de fond dans le processus maître
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    configure_database(app)
+    with app.app_context():
+        applied = init_database(demo=Config.DEMO_DATA)
+        # Aucune connexion SQLite héritée par les workers après le fork
+        db.engine.dispose()
+    if applied:
+        print(f"Migrations appliquées : {', '.join(applied)}")
+
+def start_ingest_writer(timeout=30):
+    """Start the readings writer process and wait until its socket accepts connections"""
+    from multiprocessing.connection import Client
+    # Processus indépendant (pas multiprocessing) : les workers forkés par gunicorn n'en héritent pas
+    process = subprocess.Popen([sys.executable, '-c', 'import ingest_writer; ingest_writer.run_ingest_writer()'],
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    master = os.getpid()
+    atexit.register(lambda: os.getpid() == master and process.poll() is None and process.terminate())
+
+    deadline = time.monotonic() + timeout
+    while True:
+        if process.poll() is not None or time.monotonic() > deadline:
+            raise SystemExit("Le processus d'écriture des lectures n'a pas démarré")
+        try:
+            Client(Config.INGEST_WRITER_SOCKET, family='AF_UNIX', authkey=Config.SECRET_KEY.encode()).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    print(f"Processus d'écriture des lectures : pid {process.pid}, {Config.INGEST_WRITER_SOCKET}")
+    return process
+
+def server_config(options):
+    """Pool size seen by the app, which sizes the long-poll limit on it"""
+    return {'SERVER_WORKERS': options.workers, 'SERVER_THREADS': options.threads}
+
+def run_dev(options):
+    from app import create_app
+    app = create_app(server_config(options))
+    print(f"\nServer running at:")
+    print(f"- Local:   http://127.0.0.1:{options.port}")
+    print(f"- Network: http://{get_local_ip()}:{options.port}\n")
+    app.run(
+        debug=True,
+        host=options.host,
+        port=options.port,
+        use_reloader=False,
+        threaded=True
+    )
+
+def run_wsgi(options):
+    BaseApplication = require('gunicorn.app.base', 'gunicorn').BaseApplication
+    from app import create_app
+
+    class GunicornApp(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{options.host}:{options.port}')
+            self.cfg.set('workers', options.workers)
+            self.cfg.set('threads', options.threads)
+            self.cfg.set('worker_class', 'gthread')
+            # Les flux SSE et les exports restent ouverts longtemps
+            self.cfg.set('timeout', 0)
+            self.cfg.set('keepalive', 5)
+
+        def load(self):
+            return create_app(server_config(options))
+
+    GunicornApp().run()
+
+def run_asgi(options):
+    uvicorn = require('uvicorn', 'uvicorn')
+    require('a2wsgi', 'a2wsgi')
+    # Taille du pool de threads, lue par create_asgi_app dans chaque worker
+    os.environ['ASGI_THREADS'] = str(options.threads)
+    uvicorn.run(
+        'serve:create_asgi_app',
+        factory=True,
+        host=options.host,
+        port=options.port,
+        workers=options.workers,
+        timeout_keep_alive=5,
+        log_level='warning'
+    )
+
+def require(module, package):
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise SystemExit(f"Module {module} introuvable : pip install {package}")
+
+SERVERS = {'dev': run_dev, 'wsgi': run_wsgi, 'asgi': run_asgi}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Serveur SmartAqua')
+    parser.add_argument('--server', choices=SERVERS, default=Config.SERVER_MODE)
+    parser.add_argument('--host', default=Config.SERVER_HOST)
+    parser.add_argument('--port', type=int, default=Config.SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=Config.SERVER_WORKERS)
+    parser.add_argument('--threads', type=int, default=Config.SERVER_THREADS)
+    parser.add_argument('--no-init-db', action='store_true',
+                        help='Ne pas initialiser la base avant de démarrer (flask init-db déjà lancé)')
+    parser.add_argument('--no-ingest-writer', action='store_true',
+                        help="Ne pas lancer le processus d'écriture (flask ingest-writer lancé à part)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    options = parse_args(argv)
+    if options.workers > 1 and Config.LATEST_CACHE_TTL is None:
+        print("Attention : plusieurs workers sans LATEST_CACHE_TTL, "
+              "le cache des dernières lectures peut rester périmé")
+    if not options.no_init_db and not Config.DB_INIT_ON_STARTUP:
+        init_database_once()
+    if Config.INGEST_WRITER_ENABLED and not options.no_ingest_writer:
+        start_ingest_writer()
+    SERVERS[options.server](options)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -1,42 +1,83 @@
-from flask import Blueprint, request, jsonify
-from models import db, Site, SiteSection, SensorReading, User
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context, g
+from models import db, Site, SiteSection, User
+from latest_cache import latest_cache
+from ingestion import VALID_TYPES, validate_reading, parse_batch, ingest_batch, make_reading, write_readings
+from section_values import serialize_section_values, sections_beyond_threshold, format_value
+from rollups import query_series, parse_step
+from ingest_buffer import ingest_buffer, BufferFull
+from ingest_writer import ingest_writer, WriterUnavailable, WriteFailed
+from export import export_stream
+from history_import import import_history, iter_ndjson
+from live_stream import live_hub, sse_stream, TooManySubscribers
+from auth_tokens import authenticate_request, site_ownership, site_owner_required
+from partitions import readings_union
+from analytics import load_series, section_stats, DEFAULT_WINDOW, DEFAULT_THRESHOLD
+from alerting import AlertRule, Alert, RULE_KINDS, alert_engine, serialize_rule, serialize_alert
+from http_cache import cached_json, make_etag, response_cache
+from device_commands import (enqueue_command, find_command, fetch_commands, ack_commands,
+                             serialize_command, command_waiters, TooManyWaiters)
+from sqlalchemy import func, select
+from instrumentation import log_event
+from pagination import PageError, keyset_page, selected_fields, bool_arg
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import RequestEntityTooLarge
 from datetime import datetime, timedelta
-import random
+import logging
 
 site_bp = Blueprint('site', __name__)
+logger = logging.getLogger(__name__)
+
+@site_bp.before_request
+def load_token_user():
+    # Jeton Bearer -> g.user_id, sans lecture de la table user
+    return authenticate_request()
+
+def resolve_user_id(user_email):
+    """Id of the token's user, else of the user with this email (clients without token)"""
+    if g.user_id is not None:
+        return g.user_id
+    user = User.query.filter_by(email=user_email).first() if user_email else None
+    return user.id if user else None
 
 @site_bp.route('/sites', methods=['GET', 'POST'])
 def sites():
     if request.method == 'GET':
         user_email = request.args.get('email')
-        if not user_email:
+        if g.user_id is None and not user_email:
             return jsonify({'error': 'Email requis'}), 400
         
-        user = User.query.filter_by(email=user_email).first()
-        if not user:
+        user_id = resolve_user_id(user_email)
+        if user_id is None:
             return jsonify({'error': 'Utilisateur non trouvé'}), 404
-            
-        sites = Site.query.filter_by(user_id=user.id).all()
-        return jsonify([{
-            'id': site.id,
-            'name': site.name,
-            'status': site.status,
-            'last_update': site.last_update.strftime('%Y-%m-%d %H:%M:%S')
-        } for site in sites]), 200
+        
+        # Pagination, filtre ou sélection de champs : réponse paginée ; sinon l'ancien tableau complet
+        if any(arg in request.args for arg in ('limit', 'cursor', 'fields', 'status')):
+            return list_sites_page(user_id)
+        
+        def build():
+            sites = Site.query.filter_by(user_id=user_id).all()
+            return ([serialize_site(site) for site in sites],
+                make_etag([(site.id, site.name, site.status, site.last_update) for site in sites]),
+                max((site.last_update for site in sites), default=None))
+        
+        # Réponse mise en cache par utilisateur, 304 si le client a déjà cette version
+        return cached_json(('sites', user_id), build)
         
     elif request.method == 'POST':
         data = request.json
-        user = User.query.filter_by(email=data['user_email']).first()
-        if not user:
+        user_id = resolve_user_id(data.get('user_email'))
+        if user_id is None:
             return jsonify({'error': 'Utilisateur non trouvé'}), 404
             
         new_site = Site(
             name=data['name'],
             status=data['status'],
-            user_id=user.id
+            user_id=user_id
         )
         db.session.add(new_site)
         db.session.commit()
+        site_ownership.add_site(user_id, new_site.id)
+        response_cache.invalidate(('sites', user_id))
         
         return jsonify({
             'id': new_site.id,
@@ -44,74 +85,440 @@ def sites():
             'status': new_site.status
         }), 201
 
+SITE_FIELDS = ('id', 'name', 'status', 'last_update')
+SECTION_FIELDS = ('id', 'site_id', 'section_name', 'status', 'volume', 'temperature', 'ph_level',
+                  'oxygen_level', 'values', 'is_active', 'updated_at')
+
+def serialize_site(site):
+    return {
+        'id': site.id,
+        'name': site.name,
+        'status': site.status,
+        'last_update': site.last_update.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+def serialize_section(section):
+    return {
+        'id': section.id,
+        'site_id': section.site_id,
+        'section_name': section.section_name,
+        'status': section.status,
+        'volume': section.volume,
+        **serialize_section_values(section),
+        'is_active': section.is_active,
+        'updated_at': section.updated_at.isoformat() if section.updated_at else None
+    }
+
+def list_sites_page(user_id):
+    """Keyset page of the user's sites (ix_site_user_id), ?status= and ?fields="""
+    try:
+        fields = selected_fields(SITE_FIELDS)
+        query = Site.query.filter(Site.user_id == user_id)
+        if request.args.get('status'):
+            query = query.filter(Site.status == request.args['status'])
+        items, next_cursor = keyset_page(query, [Site.id], lambda site: (site.id,), serialize_site, fields)
+    except PageError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'sites': items, 'next_cursor': next_cursor}), 200
+
+@site_bp.route('/sections', methods=['GET'])
+def list_sections():
+    # Sections des sites de l'utilisateur, par pages, filtrables par site,
+    # statut et état ; ?fields= pour ne renvoyer que certains champs
+    user_email = request.args.get('email')
+    if g.user_id is None and not user_email:
+        return jsonify({'error': 'Email requis'}), 400
+    user_id = resolve_user_id(user_email)
+    if user_id is None:
+        return jsonify({'error': 'Utilisateur non trouvé'}), 404
+    
+    try:
+        fields = selected_fields(SECTION_FIELDS)
+        query = SiteSection.query.join(Site, Site.id == SiteSection.site_id).filter(Site.user_id == user_id)
+        site_id = request.args.get('site_id', type=int)
+        if site_id is not None:
+            query = query.filter(SiteSection.site_id == site_id)
+        if request.args.get('status'):
+            query = query.filter(SiteSection.status == request.args['status'])
+        is_active = bool_arg('is_active')
+        if is_active is not None:
+            query = query.filter(SiteSection.is_active == is_active)
+        # Ordre (site, section) : les sites dans l'ordre de ix_site_user_id, puis leurs sections
+        # dans celui de ix_site_section_site_id, sans tri des sections des pages précédentes
+        items, next_cursor = keyset_page(query, [Site.id, SiteSection.id],
+                                         lambda section: (section.site_id, section.id), serialize_section, fields)
+    except PageError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'sections': items, 'next_cursor': next_cursor}), 200
+
 @site_bp.route('/sites/<int:site_id>', methods=['GET'])
+@site_owner_required
 def get_site_detail(site_id):
-    # Simuler les données d'un site
+    response = cached_json(('site', site_id), lambda: build_site_detail(site_id))
+    if response is None:
+        return jsonify({'error': 'Site non trouvé'}), 404
+    return response
+
+def build_site_detail(site_id):
+    """(payload, etag, last_modified) of GET /sites/<id>, None if the site does not exist"""
+    # Le site et toutes ses sections en une seule requête (jointure externe)
+    rows = (db.session.query(Site, SiteSection)
+            .outerjoin(SiteSection, SiteSection.site_id == Site.id)
+            .filter(Site.id == site_id)
+            .order_by(SiteSection.section_name)
+            .all())
+    
+    if not rows:
+        return None
+    
+    site = rows[0][0]
     site_data = {
-        'id': site_id,
-        'name': f'Site {"ABC"[site_id-1]}',
-        'status': 'En fonctionnement' if site_id != 2 else 'En maintenance',
+        'id': site.id,
+        'name': site.name,
+        'status': site.status,
         'sections': []
     }
     
-    # Générer les sections pour ce site
-    for i in range(1, 3):
-        section_name = f'{"ABC"[site_id-1]}{i}'
-        is_active = not (site_id == 2 and i == 2)
-        
-        section = {
-            'section_name': section_name,
-            'status': 'En marche' if is_active else 'En maintenance',
-            'volume': f'{random.randint(300, 600)} L',
-            'temperature': f'{20 + random.random() * 8:.1f}°C',
-            'ph_level': f'{6.5 + random.random() * 1:.1f}',
-            'oxygen_level': f'{5 + random.random() * 3:.1f} mg/L',
-            'is_active': is_active
-        }
-        
-        site_data['sections'].append(section)
+    versions = []
+    for _, section in rows:
+        if section is None:
+            continue
+        site_data['sections'].append({
+            'section_name': section.section_name,
+            'status': section.status,
+            'volume': section.volume,
+            **serialize_section_values(section),
+            'is_active': section.is_active
+        })
+        versions.append((section.id, section.updated_at, section.status, section.is_active))
     
-    return jsonify(site_data), 200
+    last_modified = max((d for d in [site.last_update] + [v[1] for v in versions] if d), default=None)
+    return site_data, make_etag(site.id, site.name, site.status, site.last_update, versions), last_modified
 
 @site_bp.route('/sites/<int:site_id>/sections/<section_name>/readings', methods=['GET'])
+@site_owner_required
 def get_section_readings(site_id, section_name):
-    # Simuler 7 jours de données pour un graphique
     reading_type = request.args.get('type', 'temperature')
-    days = 7
-    data = []
+
+    # Fenêtre explicite : série min/moy/max lue dans les agrégats
+    if any(k in request.args for k in ('from', 'to', 'resolution')):
+        return get_section_series(site_id, section_name, reading_type)
+
+    if reading_type not in VALID_TYPES:
+        return jsonify({'error': 'Type de lecture invalide'}), 400
     
-    base_values = {
-        'temperature': 24,
-        'ph': 7.0,
-        'oxygen': 6.2
-    }
+    section = SiteSection.query.filter_by(site_id=site_id, section_name=section_name).first()
+    if not section:
+        return jsonify({'error': 'Section non trouvée'}), 404
     
-    variation = {
-        'temperature': 3,
-        'ph': 0.5,
-        'oxygen': 1.0
-    }
+    # Moyenne journalière sur 7 jours, une seule requête agrégée
+    # (parcours de ix_sensor_reading_section_type_ts, sans lecture de la table ;
+    # seules les partitions mensuelles couvrant la fenêtre sont lues)
+    days = 7
+    first_day = (datetime.now() - timedelta(days=days-1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    readings = readings_union(
+        ['value', 'timestamp'],
+        lambda t: (t.c.section_id == section.id, t.c.reading_type == reading_type, t.c.timestamp >= first_day),
+        start=first_day)
+    day = func.date(readings.c.timestamp).label('day')
+    rows = (db.session.query(day, func.avg(readings.c.value))
+            .group_by(day)
+            .order_by(day)
+            .all())
     
-    for i in range(days):
-        value = base_values[reading_type] + (random.random() - 0.5) * variation[reading_type]
+    data = []
+    for date, value in rows:
         data.append({
-            'day': i,
+            'day': (datetime.fromisoformat(date) - first_day).days,
             'value': round(value, 2),
-            'date': (datetime.now() - timedelta(days=days-i-1)).strftime('%Y-%m-%d')
+            'date': date
         })
     
     return jsonify(data), 200
 
+def get_section_series(site_id, section_name, reading_type):
+    if reading_type not in VALID_TYPES:
+        return jsonify({'error': 'Type de lecture invalide'}), 400
+
+    section = SiteSection.query.filter_by(site_id=site_id, section_name=section_name).first()
+    if not section:
+        return jsonify({'error': 'Section non trouvée'}), 404
+
+    try:
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else datetime.now()
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else end - timedelta(days=7)
+        resolution = request.args.get('resolution', 'auto')
+        step = None if resolution == 'auto' else parse_step(resolution)
+        if start >= end:
+            raise ValueError("'from' doit précéder 'to'")
+        rollup, step, points = query_series(section.id, reading_type, start, end, step)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'type': reading_type,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'resolution': step,
+        'rollup': rollup,
+        'points': points
+    }), 200
+
+@site_bp.route('/sites/<int:site_id>/sections/<section_name>/stats', methods=['GET'])
+@site_owner_required
+def get_section_stats(site_id, section_name):
+    # Statistiques vectorisées (NumPy) sur les lectures brutes de la fenêtre
+    reading_type = request.args.get('type', 'temperature')
+    if reading_type not in VALID_TYPES:
+        return jsonify({'error': 'Type de lecture invalide'}), 400
+
+    section = SiteSection.query.filter_by(site_id=site_id, section_name=section_name).first()
+    if not section:
+        return jsonify({'error': 'Section non trouvée'}), 404
+
+    try:
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else datetime.now()
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else end - timedelta(days=7)
+        if start >= end:
+            raise ValueError("'from' doit précéder 'to'")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    window = request.args.get('window', DEFAULT_WINDOW, type=int)
+    if window < 2:
+        return jsonify({'error': 'La fenêtre doit compter au moins 2 lectures'}), 400
+    threshold = request.args.get('threshold', DEFAULT_THRESHOLD, type=float)
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+
+    epochs, values = load_series(section.id, reading_type, start, end)
+    stats = section_stats(epochs, values, window, threshold, limit)
+    return jsonify(dict(stats, type=reading_type, threshold=threshold,
+                        **{'from': start.isoformat(), 'to': end.isoformat()})), 200
+
+@site_bp.route('/sites/<int:site_id>/alert-rules', methods=['GET', 'POST'])
+@site_owner_required
+def alert_rules(site_id):
+    if request.method == 'GET':
+        rows = (db.session.query(AlertRule, SiteSection.section_name)
+                .outerjoin(SiteSection, SiteSection.id == AlertRule.section_id)
+                .filter(AlertRule.site_id == site_id, AlertRule.enabled.is_(True))
+                .order_by(AlertRule.id)
+                .all())
+        return jsonify([serialize_rule(rule, section_name) for rule, section_name in rows]), 200
+
+    data = request.json or {}
+    if data.get('reading_type') not in VALID_TYPES:
+        return jsonify({'error': 'Type de lecture invalide'}), 400
+    if data.get('kind') not in RULE_KINDS:
+        return jsonify({'error': f"Type de règle invalide ({', '.join(RULE_KINDS)})"}), 400
+    try:
+        threshold = float(data['threshold'])
+        duration_s = int(data.get('duration_s') or 0)
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Seuil ou durée invalide'}), 400
+    if duration_s < 0 or (data['kind'] == 'rate' and (duration_s or threshold <= 0)):
+        return jsonify({'error': 'Seuil ou durée invalide'}), 400
+
+    section = None
+    if data.get('section_name'):
+        section = SiteSection.query.filter_by(site_id=site_id, section_name=data['section_name']).first()
+        if not section:
+            return jsonify({'error': 'Section non trouvée'}), 404
+    elif not db.session.get(Site, site_id):
+        return jsonify({'error': 'Site non trouvé'}), 404
+
+    rule = AlertRule(site_id=site_id, section_id=section.id if section else None,
+                     reading_type=data['reading_type'], kind=data['kind'],
+                     threshold=threshold, duration_s=duration_s)
+    db.session.add(rule)
+    db.session.commit()
+    alert_engine.invalidate()
+    return jsonify(serialize_rule(rule, section.section_name if section else None)), 201
+
+@site_bp.route('/sites/<int:site_id>/alert-rules/<int:rule_id>', methods=['DELETE'])
+@site_owner_required
+def delete_alert_rule(site_id, rule_id):
+    # Désactivée plutôt que supprimée : l'historique des alertes la référence
+    rule = AlertRule.query.filter_by(id=rule_id, site_id=site_id, enabled=True).first()
+    if not rule:
+        return jsonify({'error': 'Règle non trouvée'}), 404
+    rule.enabled = False
+    Alert.query.filter_by(rule_id=rule.id, resolved_at=None).update({'resolved_at': datetime.now()})
+    db.session.commit()
+    alert_engine.invalidate()
+    return jsonify({'message': 'Règle supprimée'}), 200
+
+@site_bp.route('/sites/<int:site_id>/alerts', methods=['GET'])
+@site_owner_required
+def get_site_alerts(site_id):
+    # Alertes les plus récentes d'abord (ix_alert_site_triggered), ?active=true pour les seules ouvertes
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    query = (db.session.query(Alert, SiteSection.section_name)
+             .join(SiteSection, SiteSection.id == Alert.section_id)
+             .filter(Alert.site_id == site_id))
+    if request.args.get('active') == 'true':
+        query = query.filter(Alert.resolved_at.is_(None))
+    rows = query.order_by(Alert.triggered_at.desc()).limit(limit).all()
+    return jsonify([serialize_alert(alert, section_name) for alert, section_name in rows]), 200
+
+@site_bp.route('/alerts/stats', methods=['GET'])
+def get_alert_stats():
+    return jsonify(alert_engine.stats()), 200
+
+@site_bp.route('/sections/threshold', methods=['GET'])
+def get_sections_beyond_threshold():
+    # Parc entier (ou les sites d'un utilisateur) : filtre en SQL sur la valeur actuelle indexée
+    reading_type = request.args.get('type')
+    if reading_type not in VALID_TYPES:
+        return jsonify({'error': 'Type de lecture invalide'}), 400
+    
+    below = request.args.get('below', type=float)
+    above = request.args.get('above', type=float)
+    if below is None and above is None:
+        return jsonify({'error': "Seuil 'below' ou 'above' requis"}), 400
+    limit = min(request.args.get('limit', 1000, type=int), 10000)
+    
+    user_id = None
+    user_email = request.args.get('email')
+    if g.user_id is not None or user_email:
+        user_id = resolve_user_id(user_email)
+        if user_id is None:
+            return jsonify({'error': 'Utilisateur non trouvé'}), 404
+    
+    rows = sections_beyond_threshold(reading_type, below, above, user_id, limit)
+    return jsonify({
+        'type': reading_type,
+        'below': below,
+        'above': above,
+        'count': len(rows),
+        'sections': [{
+            'site_id': site_id,
+            'site_name': site_name,
+            'section_name': section_name,
+            'is_active': is_active,
+            'value': value,
+            'display': format_value(reading_type, value)
+        } for site_id, site_name, section_name, is_active, value in rows]
+    }), 200
+
+@site_bp.route('/sites/<int:site_id>/export', methods=['GET'])
+@site_owner_required
+def export_site_readings(site_id):
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': "Format invalide (csv ou ndjson)"}), 400
+    
+    reading_type = request.args.get('type')
+    if reading_type and reading_type not in VALID_TYPES:
+        return jsonify({'error': 'Type de lecture invalide'}), 400
+    
+    try:
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else None
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({'error': 'Date invalide'}), 400
+    
+    if not db.session.get(Site, site_id):
+        return jsonify({'error': 'Site non trouvé'}), 404
+    
+    compress = (request.args.get('gzip') in ('1', 'true')
+                or 'gzip' in request.headers.get('Accept-Encoding', ''))
+    body = export_stream(site_id, fmt, compress,
+                         section_name=request.args.get('section'),
+                         reading_type=reading_type, start=start, end=end)
+    
+    filename = f'site_{site_id}_readings.{fmt}'
+    # Compressée ou non selon Accept-Encoding : les caches ne doivent pas servir l'une pour l'autre
+    headers = {'Content-Disposition': f'attachment; filename={filename}', 'Vary': 'Accept-Encoding'}
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
+
 @site_bp.route('/sites/<int:site_id>/sections/<section_name>/toggle', methods=['POST'])
+@site_owner_required
 def toggle_section(site_id, section_name):
-    # Simuler l'activation/désactivation d'une section
-    action = request.json.get('action', 'toggle')
-    
+    # État enregistré sur la section et commande mise en file pour le contrôleur du bassin
+    data = request.get_json(silent=True) or {}
+    action = data.get('action', 'toggle')
+    if action not in ('start', 'stop', 'toggle'):
+        return jsonify({'error': 'Action invalide (start, stop, toggle)'}), 400
+    idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    if idempotency_key is not None and not (isinstance(idempotency_key, str) and 0 < len(idempotency_key) <= 100):
+        return jsonify({'error': "Clé d'idempotence invalide"}), 400
+
+    if idempotency_key:
+        # Requête rejouée (réseau, retry client) : même réponse, rien n'est réappliqué
+        command = find_command(site_id, idempotency_key)
+        if command:
+            return replayed_toggle(command, section_name, action)
+
+    section = SiteSection.query.filter_by(site_id=site_id, section_name=section_name).first()
+    if not section:
+        return jsonify({'error': 'Section non trouvée'}), 404
+
+    start = not section.is_active if action == 'toggle' else action == 'start'
+    section.is_active = start
+    section.status = 'En marche' if start else 'Arrêtée'
+    section.updated_at = datetime.now()
+    command = enqueue_command(section, 'start' if start else 'stop', idempotency_key, action)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Même clé envoyée deux fois en parallèle : la première a gagné
+        db.session.rollback()
+        command = find_command(site_id, idempotency_key)
+        if not command:
+            raise
+        return replayed_toggle(command, section_name, action)
+
+    command_waiters.notify(site_id)
+    response_cache.invalidate(('site', site_id))
+    return toggle_response(section_name, command), 200
+
+def replayed_toggle(command, section_name, action):
+    # Réponse construite depuis la commande enregistrée ; une clé réutilisée pour une
+    # autre section ou une autre action est refusée plutôt que rejouée à tort
+    section = db.session.get(SiteSection, command.section_id)
+    stored_name = section.section_name if section else None
+    # Commandes antérieures à la colonne action : l'action est la commande elle-même
+    if stored_name != section_name or (command.action or command.command) != action:
+        return jsonify({'error': "Clé d'idempotence déjà utilisée pour une autre requête"}), 422
+    return toggle_response(stored_name, command), 200
+
+def toggle_response(section_name, command):
+    start = command.command == 'start'
     return jsonify({
         'section_name': section_name,
-        'is_active': action == 'start',
-        'message': f"Section {section_name} {'démarrée' if action == 'start' else 'arrêtée'} avec succès"
-    }), 200
+        'is_active': start,
+        'status': 'En marche' if start else 'Arrêtée',
+        'command': serialize_command(command, section_name),
+        'message': f"Section {section_name} {'démarrée' if start else 'arrêtée'} avec succès"
+    })
+
+@site_bp.route('/sites/<int:site_id>/commands', methods=['GET'])
+@site_owner_required
+def get_device_commands(site_id):
+    # Long-poll des contrôleurs : répond dès qu'une commande est en file, sinon après `wait` secondes
+    wait = min(max(request.args.get('wait', 25, type=float), 0), current_app.config['DEVICE_POLL_MAX_WAIT'])
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    try:
+        commands = fetch_commands(site_id, limit=limit, wait=wait,
+                                  redeliver_after=current_app.config['DEVICE_COMMAND_REDELIVER_S'])
+    except TooManyWaiters as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    return jsonify({'commands': commands}), 200
+
+@site_bp.route('/sites/<int:site_id>/commands/ack', methods=['POST'])
+@site_owner_required
+def ack_device_commands(site_id):
+    ids = (request.get_json(silent=True) or {}).get('ids')
+    if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+        return jsonify({'error': 'Liste ids requise'}), 400
+    return jsonify({'acked': ack_commands(site_id, ids)}), 200
+
+@site_bp.route('/commands/stats', methods=['GET'])
+def get_device_command_stats():
+    return jsonify(command_waiters.stats()), 200
 
 @site_bp.route('/sites/<int:site_id>/sections/<section_name>/readings', methods=['POST'])
 def add_sensor_reading(site_id, section_name):
@@ -125,49 +532,22 @@ def add_sensor_reading(site_id, section_name):
         if not section:
             return jsonify({'error': 'Section non trouvée'}), 404
 
-        # Valider le type de lecture
-        valid_types = ['temperature', 'ph', 'oxygen']
-        if data['reading_type'] not in valid_types:
-            return jsonify({'error': 'Type de lecture invalide'}), 400
+        # Valider le type de lecture et la plage de valeurs
+        value, error = validate_reading(data['reading_type'], data['value'])
+        if error:
+            return jsonify({'error': error}), 400
 
-        # Valider la valeur
-        try:
-            value = float(data['value'])
-            
-            # Validation des plages de valeurs
-            if data['reading_type'] == 'temperature':
-                if not (15 <= value <= 35):
-                    return jsonify({'error': 'Température doit être entre 15°C et 35°C'}), 400
-            elif data['reading_type'] == 'ph':
-                if not (0 <= value <= 14):
-                    return jsonify({'error': 'pH doit être entre 0 et 14'}), 400
-            elif data['reading_type'] == 'oxygen':
-                if not (0 <= value <= 20):
-                    return jsonify({'error': 'Oxygène doit être entre 0 et 20 mg/L'}), 400
-                    
-        except ValueError:
-            return jsonify({'error': 'Valeur invalide'}), 400
-
-        # Créer la nouvelle lecture
-        new_reading = SensorReading(
-            reading_type=data['reading_type'],
-            value=value,
-            section_id=section.id,
-            timestamp=datetime.now()
-        )
-        
-        db.session.add(new_reading)
-        db.session.commit()
+        # Mode tampon : acquitter maintenant, le worker écrit par lots
+        if ingest_buffer.running:
+            return enqueue_reading(section, data['reading_type'], value)
 
-        # Mettre à jour les valeurs actuelles de la section
-        if data['reading_type'] == 'temperature':
-            section.temperature = f"{value}°C"
-        elif data['reading_type'] == 'ph':
-            section.ph_level = str(value)
-        elif data['reading_type'] == 'oxygen':
-            section.oxygen_level = f"{value} mg/L"
-        
-        db.session.commit()
+        # Créer la nouvelle lecture (table du mois) et mettre à jour les valeurs actuelles de la section
+        try:
+            write_readings([make_reading(section, data['reading_type'], value, datetime.now())])
+        except WriterUnavailable as e:
+            return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+        except WriteFailed as e:
+            return write_failed(e)
 
         return jsonify({
             'message': 'Lecture enregistrée avec succès',
@@ -182,6 +562,28 @@ def add_sensor_reading(site_id, section_name):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def write_failed(error):
+    """500 for readings the writer process could not commit; the database error is only logged"""
+    logger.error(f"Ingest writer rejected the readings: {error}")
+    return jsonify({'error': "Échec de l'enregistrement des lectures"}), 500
+
+def enqueue_reading(section, reading_type, value):
+    """Queue a validated reading on the write-behind buffer (202, or 429 when full)"""
+    timestamp = datetime.now()
+    try:
+        ingest_buffer.submit(make_reading(section, reading_type, value, timestamp))
+    except BufferFull as e:
+        return jsonify({'error': str(e)}), 429, {'Retry-After': '1'}
+    
+    return jsonify({
+        'message': 'Lecture acceptée',
+        'reading': {
+            'type': reading_type,
+            'value': value,
+            'timestamp': timestamp.isoformat()
+        }
+    }), 202
+
 @site_bp.route('/readings', methods=['POST'])
 def add_reading():
     data = request.json
@@ -193,57 +595,105 @@ def add_reading():
         
         if not section:
             return jsonify({'error': 'Section non trouvée'}), 404
-            
-        new_reading = SensorReading(
-            section_id=section.id,
-            reading_type=data['reading_type'],
-            value=float(data['value']),
-            timestamp=datetime.now()
-        )
         
-        db.session.add(new_reading)
-        db.session.commit()
+        # Types connus et plages de valeurs, avant l'écriture et la mise à jour du cache
+        value, error = validate_reading(data['reading_type'], data['value'])
+        if error:
+            return jsonify({'error': error}), 400
+        
+        if ingest_buffer.running:
+            return enqueue_reading(section, data['reading_type'], value)
+            
+        reading = make_reading(section, data['reading_type'], value, datetime.now())
+        # Même chemin que les lots : valeurs actuelles, alertes, caches ; processus d'écriture si activé
+        try:
+            # Id renvoyé par l'INSERT ... RETURNING (propre à sensor_reading ou à la partition du mois)
+            reading_id, = write_readings([reading], source='single')
+        except WriterUnavailable as e:
+            return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+        except WriteFailed as e:
+            return write_failed(e)
+        if reading_id is None:
+            # Même (section, type, timestamp) déjà enregistré
+            return jsonify({'error': 'Lecture en double', 'duplicate': True}), 409
         
         return jsonify({
-            'id': new_reading.id,
-            'value': new_reading.value,
-            'timestamp': new_reading.timestamp.isoformat()
+            'id': reading_id,
+            'value': reading['value'],
+            'timestamp': reading['timestamp'].isoformat()
         }), 200
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+@site_bp.route('/readings/batch', methods=['POST'])
+def add_readings_batch():
+    try:
+        items = parse_batch(request.get_data(as_text=True), request.content_type)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if len(items) > current_app.config['BATCH_MAX_READINGS']:
+        return jsonify({'error': f"Maximum {current_app.config['BATCH_MAX_READINGS']} lectures par lot"}), 413
+
+    try:
+        results = ingest_batch(items)
+    except WriterUnavailable as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    except WriteFailed as e:
+        return write_failed(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    accepted = sum(1 for r in results if r['status'] == 201)
+    return jsonify({
+        'accepted': accepted,
+        'rejected': len(results) - accepted,
+        'results': results
+    }), 200
+
 @site_bp.route('/history', methods=['POST'])
 def add_history():
-    data = request.json
+    # NDJSON : section dans la query string, corps lu ligne par ligne sans être chargé en mémoire
+    if 'ndjson' in (request.content_type or ''):
+        site_id = request.args.get('site_id', type=int)
+        section_name = request.args.get('section_name')
+        reading_type = request.args.get('reading_type')
+        items = iter_ndjson(request.stream)
+    else:
+        # Corps JSON chargé en entier : plafonné, y compris sans Content-Length (envoi par morceaux)
+        request.max_content_length = current_app.config['HISTORY_JSON_MAX_BYTES']
+        try:
+            data = request.json
+        except RequestEntityTooLarge:
+            return jsonify({'error': 'Corps JSON trop volumineux, utilisez NDJSON (application/x-ndjson)'}), 413
+        if not data or not all(k in data for k in ['site_id', 'section_name', 'reading_type', 'values']):
+            return jsonify({'error': 'Données manquantes'}), 400
+        site_id = data['site_id']
+        section_name = data['section_name']
+        reading_type = data['reading_type']
+        items = data['values']
+    
+    if reading_type not in VALID_TYPES:
+        return jsonify({'error': 'Type de lecture invalide'}), 400
+    
+    section = SiteSection.query.filter_by(
+        site_id=site_id,
+        section_name=section_name
+    ).first()
+    
+    if not section:
+        return jsonify({'error': 'Section non trouvée'}), 404
+    
     try:
-        section = SiteSection.query.filter_by(
-            site_id=data['site_id'],
-            section_name=data['section_name']
-        ).first()
-        
-        if not section:
-            return jsonify({'error': 'Section non trouvée'}), 404
-            
-        readings = []
-        for value_data in data['values']:
-            reading = SensorReading(
-                section_id=section.id,
-                reading_type=data['reading_type'],
-                value=float(value_data['value']),
-                timestamp=datetime.fromisoformat(value_data['timestamp'])
-            )
-            readings.append(reading)
-            
-        db.session.bulk_save_objects(readings)
-        db.session.commit()
-        
-        return jsonify({'message': 'Données historiques ajoutées avec succès'}), 200
-        
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': str(e)}), 400
+        report = import_history(section, reading_type, items,
+                                chunk_size=current_app.config['HISTORY_CHUNK_ROWS'])
+    except WriterUnavailable as e:
+        # Les blocs déjà importés sont ignorés à la reprise (index unique)
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    
+    return jsonify({'message': 'Données historiques ajoutées avec succès', **report}), 200
 
 @site_bp.route('/readings/latest', methods=['GET'])
 def get_latest_readings():
@@ -251,64 +701,105 @@ def get_latest_readings():
         site_id = request.args.get('site_id', type=int)
         section_name = request.args.get('section_name')
         
-        print(f"Received request for site_id: {site_id}, section_name: {section_name}")  # Debug log
+        # Journaux de debug échantillonnés : rien n'est formaté hors niveau DEBUG
+        sample_rate = current_app.config['LOG_SAMPLE_RATE']
         
         if not site_id or not section_name:
-            print(f"Missing parameters - site_id: {site_id}, section_name: {section_name}")  # Debug log
+            log_event(logger, logging.DEBUG, 'latest_readings.missing_parameters', sample_rate,
+                      site_id=site_id, section_name=section_name)
             return jsonify({'error': 'site_id and section_name are required'}), 400
             
-        # Get the section
-        section = SiteSection.query.filter_by(
-            site_id=site_id,
-            section_name=section_name
-        ).first()
+        # Servi depuis l'état courant en mémoire, la base n'est lue qu'en cas de miss
+        latest_readings = latest_cache.get(site_id, section_name)
+        if latest_readings is None:
+            latest_readings = latest_cache.load(site_id, section_name)
         
-        if not section:
-            print(f"Section not found for site_id: {site_id}, section_name: {section_name}")  # Debug log
+        if latest_readings is None:
+            log_event(logger, logging.DEBUG, 'latest_readings.section_not_found', sample_rate,
+                      site_id=site_id, section_name=section_name)
             return jsonify({'error': 'Section not found'}), 404
-            
-        # Get latest readings for each type
-        latest_readings = {}
-        for reading_type in ['temperature', 'ph', 'oxygen']:
-            reading = SensorReading.query.filter_by(
-                section_id=section.id,
-                reading_type=reading_type
-            ).order_by(SensorReading.timestamp.desc()).first()
-            
-            if reading:
-                latest_readings[reading_type] = reading.value
         
-        print(f"Found readings: {latest_readings}")  # Debug log
+        log_event(logger, logging.DEBUG, 'latest_readings.found', sample_rate,
+                  site_id=site_id, section_name=section_name, readings=latest_readings)
                 
         if not latest_readings:
-            print("No readings found")  # Debug log
             return jsonify({'error': 'No readings found'}), 404
             
         return jsonify(latest_readings), 200
         
     except Exception as e:
-        print(f"Error in get_latest_readings: {str(e)}")  # Debug log
+        logger.exception(f"Error in get_latest_readings: {e}")
         return jsonify({'error': str(e)}), 500
 
+@site_bp.route('/readings/buffer', methods=['GET'])
+def get_ingest_buffer_stats():
+    return jsonify(ingest_buffer.stats()), 200
+
+@site_bp.route('/readings/writer', methods=['GET'])
+def get_ingest_writer_stats():
+    stats = {'client': ingest_writer.stats()}
+    if ingest_writer.enabled:
+        try:
+            stats['writer'] = ingest_writer.writer_stats()
+        except WriterUnavailable as e:
+            return jsonify({**stats, 'error': str(e)}), 503
+    return jsonify(stats), 200
+
+@site_bp.route('/readings/latest/cache', methods=['GET'])
+def get_latest_cache_stats():
+    return jsonify(latest_cache.stats()), 200
+
+@site_bp.route('/live', methods=['GET'])
+def live_readings():
+    # Flux SSE des lectures enregistrées, par site ou par section (remplace le polling)
+    site_id = request.args.get('site_id', type=int)
+    section_name = request.args.get('section_name')
+    if not site_id:
+        return jsonify({'error': 'site_id requis'}), 400
+    if g.user_id is not None and not site_ownership.owns(g.user_id, site_id):
+        return jsonify({'error': 'Site non trouvé'}), 404
+    
+    snapshot = None
+    if section_name:
+        readings = latest_cache.get(site_id, section_name)
+        if readings is None:
+            readings = latest_cache.load(site_id, section_name)
+        if readings is None:
+            return jsonify({'error': 'Section non trouvée'}), 404
+        snapshot = {'site_id': site_id, 'section_name': section_name, 'readings': readings}
+    elif not db.session.get(Site, site_id):
+        return jsonify({'error': 'Site non trouvé'}), 404
+    
+    try:
+        subscriber = live_hub.subscribe(site_id, section_name)
+    except TooManySubscribers as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    
+    # Pas de stream_with_context : la connexion à la base est rendue avant le flux
+    body = sse_stream(live_hub, subscriber, snapshot,
+                      coalesce_ms=current_app.config['LIVE_COALESCE_MS'],
+                      keepalive_s=current_app.config['LIVE_KEEPALIVE_S'])
+    return Response(body, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@site_bp.route('/sites/cache', methods=['GET'])
+def get_response_cache_stats():
+    return jsonify(response_cache.stats()), 200
+
+@site_bp.route('/live/stats', methods=['GET'])
+def get_live_stats():
+    return jsonify(live_hub.stats()), 200
+
 @site_bp.route('/sensor-data', methods=['GET'])
 def get_sensor_data():
     try:
         # Get the latest readings for section A1 of site 1
-        section = SiteSection.query.filter_by(site_id=1, section_name='A1').first()
+        latest_readings = latest_cache.get(1, 'A1')
+        if latest_readings is None:
+            latest_readings = latest_cache.load(1, 'A1')
         
-        if not section:
+        if latest_readings is None:
             return jsonify({'error': 'Section not found'}), 404
-            
-        # Get latest readings for each type
-        latest_readings = {}
-        for reading_type in ['temperature', 'ph', 'oxygen']:
-            reading = SensorReading.query.filter_by(
-                section_id=section.id,
-                reading_type=reading_type
-            ).order_by(SensorReading.timestamp.desc()).first()
-            
-            if reading:
-                latest_readings[reading_type] = reading.value
                 
         if not latest_readings:
             return jsonify({'error': 'No readings found'}), 404
@@ -321,5 +812,5 @@ def get_sensor_data():
         }), 200
         
     except Exception as e:
-        print(f"Error in get_sensor_data: {str(e)}")
+        logger.exception(f"Error in get_sensor_data: {e}")
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
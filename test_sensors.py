@@ -1,6 +1,6 @@
 import requests
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 import unittest
 
@@ -127,6 +127,928 @@ def test_get_latest_readings():
     except Exception as e:
         print(f"Erreur lors de la récupération: {str(e)}")
 
+class QueryCountTest(unittest.TestCase):
+    """Tests en processus (client de test Flask, SQLite en mémoire) sur le nombre de requêtes SQL"""
+
+    def setUp(self):
+        from app import create_app
+        from init_db import init_database
+        from latest_cache import latest_cache
+        from models import db, User, Site, SiteSection
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        # Cache propre au processus : une base neuve par test, mêmes (site, section)
+        latest_cache.invalidate()
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            init_database(demo=False)
+            user = User(email='queries@example.com', password_hash='x', name='Queries')
+            db.session.add(user)
+            db.session.flush()
+            site = Site(name='Site Q', status='En fonctionnement', user_id=user.id)
+            db.session.add(site)
+            db.session.flush()
+            for i in range(20):
+                db.session.add(SiteSection(site_id=site.id, section_name=f'Q{i}', status='En marche',
+                                           temperature='24.0°C', is_active=True))
+            db.session.commit()
+            self.site_id = site.id
+            self.engine = db.engine
+
+    def count_queries(self, url):
+        from sqlalchemy import event
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(self.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = self.client.get(url)
+        finally:
+            event.remove(self.engine, 'before_cursor_execute', before_cursor_execute)
+        return response, statements
+
+    def test_site_detail_loads_sections_in_one_query(self):
+        response, statements = self.count_queries(f'/api/sites/{self.site_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()['sections']), 20)
+        self.assertEqual(len(statements), 1, statements)
+
+    def test_section_readings_single_aggregate_query(self):
+        for i in range(3):
+            response = self.client.post(f'/api/sites/{self.site_id}/sections/Q0/readings',
+                                        json={'reading_type': 'ph', 'value': 7.0 + i})
+            self.assertEqual(response.status_code, 201)
+
+        response, statements = self.count_queries(f'/api/sites/{self.site_id}/sections/Q0/readings?type=ph')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]['value'], 8.0)
+        self.assertEqual(data[0]['day'], 6)
+        # Recherche de la section + une requête agrégée, quel que soit le nombre de lectures
+        self.assertEqual(len(statements), 2, statements)
+
+    def test_latest_readings_single_indexed_statement(self):
+        from latest_cache import latest_cache
+        from sensor_queries import _latest_statement, READING_TYPES
+        from partitions import reading_tables
+        from models import db
+        start = datetime(2024, 5, 1)
+        # Lectures hors ordre : la plus récente n'est pas la dernière insérée
+        batch = [{'site_id': self.site_id, 'section_name': 'Q0', 'reading_type': reading_type,
+                  'value': value + i / 10, 'timestamp': (start + timedelta(minutes=(i * 7) % 50)).isoformat()}
+                 for i in range(50) for reading_type, value in (('temperature', 20.0), ('ph', 6.0))]
+        self.assertEqual(self.client.post('/api/readings/batch', json=batch).get_json()['accepted'], 100)
+        newest = max(range(50), key=lambda i: (i * 7) % 50)
+
+        latest_cache.invalidate()
+        url = f'/api/readings/latest?site_id={self.site_id}&section_name=Q0'
+        response, statements = self.count_queries(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'temperature': 20.0 + newest / 10, 'ph': 6.0 + newest / 10})
+        # Recherche de la section + une seule requête pour tous les types (cache manqué)
+        self.assertEqual(len(statements), 2, statements)
+        # Puis servi depuis le cache, sans requête
+        self.assertEqual(len(self.count_queries(url)[1]), 0)
+
+        with self.app.app_context():
+            compiled = _latest_statement(tuple(reading_tables()), tuple(READING_TYPES)).compile(db.engine)
+            params = compiled.construct_params({'section_id': 1})
+            plan = ' '.join(row[-1] for row in db.session.connection().exec_driver_sql(
+                'EXPLAIN QUERY PLAN ' + str(compiled), tuple(params[name] for name in compiled.positiontup)))
+        # Une recherche dans l'index par type, sans tri ni parcours de la table
+        self.assertIn('ix_sensor_reading_section_type_ts', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_latest_cache_keeps_reading_committed_during_load(self):
+        from unittest import mock
+        import latest_cache as cache_module
+        from latest_cache import latest_cache
+        start = datetime(2024, 5, 1)
+        self.client.post('/api/readings/batch', json=[{'site_id': self.site_id, 'section_name': 'Q0',
+                                                       'reading_type': 'ph', 'value': 7.0, 'timestamp': start.isoformat()}])
+        latest_cache.invalidate()
+        read = cache_module.latest_readings
+
+        def read_then_commit(section_id):
+            # Lecture validée après la lecture en base, avant que le chargement ne la stocke
+            readings = read(section_id)
+            latest_cache.update(self.site_id, 'Q0', 'ph', 8.0, start + timedelta(minutes=1))
+            return readings
+
+        with self.app.app_context(), mock.patch.object(cache_module, 'latest_readings', read_then_commit):
+            self.assertEqual(latest_cache.load(self.site_id, 'Q0'), {'ph': 8.0})
+        self.assertEqual(latest_cache.get(self.site_id, 'Q0'), {'ph': 8.0})
+        # Rien n'est gardé pour les sections qui ne sont pas en cours de chargement
+        latest_cache.update(self.site_id, 'Q1', 'ph', 6.0, start)
+        self.assertIsNone(latest_cache.get(self.site_id, 'Q1'))
+        self.assertEqual(latest_cache._pending, {})
+
+    def test_latest_cache_warm_reads_all_sections_at_once(self):
+        from sqlalchemy import event
+        from latest_cache import latest_cache
+        start = datetime(2024, 5, 1)
+        batch = [{'site_id': self.site_id, 'section_name': f'Q{i}', 'reading_type': reading_type,
+                  'value': i + minute / 10, 'timestamp': (start + timedelta(minutes=minute)).isoformat()}
+                 for i in range(10) for reading_type in ('ph', 'oxygen') for minute in (5, 0, 3)]
+        self.assertEqual(self.client.post('/api/readings/batch', json=batch).get_json()['accepted'], 60)
+
+        latest_cache.invalidate()
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(self.engine, 'before_cursor_execute', listener)
+        try:
+            with self.app.app_context():
+                self.assertEqual(latest_cache.warm(), 20)
+        finally:
+            event.remove(self.engine, 'before_cursor_execute', listener)
+        # Sections puis dernières lectures de toutes les sections, quel que soit leur nombre
+        self.assertEqual(len(statements), 2, statements)
+        self.assertEqual(latest_cache.get(self.site_id, 'Q3'), {'ph': 3.5, 'oxygen': 3.5})
+        self.assertEqual(latest_cache.get(self.site_id, 'Q15'), {})
+
+    def test_threshold_scan_runs_in_sql(self):
+        for i, value in enumerate([3.5, 2.0, 6.0]):
+            response = self.client.post(f'/api/sites/{self.site_id}/sections/Q{i}/readings',
+                                        json={'reading_type': 'oxygen', 'value': value})
+            self.assertEqual(response.status_code, 201)
+
+        response, statements = self.count_queries('/api/sections/threshold?type=oxygen&below=4')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual([s['section_name'] for s in data['sections']], ['Q1', 'Q0'])
+        self.assertEqual(data['sections'][0]['display'], '2.0 mg/L')
+        self.assertEqual(len(statements), 1, statements)
+
+        detail = self.client.get(f'/api/sites/{self.site_id}').get_json()
+        q0 = next(s for s in detail['sections'] if s['section_name'] == 'Q0')
+        self.assertEqual(q0['oxygen_level'], '3.5 mg/L')
+        self.assertEqual(q0['values']['oxygen'], 3.5)
+
+    def test_committed_readings_fan_out_coalesced(self):
+        from live_stream import live_hub
+        subscriber = live_hub.subscribe(self.site_id, 'Q0')
+        try:
+            for value in (7.0, 7.5):
+                self.client.post(f'/api/sites/{self.site_id}/sections/Q0/readings',
+                                 json={'reading_type': 'ph', 'value': value})
+            self.client.post(f'/api/sites/{self.site_id}/sections/Q1/readings',
+                             json={'reading_type': 'ph', 'value': 6.0})
+            frames = subscriber.wait(0)
+        finally:
+            live_hub.unsubscribe(subscriber)
+        # Deux lectures de Q0 fusionnées en une trame, Q1 filtrée
+        self.assertEqual(len(frames), 1)
+        self.assertIn('"value": 7.5', frames[0])
+        self.assertEqual(subscriber.coalesced, 1)
+
+    def test_token_replaces_user_lookup(self):
+        response = self.client.post('/api/login', json={'email': 'queries@example.com', 'password': 'x'})
+        self.assertEqual(response.status_code, 200)
+        headers = {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+        from sqlalchemy import event
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(self.engine, 'before_cursor_execute', listener)
+        try:
+            response = self.client.get('/api/sites', headers=headers)
+        finally:
+            event.remove(self.engine, 'before_cursor_execute', listener)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([s['id'] for s in response.get_json()], [self.site_id])
+        # Pas de recherche de l'utilisateur par email : seule la liste des sites est lue
+        self.assertEqual(len(statements), 1, statements)
+
+        self.assertEqual(self.client.get(f'/api/sites/{self.site_id}', headers=headers).status_code, 200)
+        self.assertEqual(self.client.get(f'/api/sites/{self.site_id + 1}', headers=headers).status_code, 404)
+        self.assertEqual(self.client.get('/api/sites', headers={'Authorization': 'Bearer abc'}).status_code, 401)
+
+    def test_passwords_hashed_and_rehashed_on_login(self):
+        from models import User
+        from passwords import password_hasher, parse_hash
+        password_hasher.configure(n=2 ** 10)
+        try:
+            self.client.post('/api/register', json={'email': 'hash@example.com', 'password': 'secret'})
+            with self.app.app_context():
+                stored = User.query.filter_by(email='hash@example.com').one().password_hash
+            self.assertEqual(parse_hash(stored)[0], 2 ** 10)
+
+            password_hasher.configure(n=2 ** 11)
+            self.assertEqual(self.client.post('/api/login', json={'email': 'hash@example.com', 'password': 'bad'}).status_code, 401)
+            self.assertEqual(self.client.post('/api/login', json={'email': 'hash@example.com', 'password': 'secret'}).status_code, 200)
+            with self.app.app_context():
+                stored = User.query.filter_by(email='hash@example.com').one().password_hash
+            self.assertEqual(parse_hash(stored)[0], 2 ** 11)
+        finally:
+            password_hasher.configure(n=self.app.config['PASSWORD_SCRYPT_N'])
+
+    def test_auth_rejects_non_string_credentials(self):
+        from models import User
+        for body in ({'email': 'typed@example.com', 'password': 123},
+                     {'email': ['typed@example.com'], 'password': 'secret'}):
+            for route in ('/api/register', '/api/login'):
+                response = self.client.post(route, json=body)
+                self.assertEqual(response.status_code, 400, (route, body))
+                self.assertIn('error', response.get_json())
+        with self.app.app_context():
+            self.assertEqual(User.query.filter_by(email='typed@example.com').count(), 0)
+
+    def test_retention_keeps_hourly_rollups(self):
+        from retention import apply_retention
+        from rollups import rebuild_rollups, query_series
+        from models import SensorReading
+        old = datetime(2024, 1, 1, 10)
+        batch = [{'site_id': self.site_id, 'section_name': 'Q0', 'reading_type': 'ph', 'value': 7.0 + i % 2,
+                  'timestamp': (old + timedelta(minutes=i)).isoformat()} for i in range(120)]
+        self.assertEqual(self.client.post('/api/readings/batch', json=batch).get_json()['accepted'], 120)
+
+        with self.app.app_context():
+            policies = {'ph': {'raw': 30, 'minute': 30, 'hour': None, 'day': None}}
+            report = apply_retention(policies, now=old + timedelta(days=60))
+            self.assertEqual(report['raw_deleted'], 120)
+            self.assertEqual(report['rollups_deleted'], 120)
+            self.assertEqual(SensorReading.query.count(), 0)
+            # La reconstruction ne touche pas aux buckets purgés
+            rebuild_rollups()
+            resolution, _, points = query_series(1, 'ph', old, old + timedelta(hours=2), 3600)
+            self.assertEqual(resolution, 'hour')
+            self.assertEqual([(p['count'], p['value']) for p in points], [(60, 7.5), (60, 7.5)])
+
+    def test_series_unaligned_window_after_retention(self):
+        from retention import apply_retention
+        from rollups import query_series
+        start = datetime(2024, 1, 1)
+        batch = [{'site_id': self.site_id, 'section_name': 'Q0', 'reading_type': 'ph', 'value': 7.0,
+                  'timestamp': (start + timedelta(hours=i)).isoformat()} for i in range(70 * 24)]
+        self.assertEqual(self.client.post('/api/readings/batch', json=batch).get_json()['accepted'], 70 * 24)
+
+        with self.app.app_context():
+            policies = {'ph': {'raw': 30, 'minute': 30, 'hour': None, 'day': None}}
+            apply_retention(policies, now=start + timedelta(days=70))
+            # Fenêtre de 20 jours non alignée, antérieure à la rétention des agrégats minute
+            window = (start + timedelta(days=5, hours=7, minutes=30), start + timedelta(days=25, hours=7, minutes=30))
+            resolution, step, points = query_series(1, 'ph', *window)
+            self.assertEqual((resolution, step, len(points)), ('hour', 3600, 20 * 24 + 1))
+            self.assertEqual(points[0]['date'], '2024-01-06T07:00:00')
+            self.assertEqual(sum(p['count'] for p in points), 20 * 24 + 1)
+            resolution, _, points = query_series(1, 'ph', *window, step=86400)
+            self.assertEqual((resolution, len(points), points[0]['count']), ('day', 21, 24))
+
+    def test_series_resolution_follows_range(self):
+        start = datetime(2024, 5, 1)
+        batch = [{'site_id': self.site_id, 'section_name': 'Q0', 'reading_type': 'ph', 'value': 6.0 + (i % 6) / 10,
+                  'timestamp': (start + timedelta(minutes=10 * i)).isoformat()} for i in range(3 * 144)]
+        self.assertEqual(self.client.post('/api/readings/batch', json=batch).get_json()['accepted'], 432)
+
+        def series(start, end, resolution=None):
+            url = (f'/api/sites/{self.site_id}/sections/Q0/readings?type=ph'
+                   f'&from={start.isoformat()}&to={end.isoformat()}')
+            return self.count_queries(url + (f'&resolution={resolution}' if resolution else ''))
+
+        # Rollup le plus grossier aligné sur le pas et les bornes
+        for resolution, rollup, points, count, high in (('1d', 'day', 2, 144, 6.5), ('1h', 'hour', 48, 6, 6.5),
+                                                        ('6h', 'hour', 8, 36, 6.5), ('30m', 'minute', 96, 3, 6.2)):
+            response, statements = series(start, start + timedelta(days=2), resolution)
+            data = response.get_json()
+            self.assertEqual((data['rollup'], len(data['points'])), (rollup, points), resolution)
+            self.assertEqual({p['count'] for p in data['points']}, {count})
+            self.assertEqual((data['points'][0]['min'], data['points'][0]['max']), (6.0, high))
+            # Recherche de la section + une requête sur le rollup choisi
+            self.assertEqual(len(statements), 2, statements)
+
+        # Bornes non alignées sur le jour : fenêtre élargie aux jours entiers
+        data = series(start + timedelta(hours=6), start + timedelta(days=2, hours=6), '1d')[0].get_json()
+        self.assertEqual((data['rollup'], [p['count'] for p in data['points']]), ('day', [144, 144, 144]))
+        self.assertEqual(data['points'][0]['date'], '2024-05-01T00:00:00')
+        # Sans résolution : le pas vise au plus 500 points
+        data = series(start, start + timedelta(days=3))[0].get_json()
+        self.assertEqual((data['resolution'], data['rollup'], len(data['points'])), (900, 'minute', 288))
+
+        self.assertEqual(series(start, start + timedelta(days=1), '90')[0].status_code, 400)
+        self.assertEqual(series(start, start + timedelta(days=30), '1m')[0].status_code, 400)
+
+    def test_month_partitions_routed_and_dropped(self):
+        from sqlalchemy import event
+        from retention import apply_retention
+        from partitions import partition_keys, reading_table
+        from rollups import query_series
+        from sensor_queries import latest_readings
+        self.app.config['READING_PARTITIONS'] = 'month'
+        start = datetime(2024, 1, 20)
+        batch = [{'site_id': self.site_id, 'section_name': 'Q0', 'reading_type': reading_type, 'value': 7.0,
+                  'timestamp': (start + timedelta(hours=12 * i)).isoformat()}
+                 for i in range(100) for reading_type in ('ph', 'oxygen')]
+        self.assertEqual(self.client.post('/api/readings/batch', json=batch).get_json()['accepted'], 200)
+
+        with self.app.app_context():
+            self.assertEqual(partition_keys(), ['202401', '202402', '202403'])
+            self.assertEqual(latest_readings(1)['ph'][1], start + timedelta(hours=12 * 99))
+            # Recherche seule : aucune partition créée pour un mois sans lecture
+            self.assertIsNone(reading_table(datetime(2024, 6, 1)))
+            self.assertEqual(reading_table(start).name, 'sensor_reading_202401')
+            self.assertEqual(partition_keys(), ['202401', '202402', '202403'])
+
+            # Types trouvés dans la partition la plus récente : les plus anciennes ne sont pas lues
+            statements = []
+            listener = lambda conn, cursor, statement, *args: statements.append(statement)
+            event.listen(self.engine, 'before_cursor_execute', listener)
+            try:
+                self.assertEqual(set(latest_readings(1, ['ph', 'oxygen'])), {'ph', 'oxygen'})
+            finally:
+                event.remove(self.engine, 'before_cursor_execute', listener)
+            reads = [s for s in statements if 'sqlite_master' not in s]
+            self.assertEqual(len(reads), 1, statements)
+            self.assertIn('sensor_reading_202403', reads[0])
+            self.assertNotIn('sensor_reading_202401', reads[0])
+            export = self.client.get(f'/api/sites/{self.site_id}/export?format=ndjson').get_data(as_text=True)
+            self.assertEqual(len(export.splitlines()), 200)
+
+            policies = {t: {'raw': 30, 'minute': None, 'hour': None, 'day': None}
+                        for t in ('temperature', 'ph', 'oxygen')}
+            report = apply_retention(policies, now=datetime(2024, 4, 15))
+            # Janvier et février supprimés en bloc, mars (jusqu'au 9) ligne à ligne
+            self.assertEqual(report['partitions_dropped'], ['202401', '202402'])
+            self.assertEqual(report['raw_deleted'], 2 * 18)
+            self.assertEqual(partition_keys(), ['202403'])
+            _, _, points = query_series(1, 'ph', datetime(2024, 1, 20), datetime(2024, 1, 21), 86400)
+            self.assertEqual(points[0]['count'], 2)
+
+    def test_export_filters_and_gzip(self):
+        import gzip
+        start = datetime(2024, 5, 1)
+        batch = [{'site_id': self.site_id, 'section_name': section, 'reading_type': reading_type, 'value': 5.0 + i / 10,
+                  'timestamp': (start + timedelta(hours=i)).isoformat()}
+                 for section in ('Q0', 'Q1') for reading_type in ('ph', 'oxygen') for i in range(48)]
+        self.assertEqual(self.client.post('/api/readings/batch', json=batch).get_json()['accepted'], 192)
+        url = f'/api/sites/{self.site_id}/export'
+
+        plain = self.client.get(url)
+        lines = plain.get_data(as_text=True).splitlines()
+        self.assertEqual((plain.mimetype, lines[0], len(lines)), ('text/csv', 'section_name,reading_type,value,timestamp', 193))
+        self.assertEqual(plain.headers['Vary'], 'Accept-Encoding')
+        self.assertNotIn('Content-Encoding', plain.headers)
+
+        # Section, type et fenêtre [from, to)
+        response = self.client.get(f'{url}?format=ndjson&section=Q1&type=oxygen'
+                                   f'&from={(start + timedelta(hours=10)).isoformat()}'
+                                   f'&to={(start + timedelta(hours=20)).isoformat()}')
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(len(rows), 10)
+        self.assertEqual({(r['section_name'], r['reading_type']) for r in rows}, {('Q1', 'oxygen')})
+        self.assertEqual((rows[0]['timestamp'], rows[0]['value']), ('2024-05-01T10:00:00', 6.0))
+
+        # gzip demandé par paramètre ou par Accept-Encoding : même contenu
+        for query, headers in (('?gzip=1', None), ('', {'Accept-Encoding': 'gzip, deflate'})):
+            compressed = self.client.get(url + query, headers=headers)
+            self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(gzip.decompress(compressed.get_data()), plain.get_data())
+
+        for query in ('?format=xml', '?type=salinity', '?from=hier'):
+            self.assertEqual(self.client.get(url + query).status_code, 400, query)
+
+    def test_section_stats_single_series_query(self):
+        start = datetime(2024, 5, 1)
+        values = [24.0 + (i % 2) * 0.2 + i * 0.01 for i in range(300)]
+        values[250] = 30.0
+        batch = [{'site_id': self.site_id, 'section_name': 'Q0', 'reading_type': 'temperature', 'value': value,
+                  'timestamp': (start + timedelta(minutes=i)).isoformat()} for i, value in enumerate(values)]
+        self.assertEqual(self.client.post('/api/readings/batch', json=batch).get_json()['accepted'], 300)
+
+        response, statements = self.count_queries(
+            f'/api/sites/{self.site_id}/sections/Q0/stats?type=temperature&window=30'
+            f'&from={start.isoformat()}&to={(start + timedelta(days=1)).isoformat()}')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['count'], 300)
+        self.assertEqual(data['max'], 30.0)
+        # +0.01 par minute, soit ~14.4 par jour
+        self.assertAlmostEqual(data['trend_per_day'], 14.4, delta=0.5)
+        self.assertEqual(data['anomalies'][0]['timestamp'], (start + timedelta(minutes=250)).isoformat())
+        # Recherche de la section + une seule requête pour la série
+        self.assertEqual(len(statements), 2, statements)
+
+    def test_site_detail_cached_with_etag(self):
+        url = f'/api/sites/{self.site_id}'
+        first = self.client.get(url)
+        etag = first.headers['ETag']
+        self.assertIn('Last-Modified', first.headers)
+
+        # Deuxième lecture servie depuis le cache, sans requête SQL
+        response, statements = self.count_queries(url)
+        self.assertEqual(response.get_data(), first.get_data())
+        self.assertEqual(statements, [])
+
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+
+        # Une lecture change la version du site
+        self.client.post(f'/api/sites/{self.site_id}/sections/Q0/readings', json={'reading_type': 'ph', 'value': 7.2})
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        q0 = next(s for s in response.get_json()['sections'] if s['section_name'] == 'Q0')
+        self.assertEqual(q0['values']['ph'], 7.2)
+
+        stats = self.client.get('/api/sites/cache').get_json()
+        self.assertEqual((stats['hits'], stats['not_modified']), (2, 1))
+        self.assertEqual(stats['bytes_saved'], len(first.get_data()))
+
+    def test_alert_rules_evaluated_on_ingest(self):
+        rules = [
+            {'section_name': 'Q0', 'reading_type': 'temperature', 'kind': 'above', 'threshold': 30, 'duration_s': 120},
+            {'reading_type': 'temperature', 'kind': 'rate', 'threshold': 2},
+        ]
+        above, rate = [self.client.post(f'/api/sites/{self.site_id}/alert-rules', json=rule).get_json()['id']
+                       for rule in rules]
+
+        start = datetime(2024, 6, 1, 12)
+        values = [28, 31, 31.5, 32, 31, 29, 29]  # une lecture par minute
+        batch = [{'site_id': self.site_id, 'section_name': 'Q0', 'reading_type': 'temperature', 'value': value,
+                  'timestamp': (start + timedelta(minutes=i)).isoformat()} for i, value in enumerate(values)]
+        self.client.post('/api/readings/batch', json=batch)
+
+        alerts = self.client.get(f'/api/sites/{self.site_id}/alerts').get_json()
+        # Sauts de 3 puis 2 unités en une minute ; 120s au-dessus de 30 (de 12:01 à 12:03), résolue à 12:05
+        self.assertEqual(sorted((a['rule_id'], a['triggered_at'], a['resolved_at']) for a in alerts), [
+            (above, '2024-06-01T12:03:00', '2024-06-01T12:05:00'),
+            (rate, '2024-06-01T12:01:00', '2024-06-01T12:02:00'),
+            (rate, '2024-06-01T12:05:00', '2024-06-01T12:06:00'),
+        ])
+
+        # Saut à 34 : alerte de variation ouverte, la règle 'above' attend encore ses 120s
+        self.client.post('/api/readings/batch', json=[{'site_id': self.site_id, 'section_name': 'Q0',
+                          'reading_type': 'temperature', 'value': 34.0,
+                          'timestamp': (start + timedelta(minutes=7)).isoformat()}])
+        active = self.client.get(f'/api/sites/{self.site_id}/alerts?active=true').get_json()
+        self.assertEqual([(a['rule_id'], a['value']) for a in active], [(rate, 34.0)])
+
+    def test_toggle_persisted_and_commands_delivered(self):
+        toggle = f'/api/sites/{self.site_id}/sections/Q0/toggle'
+        commands = f'/api/sites/{self.site_id}/commands'
+        stopped = self.client.post(toggle, json={'action': 'stop'}, headers={'Idempotency-Key': 'k1'}).get_json()
+        self.assertEqual((stopped['is_active'], stopped['status']), (False, 'Arrêtée'))
+
+        # Même clé rejouée : même commande, état inchangé
+        replay = self.client.post(toggle, json={'action': 'stop'}, headers={'Idempotency-Key': 'k1'}).get_json()
+        self.assertEqual(replay['command']['id'], stopped['command']['id'])
+        q0 = next(s for s in self.client.get(f'/api/sites/{self.site_id}').get_json()['sections']
+                  if s['section_name'] == 'Q0')
+        self.assertEqual((q0['is_active'], q0['status']), (False, 'Arrêtée'))
+
+        # Nouvelle bascule avant livraison : seule la dernière commande est envoyée
+        started = self.client.post(toggle, json={'action': 'toggle'}).get_json()
+        self.assertTrue(started['is_active'])
+        delivered = self.client.get(f'{commands}?wait=0').get_json()['commands']
+        self.assertEqual([(c['id'], c['command'], c['attempts']) for c in delivered],
+                         [(started['command']['id'], 'start', 1)])
+        self.assertEqual(self.client.get(f'{commands}?wait=0').get_json()['commands'], [])
+
+        # Sans acquittement la commande est renvoyée, puis plus après l'acquittement
+        self.app.config['DEVICE_COMMAND_REDELIVER_S'] = 0
+        again = self.client.get(f'{commands}?wait=0').get_json()['commands']
+        self.assertEqual([c['attempts'] for c in again], [2])
+        ack = self.client.post(f'{commands}/ack', json={'ids': [again[0]['id']]}).get_json()
+        self.assertEqual(ack['acked'], 1)
+        self.assertEqual(self.client.get(f'{commands}?wait=0').get_json()['commands'], [])
+
+    def test_toggle_idempotency_key_bound_to_section_and_action(self):
+        toggle = f'/api/sites/{self.site_id}/sections/%s/toggle'
+        key = {'Idempotency-Key': 'k2'}
+        stopped = self.client.post(toggle % 'Q0', json={'action': 'stop'}, headers=key).get_json()
+
+        # Même clé, autre section ou autre action : refusée, rien n'est appliqué
+        self.assertEqual(self.client.post(toggle % 'Q1', json={'action': 'start'}, headers=key).status_code, 422)
+        self.assertEqual(self.client.post(toggle % 'Q0', json={'action': 'toggle'}, headers=key).status_code, 422)
+        sections = {s['section_name']: s for s in self.client.get(f'/api/sites/{self.site_id}').get_json()['sections']}
+        self.assertEqual((sections['Q0']['is_active'], sections['Q1']['is_active']), (False, True))
+
+        # Rejeu de la même requête : réponse construite depuis la commande enregistrée
+        replay = self.client.post(toggle % 'Q0', json={'action': 'stop'}, headers=key).get_json()
+        self.assertEqual((replay['section_name'], replay['is_active'], replay['command']['id']),
+                         ('Q0', False, stopped['command']['id']))
+
+    def test_ingest_buffer_full_then_drained_on_stop(self):
+        import threading
+        from unittest import mock
+        from ingest_buffer import ingest_buffer
+        from models import SensorReading
+        entered, release = threading.Event(), threading.Event()
+        flush = ingest_buffer._flush
+
+        def blocked_flush(batch):
+            entered.set()
+            release.wait(10)
+            flush(batch)
+
+        def post(i):
+            return self.client.post('/api/readings', json={
+                'site_id': self.site_id, 'section_name': f'Q{i}', 'reading_type': 'ph', 'value': 7.0}).status_code
+
+        with mock.patch.object(ingest_buffer, '_flush', blocked_flush):
+            ingest_buffer.start(self.app, max_rows=3, flush_rows=1, flush_interval_ms=50)
+            try:
+                # La première lecture occupe le worker, les trois suivantes remplissent la file
+                self.assertEqual(post(0), 202)
+                self.assertTrue(entered.wait(5))
+                self.assertEqual([post(i) for i in range(1, 5)], [202, 202, 202, 429])
+                self.assertEqual(ingest_buffer.stats()['queue_depth'], 3)
+            finally:
+                release.set()
+                ingest_buffer.stop()
+        stats = ingest_buffer.stats()
+        self.assertEqual((stats['running'], stats['queue_depth'], stats['flushed_rows'], stats['rejected']),
+                         (False, 0, 4, 1))
+        with self.app.app_context():
+            self.assertEqual(SensorReading.query.count(), 4)
+
+    def test_held_threads_limited_by_pool(self):
+        from app import create_app
+        from device_commands import command_waiters
+        from live_stream import live_hub
+        # Long-polls et flux /live : moitié et quart des threads du worker, sauf valeur explicite
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'SERVER_THREADS': 8})
+        self.assertEqual((app.config['DEVICE_MAX_WAITERS'], command_waiters.max_waiters), (4, 4))
+        self.assertEqual((app.config['LIVE_MAX_SUBSCRIBERS'], live_hub.max_subscribers), (2, 2))
+        create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'SERVER_THREADS': 8, 'DEVICE_MAX_WAITERS': 6})
+        self.assertEqual(command_waiters.max_waiters, 6)
+
+    def test_metrics_per_route_and_ingest(self):
+        for _ in range(3):
+            self.client.get('/api/sections/threshold?type=ph&below=7')
+        self.client.post('/api/readings/batch', json=[
+            {'site_id': self.site_id, 'section_name': f'Q{i}', 'reading_type': 'ph', 'value': 7.0} for i in range(5)])
+
+        body = self.client.get('/metrics').get_data(as_text=True)
+        labels = 'method="GET",route="/api/sections/threshold"'
+        self.assertIn(f'backapp_request_duration_seconds_count{{{labels}}} 3', body)
+        self.assertIn(f'backapp_requests_total{{{labels},status="2xx"}} 3', body)
+        # Une requête SQL par appel, attribuée à la route
+        self.assertIn(f'backapp_request_sql_queries_bucket{{{labels},le="1"}} 3', body)
+        self.assertIn(f'backapp_request_sql_queries_sum{{{labels}}} 3', body)
+        self.assertIn('backapp_ingested_rows_total{source="readings"} 5', body)
+        self.assertIn('backapp_latest_cache_sections', body)
+
+        # Total du processus : requêtes HTTP terminées et instructions hors requête
+        from sqlalchemy import text
+        from models import db
+        total = lambda body: int(next(line.split()[1] for line in body.splitlines()
+                                      if line.startswith('backapp_sql_queries_total ')))
+        before = total(body)
+        with self.app.app_context():
+            db.session.execute(text('SELECT 1'))
+        self.client.get('/api/sections/threshold?type=ph&below=7')
+        self.assertEqual(total(self.client.get('/metrics').get_data(as_text=True)), before + 2)
+
+    def test_synthetic_data_and_suite_coverage(self):
+        from models import db, SiteSection, SensorReading
+        from rollups import SensorRollup
+        from seed_data import generate_data
+        from bench_suite import uncovered_routes
+        with self.app.app_context():
+            report = generate_data(users=1, sites_per_user=2, sections_per_site=2, days=1, interval_s=3600)
+            self.assertEqual((report['sections'], report['readings']), (4, 4 * 3 * 24))
+            self.assertEqual(SensorReading.query.count(), 288)
+            generated = SiteSection.query.filter(SiteSection.section_name == 'A1', SiteSection.site_id != self.site_id).one()
+            self.assertIsNotNone(generated.ph_value)
+            self.assertTrue(SensorRollup.query.filter_by(section_id=generated.id, resolution='hour').count())
+        # Chaque route de l'API a un scénario dans la suite de benchmarks
+        self.assertEqual(uncovered_routes(self.app), [])
+
+    def test_readings_forwarded_to_writer_process(self):
+        import os
+        import tempfile
+        import threading
+        from unittest import mock
+        from ingest_writer import IngestWriter, ingest_writer, WriteFailed
+        from models import db, SensorReading
+        with tempfile.TemporaryDirectory() as tmp:
+            writer = IngestWriter(self.app, os.path.join(tmp, 'ingest.sock'), b'key')
+            threading.Thread(target=writer.serve_forever, daemon=True).start()
+            for _ in range(50):
+                if os.path.exists(writer.address):
+                    break
+                time.sleep(0.01)
+            ingest_writer.configure(address=writer.address, authkey=b'key')
+            try:
+                batch = self.client.post('/api/readings/batch', json=[
+                    {'site_id': self.site_id, 'section_name': f'Q{i}', 'reading_type': 'ph', 'value': 7.1}
+                    for i in range(4)]).get_json()
+                single = self.client.post('/api/readings', json={
+                    'site_id': self.site_id, 'section_name': 'Q9', 'reading_type': 'oxygen', 'value': 6.5})
+                # Import d'historique : un bloc par transaction du processus d'écriture
+                self.app.config['HISTORY_CHUNK_ROWS'] = 2
+                history = self.client.post('/api/history', json={
+                    'site_id': self.site_id, 'section_name': 'Q8', 'reading_type': 'ph',
+                    'values': [{'value': 7.0, 'timestamp': f'2024-01-0{day}T00:00:00'} for day in (1, 2, 3)]}).get_json()
+                stats = self.client.get('/api/readings/writer').get_json()
+                # Échec du commit dans le processus d'écriture : erreur journalisée, pas renvoyée
+                with mock.patch.object(ingest_writer, 'write', side_effect=WriteFailed('database is locked')):
+                    failed = self.client.post('/api/readings', json={
+                        'site_id': self.site_id, 'section_name': 'Q9', 'reading_type': 'oxygen', 'value': 6.0})
+            finally:
+                ingest_writer.configure()
+                writer.close()
+        self.assertEqual(batch['accepted'], 4)
+        self.assertEqual(single.status_code, 200)
+        self.assertIsInstance(single.get_json()['id'], int)
+        self.assertEqual((history['inserted'], history['rejected']), (3, 0))
+        self.assertEqual((failed.status_code, failed.get_json()), (500, {'error': "Échec de l'enregistrement des lectures"}))
+        self.assertEqual((stats['client']['requests'], stats['writer']['rows'], stats['writer']['inserted']), (4, 8, 8))
+        with self.app.app_context():
+            self.assertEqual(SensorReading.query.count(), 8)
+        # Cache des dernières lectures du worker mis à jour après l'acquittement
+        self.assertEqual(self.client.get(f'/api/readings/latest?site_id={self.site_id}&section_name=Q9').get_json()['oxygen'], 6.5)
+
+    def test_sites_and_sections_keyset_pagination(self):
+        from models import db, Site, SiteSection
+        from sqlalchemy import text
+        with self.app.app_context():
+            user_id = db.session.get(Site, self.site_id).user_id
+            other = Site(name='Site R', status='En maintenance', user_id=user_id)
+            db.session.add(other)
+            db.session.flush()
+            db.session.add(SiteSection(site_id=other.id, section_name='R0', status='En marche', is_active=False))
+            db.session.commit()
+            indexes = {row[0] for row in db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+        self.assertTrue({'ix_site_user_id', 'ix_site_section_site_id'} <= indexes)
+
+        email = 'queries@example.com'
+        pages, cursor = [], None
+        while True:
+            url = f'/api/sections?email={email}&limit=8&fields=id,section_name' + (f'&cursor={cursor}' if cursor else '')
+            response, statements = self.count_queries(url)
+            self.assertEqual(len(statements), 2)  # utilisateur (email) + une page
+            page = response.get_json()
+            pages.append([s['section_name'] for s in page['sections']])
+            self.assertEqual(set(page['sections'][0]), {'id', 'section_name'})
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual([len(p) for p in pages], [8, 8, 5])
+        self.assertEqual(sum(pages, []), [f'Q{i}' for i in range(20)] + ['R0'])
+
+        inactive = self.client.get(f'/api/sections?email={email}&is_active=false').get_json()
+        self.assertEqual([s['section_name'] for s in inactive['sections']], ['R0'])
+        sites = self.client.get(f'/api/sites?email={email}&status=En maintenance&fields=name').get_json()
+        self.assertEqual(sites, {'sites': [{'name': 'Site R'}], 'next_cursor': None})
+        # Sans paramètre de pagination : l'ancien tableau complet
+        self.assertEqual(len(self.client.get(f'/api/sites?email={email}').get_json()), 2)
+        for url in (f'/api/sections?email={email}&cursor=abc', f'/api/sections?email={email}&fields=secret',
+                    f'/api/sites?email={email}&limit=0'):
+            self.assertEqual(self.client.get(url).status_code, 400)
+
+    def test_section_values_only_move_forward(self):
+        url = f'/api/sites/{self.site_id}/sections/Q0/readings'
+        self.assertEqual(self.client.post(url, json={'reading_type': 'ph', 'value': 7.0}).status_code, 201)
+        # Lecture plus ancienne arrivée ensuite : stockée, sans remplacer la valeur actuelle
+        batch = self.client.post('/api/readings/batch', json=[{'site_id': self.site_id, 'section_name': 'Q0',
+                                 'reading_type': 'ph', 'value': 5.0, 'timestamp': '2020-01-01T00:00:00'}])
+        self.assertEqual(batch.get_json()['accepted'], 1)
+
+        detail = self.client.get(f'/api/sites/{self.site_id}').get_json()
+        self.assertEqual(detail['sections'][0]['values']['ph'], 7.0)
+        below = self.client.get('/api/sections/threshold?type=ph&below=6').get_json()
+        self.assertEqual(below['count'], 0)
+
+    def test_single_reading_updates_section_values(self):
+        response = self.client.post('/api/readings', json={
+            'site_id': self.site_id, 'section_name': 'Q0', 'reading_type': 'oxygen', 'value': 3.0})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.get_json()['id'], int)
+        detail = self.client.get(f'/api/sites/{self.site_id}').get_json()
+        self.assertEqual(detail['sections'][0]['values']['oxygen'], 3.0)
+        below = self.client.get('/api/sections/threshold?type=oxygen&below=4').get_json()
+        self.assertEqual([s['section_name'] for s in below['sections']], ['Q0'])
+
+        for reading_type, value in (('foo', -999), ('ph', 15), ('oxygen', 'abc')):
+            response = self.client.post('/api/readings', json={
+                'site_id': self.site_id, 'section_name': 'Q0', 'reading_type': reading_type, 'value': value})
+            self.assertEqual(response.status_code, 400)
+        latest = self.client.get(f'/api/readings/latest?site_id={self.site_id}&section_name=Q0').get_json()
+        self.assertEqual(latest, {'oxygen': 3.0})
+
+    def test_init_db_idempotent_and_create_app_read_only(self):
+        import os
+        import tempfile
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        from app import create_app
+        from init_db import init_database
+        from models import db, Site
+        with tempfile.TemporaryDirectory() as tmp:
+            config = {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'startup.db')}"}
+            with create_app(config).app_context():
+                self.assertTrue(init_database())
+                sites = [site.id for site in Site.query.order_by(Site.id)]
+                # Deuxième lancement : ni migration ni sites de démonstration recréés
+                self.assertEqual(init_database(), [])
+                self.assertEqual([site.id for site in Site.query.order_by(Site.id)], sites)
+                db.engine.dispose()
+
+            statements = []
+            record = lambda conn, cursor, statement, *args: statements.append(statement.split()[0].upper())
+            event.listen(Engine, 'before_cursor_execute', record)
+            try:
+                app = create_app(config)
+            finally:
+                event.remove(Engine, 'before_cursor_execute', record)
+            self.assertFalse({'INSERT', 'UPDATE', 'DELETE', 'CREATE', 'DROP'} & set(statements))
+            with app.app_context():
+                db.engine.dispose()
+
+    def test_cache_warm_up_skipped_before_init_db(self):
+        from app import create_app
+        with self.assertLogs('app', level='WARNING') as logs:
+            create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+        # Une ligne d'avertissement, sans trace d'exception
+        self.assertEqual([(r.levelname, r.exc_info) for r in logs.records], [('WARNING', None)])
+
+    def test_partitions_seen_across_processes(self):
+        import os
+        import tempfile
+        from app import create_app
+        from init_db import init_database
+        from ingestion import make_reading, write_readings
+        from partitions import drop_partition
+        from sensor_queries import latest_readings
+        from models import db, SiteSection
+        with tempfile.TemporaryDirectory() as tmp:
+            config = {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'partitions.db')}",
+                      'READING_PARTITIONS': 'month'}
+            # Deux applications sur le même fichier : deux processus d'une même instance
+            reader, writer = create_app(config), create_app(config)
+            with writer.app_context():
+                init_database(demo=False)
+                db.session.add(SiteSection(site_id=1, section_name='P0', status='En marche', is_active=True))
+                db.session.commit()
+                section = SiteSection.query.filter_by(section_name='P0').one()
+                write_readings([make_reading(section, 'ph', 7.0, datetime(2024, 1, 10))])
+                section_id = section.id
+            with reader.app_context():
+                self.assertEqual(latest_readings(section_id)['ph'][0], 7.0)
+            with writer.app_context():
+                section = db.session.get(SiteSection, section_id)
+                write_readings([make_reading(section, 'ph', 7.5, datetime(2024, 2, 10))])
+                drop_partition('202401')
+            # Partition créée puis partition supprimée par l'autre application
+            with reader.app_context():
+                self.assertEqual(latest_readings(section_id)['ph'], (7.5, datetime(2024, 2, 10)))
+            for app in (reader, writer):
+                with app.app_context():
+                    db.engine.dispose()
+
+    def test_batch_per_item_statuses(self):
+        from models import SensorReading
+        ts = '2024-06-01T09:00:00'
+        item = lambda **kw: {'site_id': self.site_id, 'section_name': 'Q0', 'reading_type': 'ph', 'value': 7.0,
+                             'timestamp': ts, **kw}
+        response = self.client.post('/api/readings/batch', json={'readings': [
+            item(),
+            item(value=7.5),                          # même (section, type, timestamp)
+            item(section_name='Q1', value=7.5),
+            item(section_name='Z9'),
+            item(reading_type='salinity'),
+            item(value=15),
+            item(value='abc'),
+            item(timestamp='hier'),
+            {'site_id': self.site_id, 'section_name': 'Q2'},
+            'ph=7'
+        ]})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual([r['status'] for r in data['results']], [201, 409, 201, 404, 400, 400, 400, 400, 400, 400])
+        self.assertEqual([r['index'] for r in data['results']], list(range(10)))
+        self.assertEqual((data['accepted'], data['rejected']), (2, 8))
+
+        # NDJSON : une ligne illisible est rejetée à sa position
+        body = '\n'.join([json.dumps(item(section_name='Q3')), '{"site_id": ', json.dumps(item(section_name='Q4'))])
+        response = self.client.post('/api/readings/batch', data=body, content_type='application/x-ndjson')
+        self.assertEqual([r['status'] for r in response.get_json()['results']], [201, 400, 201])
+        with self.app.app_context():
+            self.assertEqual(SensorReading.query.count(), 4)
+
+    def test_batch_duplicate_of_stored_reading(self):
+        from live_stream import live_hub
+        from models import SensorReading
+        item = {'site_id': self.site_id, 'section_name': 'Q0', 'reading_type': 'ph', 'value': 7.0,
+                'timestamp': datetime.now().replace(microsecond=0).isoformat()}
+        first = self.client.post('/api/readings/batch', json=[item]).get_json()
+        self.assertEqual((first['accepted'], first['results'][0]['status']), (1, 201))
+
+        subscriber = live_hub.subscribe(self.site_id, 'Q0')
+        try:
+            # Même (section, type, timestamp) avec une autre valeur : rien n'est écrit ni propagé
+            again = self.client.post('/api/readings/batch', json=[dict(item, value=6.0)]).get_json()
+            frames = subscriber.wait(0)
+        finally:
+            live_hub.unsubscribe(subscriber)
+        self.assertEqual((again['accepted'], again['rejected']), (0, 1))
+        self.assertEqual(again['results'][0], {'index': 0, 'status': 409, 'error': 'Lecture en double', 'duplicate': True})
+        self.assertEqual(frames, [])
+        with self.app.app_context():
+            self.assertEqual([r.value for r in SensorReading.query], [7.0])
+        latest = self.client.get(f'/api/readings/latest?site_id={self.site_id}&section_name=Q0').get_json()
+        self.assertEqual(latest, {'ph': 7.0})
+        q0 = next(s for s in self.client.get(f'/api/sites/{self.site_id}').get_json()['sections']
+                  if s['section_name'] == 'Q0')
+        self.assertEqual(q0['values']['ph'], 7.0)
+
+    def test_batch_timestamps_normalised(self):
+        from models import SensorReading
+        aware = '2024-06-01T12:00:00+02:00'
+        response = self.client.post('/api/readings/batch', json=[
+            {'site_id': self.site_id, 'section_name': 'Q0', 'reading_type': 'ph', 'value': 7.0,
+             'timestamp': '2024-06-01T09:00:00'},
+            {'site_id': self.site_id, 'section_name': 'Q0', 'reading_type': 'ph', 'value': 7.2, 'timestamp': aware},
+            {'site_id': self.site_id, 'section_name': ['Q0'], 'reading_type': 'ph', 'value': 7.4},
+            {'site_id': self.site_id, 'section_name': 'Q0', 'reading_type': 'ph', 'value': 7.4, 'timestamp': 1717232400}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in response.get_json()['results']], [201, 201, 400, 400])
+        with self.app.app_context():
+            stored = {r.value: r.timestamp for r in SensorReading.query.filter_by(reading_type='ph')}
+        # Décalage converti en heure locale, pas ignoré
+        self.assertEqual(stored, {7.0: datetime(2024, 6, 1, 9),
+                                  7.2: datetime.fromisoformat(aware).astimezone().replace(tzinfo=None)})
+
+    def test_history_import_chunks(self):
+        from unittest import mock
+        import history_import
+        self.app.config['HISTORY_CHUNK_ROWS'] = 10
+        start = datetime(2024, 3, 1)
+        values = [{'value': 7.0, 'timestamp': (start + timedelta(hours=i)).isoformat()} for i in range(30)]
+        values[2]['value'] = 'x'
+        values[5]['timestamp'] = (start + timedelta(hours=5)).isoformat() + '+00:00'
+
+        def post(values):
+            response = self.client.post('/api/history', json={
+                'site_id': self.site_id, 'section_name': 'Q0', 'reading_type': 'ph', 'values': values})
+            self.assertEqual(response.status_code, 200)
+            report = response.get_json()
+            return report['inserted'], report['skipped'], report['rejected']
+
+        self.assertEqual(post(values), (29, 0, 1))
+        # Premier bloc réimporté : tout est ignoré par l'index unique
+        self.assertEqual(post(values[:11]), (0, 10, 1))
+
+        # Un bloc en échec est rejeté seul, sans détail de l'exception dans la réponse
+        calls = []
+        store_history = history_import.store_history
+
+        def failing_first_chunk(rows):
+            calls.append(len(rows))
+            if len(calls) == 1:
+                raise RuntimeError('disk I/O error on /var/lib/backapp.db')
+            return store_history(rows)
+
+        later = [{'value': 7.0, 'timestamp': (start + timedelta(days=2, hours=i)).isoformat()} for i in range(20)]
+        with mock.patch.object(history_import, 'store_history', failing_first_chunk):
+            response = self.client.post('/api/history', json={
+                'site_id': self.site_id, 'section_name': 'Q0', 'reading_type': 'ph', 'values': later})
+        report = response.get_json()
+        self.assertEqual((report['inserted'], report['skipped'], report['rejected']), (10, 0, 10))
+        self.assertEqual(report['errors'], [{'line': 10, 'error': "Échec de l'enregistrement du bloc"}])
+
+    def test_history_import_moves_current_values_forward(self):
+        from models import SiteSection
+        start = datetime(2024, 3, 1)
+
+        def post(values, **kwargs):
+            return self.client.post('/api/history', json={
+                'site_id': self.site_id, 'section_name': 'Q0', 'reading_type': 'ph', 'values': values}, **kwargs)
+
+        def q0_ph():
+            with self.app.app_context():
+                return SiteSection.query.filter_by(site_id=self.site_id, section_name='Q0').one().ph_value
+
+        values = [{'value': 6.0 + i / 10, 'timestamp': (start + timedelta(hours=i)).isoformat()} for i in range(10)]
+        self.assertEqual(post(values[::-1]).get_json()['inserted'], 10)
+        self.assertEqual(q0_ph(), 6.9)
+        self.assertEqual(self.client.get(f'/api/readings/latest?site_id={self.site_id}&section_name=Q0').get_json(),
+                         {'ph': 6.9})
+
+        # Valeurs plus anciennes, ou déjà enregistrées avec une autre valeur : l'état courant ne recule pas
+        older = [{'value': 8.0, 'timestamp': (start - timedelta(days=1)).isoformat()},
+                 {'value': 8.0, 'timestamp': values[-1]['timestamp']}]
+        self.assertEqual(post(older).get_json()['inserted'], 1)
+        self.assertEqual(q0_ph(), 6.9)
+        self.assertEqual(self.client.get(f'/api/readings/latest?site_id={self.site_id}&section_name=Q0').get_json(),
+                         {'ph': 6.9})
+
+        # Corps JSON plafonné ; le même import en NDJSON est lu en flux
+        self.app.config['HISTORY_JSON_MAX_BYTES'] = 200
+        later = [{'value': 7.0, 'timestamp': (start + timedelta(days=1, hours=i)).isoformat()} for i in range(10)]
+        response = post(later)
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('NDJSON', response.get_json()['error'])
+        ndjson = '\n'.join(json.dumps(item) for item in later)
+        response = self.client.post(f'/api/history?site_id={self.site_id}&section_name=Q0&reading_type=ph',
+                                    data=ndjson, content_type='application/x-ndjson')
+        self.assertEqual(response.get_json()['inserted'], 10)
+        self.assertEqual(q0_ph(), 7.0)
+
 if __name__ == "__main__":
     print(f"Début des tests: {datetime.now()}")
     test_sensors()